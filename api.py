@@ -1,34 +1,77 @@
+import os
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
-from shared.database import engine
-from shared.models import Base
+from modules.jobs.service import job_runner, start_job_heartbeat, stop_job_heartbeat
+from modules.transaction.service import (
+    start_credit_hold_sweeper,
+    stop_credit_hold_sweeper,
+)
+from shared.auth_middleware import start_auth_cache_listener, stop_auth_cache_listener
+from shared.database import dispose_engines
+from shared.executor import shutdown_executors
+from shared.http_client import close_http_sessions, init_http_sessions
+from shared.migrate import pending_migrations, run_migrations
 
 from routers.root import router as root_router
 from routers.storyline import router as storyline_router
 from routers.persona import router as persona_router
 from routers.script import router as script_router
 from routers.voice import router as voice_router
+from routers.render import router as render_router
 from routers.auth import router as auth_router
 from routers.story import router as story_router
 from routers.clerk_webhook import router as clerk_router
 from routers.transactions import router as transaction_router
 from routers.user import router as user_router
+from routers.jobs import router as jobs_router
+from routers.metrics import router as metrics_router
+
+
+# Migrations are a deployment step (`python -m shared.migrate`), this is only
+# meant for local development
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "false").lower() == "true"
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     try:
-        async with engine.begin() as conn:
-            print("Running SQLAlchemy Engine Migrations...")
-            await conn.run_sync(Base.metadata.create_all)
+        if MIGRATE_ON_STARTUP:
+            print("Running schema migrations...")
+            await run_migrations()
+        else:
+            # the models map columns added by the migrations, serving on an older
+            # schema would fail every query touching them
+            pending = await pending_migrations()
+            if pending:
+                raise RuntimeError(
+                    f"pending schema migrations {', '.join(pending)}, "
+                    "run `python -m shared.migrate` first"
+                )
+
+        init_http_sessions()
+        await start_auth_cache_listener()
+        start_credit_hold_sweeper()
+        start_job_heartbeat()
 
         yield
     finally:
-        print("Disposing SqlAlchemy Engine")
-        await engine.dispose()
+        print("Cancelling background jobs")
+        await stop_job_heartbeat()
+        await job_runner.shutdown()
+
+        await stop_credit_hold_sweeper()
+        await stop_auth_cache_listener()
+
+        print("Closing HTTP client sessions")
+        await close_http_sessions()
+
+        print("Disposing SqlAlchemy Engines")
+        await dispose_engines()
+
+        shutdown_executors()
 
 
 api = APIRouter(prefix="/api/v1")
@@ -38,11 +81,14 @@ api.include_router(persona_router)
 api.include_router(storyline_router)
 api.include_router(script_router)
 api.include_router(voice_router)
+api.include_router(render_router)
 api.include_router(auth_router)
 api.include_router(story_router)
 api.include_router(clerk_router)
 api.include_router(transaction_router)
 api.include_router(user_router)
+api.include_router(jobs_router)
+api.include_router(metrics_router)
 
 app = FastAPI(
     lifespan=lifespan,
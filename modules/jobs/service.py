@@ -0,0 +1,447 @@
+import asyncio
+import os
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, or_, select, update
+
+from modules.transaction.dto import CreditReservation
+from modules.transaction.service import release_credits, release_hold
+from shared.database import AsyncSession, AsyncSessionLocal
+from shared.models.story import Story, StoryJob
+
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+JOB_RETENTION_MINUTES = int(os.getenv("JOB_RETENTION_MINUTES", "60"))
+# the state of the running jobs is written out that often, a job whose worker did
+# not write it for JOB_STALE_SECONDS is failed by any other worker
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "120"))
+
+ACTIVE_JOB_STATUSES = ("queued", "running")
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    story_id: str
+    user_id: uuid.UUID
+
+    # queued -> running -> completed | failed
+    status: str = "queued"
+    stage: str = "queued"
+    done: int = 0
+    total: int = 0
+    result: Any = None
+    error: str | None = None
+
+    created_at: datetime = field(default_factory=datetime.now)
+    finished_at: datetime | None = None
+
+    def set_progress(self, done: int, total: int):
+        self.done = done
+        self.total = total
+
+    def as_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "story_id": self.story_id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": {"done": self.done, "total": self.total},
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    def state(self) -> dict:
+        """The columns of the `StoryJob` row which change while the job runs."""
+
+        return {
+            "id": uuid.UUID(hex=self.id),
+            "status": self.status,
+            "stage": self.stage,
+            "done": self.done,
+            "total": self.total,
+            "result": jsonable_encoder(self.result),
+            "error": self.error,
+            "heartbeat_at": datetime.now(),
+            "finished_at": self.finished_at,
+        }
+
+
+def job_dict(row: StoryJob) -> dict:
+    """A stored job, in the shape of `Job.as_dict`."""
+
+    return {
+        "job_id": row.id.hex,
+        "kind": row.kind,
+        "story_id": row.story_id.hex,
+        "status": row.status,
+        "stage": row.stage,
+        "progress": {"done": row.done, "total": row.total},
+        "result": row.result,
+        "error": row.error,
+        "created_at": row.created_at,
+        "finished_at": row.finished_at,
+    }
+
+
+JobFunction = Callable[[Job], Awaitable[Any]]
+
+
+async def save_jobs(*jobs: Job):
+    """
+    Write the state of the jobs to their rows, in a single executemany UPDATE. A row
+    failed by `fail_stale_jobs` is left alone, its story and credits are gone.
+    """
+
+    if not jobs:
+        return
+
+    try:
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(StoryJob).where(StoryJob.finished_at.is_(None)),
+                [job.state() for job in jobs],
+                execution_options={"synchronize_session": None},
+            )
+            await session.commit()
+    except Exception as e:
+        # the next heartbeat writes it again
+        print(f"failed to save the state of {len(jobs)} jobs: {e}")
+
+
+class JobRunner:
+    """
+    In-process background executor for long running generation work.
+
+    At most `concurrency` jobs run at once, the rest wait in "queued" state.
+    Finished jobs are kept around for `retention` so that clients can poll the result
+    from this worker without a query, the `StoryJob` rows are what every worker
+    reads.
+    """
+
+    def __init__(self, concurrency: int, retention: timedelta):
+        self.retention = retention
+
+        self._jobs: dict[str, Job] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def submit(
+        self,
+        job: Job,
+        fn: JobFunction,
+        on_failure: Callable[[Job], Awaitable[None]] | None = None,
+    ) -> Job:
+        """
+        Run `fn` for a job once there is room for it. `on_failure` is awaited when
+        the job fails or is cancelled, whether `fn` started or not.
+        """
+
+        self._prune()
+        self._jobs[job.id] = job
+
+        task = asyncio.create_task(self._run(job, fn, on_failure))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        return job
+
+    async def _run(
+        self,
+        job: Job,
+        fn: JobFunction,
+        on_failure: Callable[[Job], Awaitable[None]] | None,
+    ):
+        try:
+            async with self._semaphore:
+                job.status = "running"
+                job.stage = "running"
+                await save_jobs(job)
+
+                job.result = await fn(job)
+                job.status = "completed"
+                job.stage = "completed"
+        except BaseException as e:
+            job.status = "failed"
+            if isinstance(e, HTTPException):
+                job.error = str(e.detail)
+            elif isinstance(e, asyncio.CancelledError):
+                job.error = "the job was cancelled"
+            else:
+                print(f"job {job.id} ({job.kind}) failed: {e}")
+                job.error = str(e)
+
+            if on_failure:
+                try:
+                    await on_failure(job)
+                except Exception as cleanup_error:
+                    print(f"cleaning up job {job.id} failed: {cleanup_error}")
+
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            job.finished_at = datetime.now()
+            await save_jobs(job)
+
+    def _prune(self):
+        threshold = datetime.now() - self.retention
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < threshold
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def active_jobs(self) -> list[Job]:
+        return [
+            job for job in self._jobs.values() if job.status in ACTIVE_JOB_STATUSES
+        ]
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+
+        if self._tasks:
+            await asyncio.wait(self._tasks)
+
+
+job_runner = JobRunner(
+    concurrency=JOB_CONCURRENCY,
+    retention=timedelta(minutes=JOB_RETENTION_MINUTES),
+)
+
+_heartbeat_task: asyncio.Task | None = None
+
+
+async def _restore_story_status(
+    db: AsyncSession,
+    story_id: uuid.UUID,
+    kind: str,
+    previous_status: str | None,
+):
+    # unless something else moved the story on in the meantime
+    await db.execute(
+        update(Story)
+        .where(
+            and_(
+                Story.id == story_id,
+                Story.status == f"processing:{kind}",
+            )
+        )
+        .values(status=previous_status)
+    )
+
+
+async def submit_story_job(
+    db: AsyncSession,
+    kind: str,
+    story_id: str,
+    user_id: uuid.UUID,
+    fn: JobFunction,
+    reservation: CreditReservation | None = None,
+) -> Job:
+    """
+    Submit a generation job for a story owned by `user_id`.
+
+    The story status is moved to "processing:<kind>" right away, with a conditional
+    UPDATE, so that a story has a single job at a time across all workers. The job
+    function is expected to set the final status on success. On failure or
+    cancellation the previous status is restored.
+
+    The job owns `reservation`: it is released when the job fails, is cancelled
+    (queued or not) or could not be submitted. The job function is still expected
+    to settle it.
+    """
+
+    try:
+        story_uuid = uuid.UUID(hex=story_id)
+        story_query = (
+            select(Story.status)
+            .where(
+                and_(
+                    Story.id == story_uuid,
+                    Story.creator_id == user_id,
+                    Story.deleted_at.is_(None),
+                )
+            )
+            .limit(1)
+        )
+        story_status = (await db.execute(story_query)).first()
+        if story_status is None:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "no story found for id")
+
+        previous_status = story_status.tuple()[0]
+        processing_status = f"processing:{kind}"
+        claim_query = (
+            update(Story)
+            .where(
+                and_(
+                    Story.id == story_uuid,
+                    or_(
+                        Story.status.is_(None),
+                        Story.status.not_like("processing:%"),
+                    ),
+                    # moved on since it was read, the previous status would be wrong
+                    Story.status.is_not_distinct_from(previous_status),
+                )
+            )
+            .values(status=processing_status)
+            .returning(Story.id)
+        )
+        if (await db.execute(claim_query)).scalar_one_or_none() is None:
+            await db.rollback()
+            raise HTTPException(
+                status.HTTP_409_CONFLICT,
+                "story already has a running job",
+            )
+
+        job = Job(id=uuid.uuid4().hex, kind=kind, story_id=story_id, user_id=user_id)
+        db.add(
+            StoryJob(
+                id=uuid.UUID(hex=job.id),
+                story_id=story_uuid,
+                user_id=user_id,
+                kind=kind,
+                status=job.status,
+                stage=job.stage,
+                previous_story_status=previous_status,
+                hold_id=reservation.id if reservation else None,
+                heartbeat_at=datetime.now(),
+            )
+        )
+        await db.commit()
+    except BaseException:
+        if reservation:
+            await release_credits(db, reservation)
+        raise
+
+    async def on_failure(_: Job):
+        async with AsyncSessionLocal() as session:
+            await _restore_story_status(session, story_uuid, kind, previous_status)
+            await session.commit()
+
+            if reservation:
+                # settled already when the job failed after its work was done
+                await release_credits(session, reservation)
+
+    return job_runner.submit(job, fn, on_failure)
+
+
+async def get_story_job(db: AsyncSession, job_id: str) -> dict | None:
+    # the job of this worker is more up to date than its row
+    job = job_runner.get(job_id)
+    if job is not None:
+        return {**job.as_dict(), "user_id": job.user_id}
+
+    try:
+        job_uuid = uuid.UUID(hex=job_id)
+    except ValueError:
+        return None
+
+    row = await db.get(StoryJob, job_uuid)
+    if row is None:
+        return None
+
+    return {**job_dict(row), "user_id": row.user_id}
+
+
+async def list_story_jobs(db: AsyncSession, story_id: uuid.UUID) -> list[dict]:
+    jobs_query = (
+        select(StoryJob)
+        .where(StoryJob.story_id == story_id)
+        .order_by(StoryJob.created_at.desc())
+    )
+    rows = (await db.execute(jobs_query)).scalars().all()
+
+    jobs = []
+    for row in rows:
+        job = job_runner.get(row.id.hex)
+        jobs.append(job.as_dict() if job is not None else job_dict(row))
+
+    return jobs
+
+
+async def fail_stale_jobs(db: AsyncSession) -> int:
+    """
+    Fail the jobs whose worker stopped writing their state (it crashed or was
+    killed), restore the status of their story and release their credits.
+    Safe to run from every worker at once, a job is only failed once.
+    """
+
+    now = datetime.now()
+    stale_query = (
+        update(StoryJob)
+        .where(
+            and_(
+                StoryJob.status.in_(ACTIVE_JOB_STATUSES),
+                StoryJob.heartbeat_at < now - timedelta(seconds=JOB_STALE_SECONDS),
+            )
+        )
+        .values(
+            status="failed",
+            error="the worker running the job stopped",
+            finished_at=now,
+        )
+        .returning(
+            StoryJob.story_id,
+            StoryJob.kind,
+            StoryJob.previous_story_status,
+            StoryJob.hold_id,
+        )
+    )
+    stale_jobs = (await db.execute(stale_query)).all()
+
+    for story_id, kind, previous_status, hold_id in stale_jobs:
+        await _restore_story_status(db, story_id, kind, previous_status)
+        if hold_id is not None:
+            await release_hold(db, hold_id)
+
+    await db.commit()
+
+    return len(stale_jobs)
+
+
+async def _keep_jobs_alive():
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+
+        # progress and stage of the jobs of this worker, and proof that it is alive
+        await save_jobs(*job_runner.active_jobs())
+
+        try:
+            async with AsyncSessionLocal() as session:
+                failed = await fail_stale_jobs(session)
+            if failed:
+                print(f"Failed {failed} jobs of a worker which stopped")
+        except Exception as e:
+            print(f"Failing the stale jobs failed: {e}")
+
+
+def start_job_heartbeat():
+    global _heartbeat_task
+
+    _heartbeat_task = asyncio.create_task(_keep_jobs_alive())
+
+
+async def stop_job_heartbeat():
+    global _heartbeat_task
+
+    if _heartbeat_task is None:
+        return
+
+    _heartbeat_task.cancel()
+    await asyncio.gather(_heartbeat_task, return_exceptions=True)
+    _heartbeat_task = None
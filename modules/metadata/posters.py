@@ -0,0 +1,105 @@
+import asyncio
+import os
+import uuid
+
+import aiofiles
+from sqlalchemy import select
+
+from shared.database import AsyncSessionLocal
+from shared.executor import run_cpu, run_io, write_file
+from shared.images import encode_image_variants
+from shared.models.story import Story
+
+POSTER_PATH = "./public/posters"
+
+# Comma separated list of "<name>:<longest edge>"
+POSTER_VARIANT_SIZES = os.getenv(
+    "POSTER_VARIANT_SIZES",
+    "thumb:256,card:640,full:1024",
+)
+# in order of preference, formats the installed Pillow can not encode are skipped
+POSTER_VARIANT_FORMATS = os.getenv("POSTER_VARIANT_FORMATS", "avif,webp")
+POSTER_VARIANT_QUALITY = int(os.getenv("POSTER_VARIANT_QUALITY", "70"))
+
+# keep a reference on the background tasks, the loop only holds weak ones
+_background_tasks: set[asyncio.Task] = set()
+
+
+def parse_variant_sizes(spec: str) -> dict[str, int]:
+    sizes = {}
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        name, _, max_edge = entry.partition(":")
+        sizes[name] = int(max_edge)
+
+    return sizes
+
+
+async def create_poster_variants(image_src: str) -> dict[str, dict]:
+    """
+    Decode the poster at `image_src` (as stored on the story) once and write the
+    thumbnail, card and full size variants next to it.
+
+    Returns {size_name: {"width", "height", "<format>": "/public/posters/..."}},
+    empty when Pillow (or any of the configured formats) is not available.
+    """
+
+    image_path = image_src if image_src.startswith(".") else f".{image_src}"
+    async with aiofiles.open(image_path, "rb") as fp:
+        data = await fp.read()
+
+    formats = [f.strip() for f in POSTER_VARIANT_FORMATS.split(",") if f.strip()]
+    encoded = await run_cpu(
+        encode_image_variants,
+        data,
+        parse_variant_sizes(POSTER_VARIANT_SIZES),
+        formats,
+        POSTER_VARIANT_QUALITY,
+    )
+
+    base_path = os.path.splitext(image_path)[0]
+    variants = {}
+    for size_name, variant in encoded.items():
+        variants[size_name] = {"width": variant["width"], "height": variant["height"]}
+        for image_format, image_bytes in variant["images"].items():
+            variant_path = f"{base_path}-{size_name}.{image_format}"
+            await run_io(write_file, variant_path, image_bytes)
+            variants[size_name][image_format] = variant_path.lstrip(".")
+
+    return variants
+
+
+async def _store_poster_variants(story_id: uuid.UUID, image_src: str):
+    try:
+        image_variants = await create_poster_variants(image_src)
+        if not image_variants:
+            return
+
+        async with AsyncSessionLocal() as session:
+            story_query = select(Story).where(Story.id == story_id).limit(1)
+            story_doc = (await session.execute(story_query)).scalar_one_or_none()
+            if story_doc is None or story_doc.image_src != image_src:
+                # the poster was replaced in the meantime, these variants are stale
+                return
+
+            story_doc.image_variants = image_variants
+            await session.commit()
+    except Exception as e:
+        print(f"failed to store poster variants for story {story_id}: {e}")
+
+
+def schedule_poster_variants(story_id: uuid.UUID, image_src: str):
+    """
+    Create the poster variants of a story in the background and record them on
+    the story once done.
+    """
+
+    if not image_src or not POSTER_VARIANT_SIZES:
+        return
+
+    task = asyncio.create_task(_store_poster_variants(story_id, image_src))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
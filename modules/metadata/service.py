@@ -1,8 +1,11 @@
 import json
+import os
 from pydantic import BaseModel
 
-from shared.llm.sarvam import sarvam_chat_completion
+from shared.llm.router import metadata_llm
 from shared.llm.gemini import gemini_image_generation
+from shared.executor import run_cpu, run_io, write_file
+from shared.images import sniff_image_extension
 
 
 class StoryMetadata(BaseModel):
@@ -47,10 +50,10 @@ async def generate_metadata_for_storyline(
         prompt = METADATA_PROMPT.replace("{language}", language).replace(
             "{storyline}", storyline
         )
-        genOutput = await sarvam_chat_completion(prompt)
+        genOutput = await metadata_llm.complete(prompt)
 
         genJSON = genOutput.replace("```json", "").replace("```", "").strip()
-        genJSON = json.loads(genJSON)
+        genJSON = await run_cpu(json.loads, genJSON)
 
         return StoryMetadata(
             title=genJSON.get("title", ""),
@@ -69,8 +72,12 @@ async def generate_image_for_story(storyline: str, setting: str, save_file: str)
         if genOutput is None:
             raise Exception("failed to generate image for story")
 
-        with open(save_file, "wb") as fp:
-            fp.write(genOutput)
+        # the model decides the encoding, name the file after the actual one
+        extension = sniff_image_extension(genOutput)
+        if extension:
+            save_file = f"{os.path.splitext(save_file)[0]}.{extension}"
+
+        await run_io(write_file, save_file, genOutput)
 
         return save_file
     except Exception as e:
@@ -1,6 +1,8 @@
 import json
 
-from shared.llm.gemini import gemini_chat_completion
+from shared.executor import run_cpu
+from shared.llm.cache import cached_llm_result
+from shared.llm.router import text_llm
 from shared.utils import format_prompt
 
 persona_prompt = """
@@ -55,7 +57,7 @@ OUTPUT FORMAT (if there are 3 characters) :
 """
 
 
-async def generate_character_person(story_outline: dict) -> dict:
+async def generate_character_person(story_outline: dict, use_cache: bool = True) -> dict:
     prompt = format_prompt(
         persona_prompt,
         {
@@ -63,12 +65,20 @@ async def generate_character_person(story_outline: dict) -> dict:
         },
     )
 
-    resp = await gemini_chat_completion(prompt)
+    async def complete():
+        resp = await text_llm.complete(prompt)
 
-    persona = resp.replace("```json", "").replace("```", "").strip()
-    try:
-        persona = json.loads(persona)
-    except Exception as e:
-        print(e)
+        persona = resp.replace("```json", "").replace("```", "").strip()
+        try:
+            persona = await run_cpu(json.loads, persona)
+        except Exception as e:
+            print(e)
 
-    return persona
+        return persona
+
+    return await cached_llm_result(
+        text_llm.cache_namespace,
+        prompt,
+        complete,
+        use_cache=use_cache,
+    )
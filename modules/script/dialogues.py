@@ -0,0 +1,181 @@
+import uuid
+from typing import Any
+
+from sqlalchemy import and_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from shared.models.story import Script, ScriptDialogue
+
+
+def dialogue_dict(row: ScriptDialogue) -> dict[str, Any]:
+    """A line in the shape the prompts generate and the voice stage reads."""
+
+    dialogue = {"speaker": row.speaker, "text": row.text}
+    if row.voice_config is not None:
+        dialogue["voice_config"] = row.voice_config
+
+    return dialogue
+
+
+def dialogue_rows(
+    script_id: uuid.UUID,
+    dialogues: list,
+    segments: dict[int, dict] | None = None,
+) -> list[ScriptDialogue]:
+    """
+    Rows of the lines of a script, lines which are not objects are left out but
+    keep their position. `segments` are the voiced segments by line index, see
+    `segment_recorder`.
+    """
+
+    segments = segments or {}
+
+    rows = []
+    for line_index, dialogue in enumerate(dialogues):
+        if not isinstance(dialogue, dict):
+            continue
+
+        voice_config = dialogue.get("voice_config")
+        segment = segments.get(line_index, {})
+        rows.append(
+            ScriptDialogue(
+                script_id=script_id,
+                line_index=line_index,
+                speaker=str(dialogue.get("speaker") or ""),
+                text=str(dialogue.get("text") or ""),
+                voice_config=voice_config if isinstance(voice_config, dict) else None,
+                segment_key=segment.get("segment_key"),
+                segment_duration_ms=segment.get("duration_ms"),
+            )
+        )
+
+    return rows
+
+
+def add_script(
+    db: AsyncSession,
+    creator_id: uuid.UUID,
+    story_id: uuid.UUID,
+    dialogues: list,
+    segments: dict[int, dict] | None = None,
+) -> Script:
+    """Add a script along with one row per line, committed by the caller."""
+
+    # the rows need the id before the flush
+    script_doc = Script(
+        id=uuid.uuid4(),
+        creator_id=creator_id,
+        story_id=story_id,
+        dialogues=dialogues,
+    )
+    db.add(script_doc)
+    db.add_all(dialogue_rows(script_doc.id, dialogues, segments))
+
+    return script_doc
+
+
+async def load_script_dialogues(
+    db: AsyncSession,
+    script_doc: Script,
+) -> list[ScriptDialogue]:
+    """
+    The lines of a script in order, older scripts got their rows in migration
+    0004.
+    """
+
+    rows_query = (
+        select(ScriptDialogue)
+        .where(ScriptDialogue.script_id == script_doc.id)
+        .order_by(ScriptDialogue.line_index)
+    )
+    return list((await db.execute(rows_query)).scalars().all())
+
+
+async def get_script_dialogue(
+    db: AsyncSession,
+    script_doc: Script,
+    line_index: int,
+) -> ScriptDialogue | None:
+    row_query = (
+        select(ScriptDialogue)
+        .where(
+            and_(
+                ScriptDialogue.script_id == script_doc.id,
+                ScriptDialogue.line_index == line_index,
+            )
+        )
+        .limit(1)
+    )
+    return (await db.execute(row_query)).scalar_one_or_none()
+
+
+def segment_recorder(
+    line_indices: list[int] | None = None,
+) -> tuple[dict[int, dict], Any]:
+    """
+    Collect the voiced segments of every line, as {line_index: {"segment_key",
+    "duration_ms"}}, through the returned `on_segment` callback of the voice stage.
+    `line_indices` maps the positions in the voiced script to line indices, when
+    they differ.
+    """
+
+    segments: dict[int, dict] = {}
+
+    def on_segment(batch: dict):
+        for position in batch["line_indices"]:
+            line_index = line_indices[position] if line_indices else position
+            segments[line_index] = {
+                "segment_key": batch.get("segment_key"),
+                "duration_ms": batch.get("duration_ms"),
+            }
+
+    return segments, on_segment
+
+
+async def record_voiced_segments(
+    db: AsyncSession,
+    rows: list[ScriptDialogue],
+    segments: dict[int, dict],
+):
+    """
+    Store the segment of every line voiced in another segment than last time, in
+    a single executemany UPDATE. Committed by the caller.
+    """
+
+    changes = []
+    for row in rows:
+        segment = segments.get(row.line_index)
+        if segment is None or (
+            segment["segment_key"] == row.segment_key
+            and segment["duration_ms"] == row.segment_duration_ms
+        ):
+            continue
+
+        changes.append(
+            {
+                "id": row.id,
+                "segment_key": segment["segment_key"],
+                "segment_duration_ms": segment["duration_ms"],
+            }
+        )
+
+    if changes:
+        await db.execute(update(ScriptDialogue), changes)
+
+    return len(changes)
+
+
+def stale_line_indices(
+    rows: list[ScriptDialogue],
+    segment_keys: list[str | None],
+) -> list[int]:
+    """
+    Lines whose voiced segment does not match the one they would be voiced in now
+    (`segment_keys` from `plan_segment_keys`, in the order of `rows`).
+    """
+
+    return [
+        row.line_index
+        for row, segment_key in zip(rows, segment_keys)
+        if row.segment_key is None or row.segment_key != segment_key
+    ]
@@ -1,6 +1,20 @@
+import asyncio
 import json
+import os
+import uuid
 
-from shared.llm.gemini import gemini_chat_completion
+from fastapi import HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from modules.story.service import load_story_context
+from shared.executor import run_cpu
+from shared.json_stream import JSONArrayStreamParser
+from shared.llm.cache import (
+    cached_llm_result,
+    get_cached_llm_result,
+    store_llm_result,
+)
+from shared.llm.router import text_llm
 from shared.utils import format_prompt
 
 script_prompt = """
@@ -59,26 +73,373 @@ OUTPUT FORMAT for script dialogues:
 """
 
 
-async def generate_script(
+# "single" writes the whole script in one completion, "acts" plans the story in
+# acts and writes all of them concurrently
+SCRIPT_MODES = ("single", "acts")
+SCRIPT_MODE = os.getenv("SCRIPT_MODE", "single")
+SCRIPT_ACTS = int(os.getenv("SCRIPT_ACTS", "4"))
+SCRIPT_ACT_MAX_ATTEMPTS = int(os.getenv("SCRIPT_ACT_MAX_ATTEMPTS", "2"))
+
+acts_prompt = """
+Kahani is a multi-agentic platform for creating immersive audio-only stories based on user prompts.
+You are the Script planner. The story outline agent will provide you with the story outline, the script of the story will be written act by act by other agents working at the same time.
+Split the story into {num_acts} consecutive acts which together cover the whole story outline from the beginning to the resolution.
+
+<generation_instructions>
+<1> Every act should have a short title and a summary of what happens in it, detailed enough for a script writer who only reads this act. </1>
+<2> Mention the characters present in every act and how the act should end, so that the next act can pick up from there. </2>
+<3> The whole story should be around 10 minutes long and have 120-130 dialogues, split them between the acts as "dialogue_count" based on the weight of every act. </3>
+<4> Strictly follow the instructions given above.Don't give any other extra text content other than JSON output. </4>
+</generation_instructions>
+
+Story Outline:
+{story_outline}
+
+
+OUTPUT FORMAT for the acts:
+```json
+[
+    {"title": "...", "summary": "...", "characters": ["narrator", "character1"], "ending": "...", "dialogue_count": 30},
+    ...
+]
+```
+"""
+
+act_script_prompt = """
+Kahani is a multi-agentic platform for creating immersive audio-only stories based on user prompts.
+You are one of the Script generators. The story has been split into acts and every act is written by a different script generator at the same time, you are writing act {act_number} of {num_acts}.
+Write the dialogues for your act only, the dialogues should feel natural and not robotic and should flow continuously from the end of the previous act into the beginning of the next one.
+
+<generation_instructions>
+<1> Please strictly follow the story outline, the acts and the persona given in the input. Don't remove or generate any new character and its dialogues. </1>
+<2> Only write the dialogues of act {act_number}, don't repeat what happens in the other acts and don't go beyond the ending of your act. </2>
+<3> Strictly follow the instructions given above.Don't give any other extra text content other than JSON output. </3>
+<4> Based on character persona and and story, give a voice to each character in the script. </4>
+<5> All speaker text should be in {language}. Use the appropriate writing script for {language} when generating speaker text. </5>
+<6> Based on script dialogues and demand for the story, set the voice parameters for each character in the script The parameters are pace and loudness. these parameters might be different for the same character too at different points of time in the script.
+
+"voice_parameters": {
+    "pace" : "[0.5 , 1]",
+    "loudness" : "[-0.3 , 3]"
+}
+
+Default values for pace is 1 and loudness is 1. Use these defaults to adjust your loudness and pitch in the dialogues.
+</6>
+<7> Your act should have around {dialogue_count} dialogues. </7>
+</generation_instructions>
+
+Story Outline:
+{story_outline}
+
+
+Character Person:
+{persona}
+
+
+All Acts:
+{acts}
+
+
+Your Act ({act_number} of {num_acts}):
+{act}
+
+
+OUTPUT FORMAT for script dialogues:
+```json
+[
+    {"speaker": "narrator", "text": "It was a stormy night…" , voice_config : { "pace" : "pace_value" , "loudness" : "loudness_value"}} ,
+    {"speaker": "character1", "text": "Do you hear that?" , voice_config : { "pace" : "pace_value" , "loudness" : "loudness_value"}} ,
+    ...
+]
+```
+"""
+
+
+def build_script_prompt(story_outline: dict, persona: dict, language: str) -> str:
+    return format_prompt(
+        script_prompt,
+        {
+            "story_outline": json.dumps(story_outline, indent=2),
+            "persona": json.dumps(persona, indent=2),
+            "language": language,
+        },
+    )
+
+
+async def stream_script(
+    story_outline: dict,
+    persona: dict,
+    language: str,
+    use_cache: bool = True,
+):
+    """
+    Generate the script and yield every dialogue as soon as the LLM has finished
+    writing it, instead of waiting for the whole JSON array.
+    """
+
+    prompt = build_script_prompt(story_outline, persona, language)
+
+    if use_cache:
+        cached_script = await get_cached_llm_result(
+            text_llm.cache_namespace,
+            prompt,
+        )
+        if isinstance(cached_script, list):
+            for dialogue in cached_script:
+                yield dialogue
+            return
+
+    parser = JSONArrayStreamParser()
+    raw_chunks = []
+    script = []
+
+    async for chunk in text_llm.stream(prompt):
+        raw_chunks.append(chunk)
+        for dialogue in parser.feed(chunk):
+            script.append(dialogue)
+            yield dialogue
+
+    if not parser.started:
+        # not an array at all, keep the previous behaviour of parsing the whole text
+        resp = "".join(raw_chunks)
+        resp = resp.replace("```json", "").replace("```", "").strip()
+        try:
+            parsed = await run_cpu(json.loads, resp)
+        except Exception as e:
+            raise Exception(f"failed to parse the script: {e}")
+
+        if not isinstance(parsed, list):
+            raise Exception("unexpected structure in the script, expected a list")
+
+        for dialogue in parsed:
+            script.append(dialogue)
+            yield dialogue
+        return
+
+    # a truncated or malformed script must fail the step rather than be stored
+    # (and charged) as a short one, it is never cached either
+    if not parser.finished or parser.errors:
+        raise Exception("the script stream was truncated or malformed")
+
+    await store_llm_result(text_llm.cache_namespace, prompt, script)
+
+
+async def _complete_json_list(prompt: str, is_valid) -> list:
+    resp = await text_llm.complete(prompt)
+    resp = resp.replace("```json", "").replace("```", "").strip()
+    try:
+        parsed = await run_cpu(json.loads, resp)
+    except Exception as e:
+        print(e)
+        return []
+
+    if not isinstance(parsed, list) or not all(is_valid(x) for x in parsed):
+        print("unexpected structure in completion, ignoring it")
+        return []
+
+    # empty results are never cached
+    return parsed
+
+
+def _is_act(act) -> bool:
+    return isinstance(act, dict) and bool(act.get("summary"))
+
+
+def _is_dialogue(dialogue) -> bool:
+    return (
+        isinstance(dialogue, dict)
+        and bool(dialogue.get("speaker"))
+        and bool(dialogue.get("text"))
+    )
+
+
+async def plan_script_acts(
+    story_outline: dict,
+    num_acts: int = SCRIPT_ACTS,
+    use_cache: bool = True,
+) -> list[dict]:
+    prompt = format_prompt(
+        acts_prompt,
+        {
+            "story_outline": json.dumps(story_outline, indent=2),
+            "num_acts": str(num_acts),
+        },
+    )
+
+    return await cached_llm_result(
+        text_llm.cache_namespace,
+        prompt,
+        lambda: _complete_json_list(prompt, _is_act),
+        use_cache=use_cache,
+    )
+
+
+async def generate_act_dialogues(
     story_outline: dict,
     persona: dict,
     language: str,
+    acts: list[dict],
+    act_idx: int,
+    use_cache: bool = True,
 ) -> list[dict]:
+    """
+    Write the dialogues of a single act. A malformed completion only costs this act
+    another attempt, instead of regenerating the whole script.
+    """
+
+    act = acts[act_idx]
     prompt = format_prompt(
-        script_prompt,
+        act_script_prompt,
         {
             "story_outline": json.dumps(story_outline, indent=2),
             "persona": json.dumps(persona, indent=2),
+            "acts": json.dumps(acts, indent=2),
+            "act": json.dumps(act, indent=2),
+            "act_number": str(act_idx + 1),
+            "num_acts": str(len(acts)),
+            "dialogue_count": str(act.get("dialogue_count", 30)),
             "language": language,
         },
     )
 
-    resp = await gemini_chat_completion(prompt)
+    for attempt in range(1, SCRIPT_ACT_MAX_ATTEMPTS + 1):
+        dialogues = await cached_llm_result(
+            text_llm.cache_namespace,
+            prompt,
+            lambda: _complete_json_list(prompt, _is_dialogue),
+            # a retry is always fresh
+            use_cache=use_cache and attempt == 1,
+        )
+        if dialogues:
+            return dialogues
+
+        print(f"act {act_idx + 1} came back empty or malformed (attempt {attempt})")
+
+    raise Exception(f"failed to generate the script of act {act_idx + 1}")
+
+
+async def stream_script_by_acts(
+    story_outline: dict,
+    persona: dict,
+    language: str,
+    use_cache: bool = True,
+    num_acts: int = SCRIPT_ACTS,
+):
+    """
+    Plan the story in acts and write the dialogues of every act concurrently with
+    the same persona context, so that a long script takes about as long as its
+    longest act. Dialogues are yielded in script order as soon as their act and
+    every earlier act are done.
+
+    Falls back to `stream_script` when the story could not be split in acts.
+    """
+
+    acts = await plan_script_acts(story_outline, num_acts, use_cache)
+    if len(acts) < 2:
+        print("could not plan the script in acts, writing it in one go")
+        async for dialogue in stream_script(
+            story_outline,
+            persona,
+            language,
+            use_cache=use_cache,
+        ):
+            yield dialogue
+        return
+
+    act_tasks = [
+        asyncio.create_task(
+            generate_act_dialogues(
+                story_outline,
+                persona,
+                language,
+                acts,
+                act_idx,
+                use_cache,
+            )
+        )
+        for act_idx in range(len(acts))
+    ]
 
-    script = resp.replace("```json", "").replace("```", "").strip()
     try:
-        script = json.loads(script)
-    except Exception as e:
-        print(e)
+        # a line is identified by its position in the stitched script, the acts are
+        # yielded as they are (and as they are cached)
+        for task in act_tasks:
+            for dialogue in await task:
+                yield dialogue
+    finally:
+        for task in act_tasks:
+            task.cancel()
+        # wait for the cancelled acts, so that none outlives the stream and their
+        # errors are retrieved
+        await asyncio.gather(*act_tasks, return_exceptions=True)
+
+
+def script_stream_for_mode(
+    story_outline: dict,
+    persona: dict,
+    language: str,
+    mode: str = SCRIPT_MODE,
+    use_cache: bool = True,
+):
+    if mode == "acts":
+        return stream_script_by_acts(
+            story_outline,
+            persona,
+            language,
+            use_cache=use_cache,
+        )
+
+    return stream_script(story_outline, persona, language, use_cache=use_cache)
+
+
+async def generate_script(
+    story_outline: dict,
+    persona: dict,
+    language: str,
+    use_cache: bool = True,
+    mode: str = SCRIPT_MODE,
+) -> list[dict]:
+    return [
+        dialogue
+        async for dialogue in script_stream_for_mode(
+            story_outline,
+            persona,
+            language,
+            mode=mode,
+            use_cache=use_cache,
+        )
+    ]
+
+
+def check_script_mode(mode: str):
+    if mode not in SCRIPT_MODES:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST,
+            f"'mode' should be one of {', '.join(SCRIPT_MODES)}",
+        )
+
+
+async def load_script_inputs(
+    db: AsyncSession,
+    story_id: str,
+    user_id: uuid.UUID,
+):
+    """The story and what its script is written from, shared by the script steps."""
+
+    context = await load_story_context(db, story_id, user_id)
+
+    story_outline = context.story_outline
+    if len(story_outline) == 0:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST, "invalid or empty story outline"
+        )
+
+    persona = context.persona
+    if not persona:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "invalid or empty persona")
+
+    language = context.language
+    if not language:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "invalid or empty language")
 
-    return script
+    return context.story, story_outline, persona, language
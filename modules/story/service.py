@@ -0,0 +1,110 @@
+import uuid
+from dataclasses import dataclass
+from typing import Any
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from shared.models.story import Script, Story, Storyline
+from shared.models.user import Subscription
+from shared.utils import clean_keys_from_dict
+
+
+@dataclass
+class StoryContext:
+    """Everything the generation steps read about a story, see `load_story_context`."""
+
+    story: Story
+    storyline: Storyline
+    # latest script of the story, only loaded when asked for
+    script: Script | None
+    # balance when the context was loaded, informative only, spending goes
+    # through `reserve_credits`
+    credits: float | None
+
+    @property
+    def story_outline(self) -> dict[str, Any]:
+        return storyline_dict(self.storyline)
+
+    @property
+    def persona(self) -> dict[str, Any] | None:
+        return self.storyline.character_personas
+
+    @property
+    def language(self) -> str | None:
+        return self.story.language
+
+
+def storyline_dict(storyline_doc: Storyline) -> dict[str, Any]:
+    """The story outline as the prompts expect it, without the empty keys."""
+
+    outline = {
+        "plot_outline": storyline_doc.plot_outline,
+        "characters": storyline_doc.characters,
+        "theme": storyline_doc.theme,
+        "mood": storyline_doc.mood,
+        "setting": storyline_doc.setting,
+        "moral": storyline_doc.tone,
+        "conflict": storyline_doc.conflict,
+        "resolution": storyline_doc.resolution,
+        "style": storyline_doc.style,
+    }
+
+    return clean_keys_from_dict(outline)
+
+
+async def load_story_context(
+    db: AsyncSession,
+    story_id: str,
+    user_id: uuid.UUID,
+    with_script: bool = False,
+) -> StoryContext:
+    """
+    Load the story, its storyline (owned by `user_id`), optionally its latest
+    script and the credits of the user in a single query.
+    """
+
+    story_uuid = uuid.UUID(hex=story_id)
+
+    columns = [Story, Storyline, Subscription.credits]
+    if with_script:
+        columns.append(Script)
+
+    context_query = (
+        select(*columns)
+        .select_from(Story)
+        .outerjoin(
+            Storyline,
+            and_(
+                Storyline.story_id == Story.id,
+                Storyline.creator_id == user_id,
+            ),
+        )
+        .outerjoin(Subscription, Subscription.user_id == user_id)
+        .where(Story.id == story_uuid)
+        .limit(1)
+    )
+    if with_script:
+        other_script = aliased(Script)
+        latest_script_id = (
+            select(other_script.id)
+            .where(other_script.story_id == Story.id)
+            .order_by(other_script.created_at.desc())
+            .limit(1)
+            .correlate(Story)
+            .scalar_subquery()
+        )
+        context_query = context_query.outerjoin(Script, Script.id == latest_script_id)
+
+    row = (await db.execute(context_query)).first()
+    if row is None or row[1] is None:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "no storyline found for story")
+
+    return StoryContext(
+        story=row[0],
+        storyline=row[1],
+        script=row[3] if with_script else None,
+        credits=row[2],
+    )
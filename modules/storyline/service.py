@@ -1,6 +1,8 @@
 import json
 
-from shared.llm.gemini import gemini_chat_completion
+from shared.executor import run_cpu
+from shared.llm.cache import cached_llm_result
+from shared.llm.router import text_llm
 from shared.utils import format_prompt
 
 storyline_prompt = """
@@ -49,19 +51,28 @@ OUTPUT FORMAT :
 """
 
 
-async def generate_story_outline(user_input: str):
+async def generate_story_outline(user_input: str, use_cache: bool = True):
     prompt = format_prompt(
         storyline_prompt,
         {
             "user_input": user_input,
         },
     )
-    storyline_text = await gemini_chat_completion(prompt)
 
-    storyline = storyline_text.replace("```json", "").replace("```", "").strip()
-    try:
-        storyline = json.loads(storyline)
-    except Exception as e:
-        print(e)
+    async def complete():
+        storyline_text = await text_llm.complete(prompt)
 
-    return storyline
+        storyline = storyline_text.replace("```json", "").replace("```", "").strip()
+        try:
+            storyline = await run_cpu(json.loads, storyline)
+        except Exception as e:
+            print(e)
+
+        return storyline
+
+    return await cached_llm_result(
+        text_llm.cache_namespace,
+        prompt,
+        complete,
+        use_cache=use_cache,
+    )
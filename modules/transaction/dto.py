@@ -1,3 +1,4 @@
+from dataclasses import dataclass
 from enum import IntEnum
 from uuid import UUID
 from pydantic import BaseModel
@@ -17,3 +18,15 @@ class CreateTransactionRequest(BaseModel):
     amount: float
     remarks: str
     transaction_ref: str = ""
+
+
+@dataclass
+class CreditReservation:
+    """Credits held on a subscription until the work is settled or released."""
+
+    # of the `CreditHold` row
+    id: UUID
+    user_id: UUID
+    # positive number of credits held
+    amount: float
+    closed: bool = False
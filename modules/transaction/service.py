@@ -1,12 +1,29 @@
+import asyncio
+import os
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from fastapi import HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import select, update
 from uuid import UUID
 
-from modules.transaction.dto import CreateTransactionRequest
-from shared.database import AsyncSession
-from shared.models.transaction import Transaction
+from modules.transaction.dto import (
+    CREDIT_NEEDS,
+    CreateTransactionRequest,
+    CreditReservation,
+)
+from shared.database import AsyncSession, AsyncSessionLocal
+from shared.models.transaction import CreditHold, Transaction
 from shared.models.user import Subscription
-from shared.pagination import Pagination
+from shared.pagination import Pagination, paginate_query, split_page
+
+# longer than any generation (queued jobs included), a hold still pending by then
+# belongs to a process which died and is given back
+CREDIT_HOLD_TTL_MINUTES = int(os.getenv("CREDIT_HOLD_TTL_MINUTES", "120"))
+CREDIT_HOLD_SWEEP_SECONDS = float(os.getenv("CREDIT_HOLD_SWEEP_SECONDS", "300"))
+
+_hold_sweeper_task: asyncio.Task | None = None
 
 
 async def list_paginated_transactions(
@@ -14,19 +31,19 @@ async def list_paginated_transactions(
     pagination: Pagination,
     current_uid: UUID,
 ):
-    query = (
-        select(Transaction)
-        .where(Transaction.user_id == current_uid)
-        .order_by(Transaction.created_at.desc())
-        .offset(pagination.offset)
-        .limit(pagination.limit)
+    query = paginate_query(
+        select(Transaction).where(Transaction.user_id == current_uid),
+        pagination,
+        Transaction.created_at,
+        Transaction.id,
     )
 
     result = await db.execute(query)
 
     txns = [x.tuple()[0] for x in result.all()]
 
-    return txns
+    # the cursor of the next page is None in offset mode and on the last page
+    return split_page(txns, pagination)
 
 
 async def add_transaction(
@@ -70,18 +87,258 @@ async def update_credits_with_transaction(
         transaction_ref=new_txn.transaction_ref,
     )
 
-    sub_query = select(Subscription).where(Subscription.user_id == new_txn.user_id)
+    # applied in the database, a read-modify-write would lose concurrent updates
+    sub_query = (
+        update(Subscription)
+        .where(Subscription.user_id == new_txn.user_id)
+        .values(credits=Subscription.credits + new_txn.amount)
+        .returning(Subscription.id)
+    )
     user_sub_result = await db.execute(sub_query)
-    user_sub = user_sub_result.scalar_one_or_none()
-    if user_sub is None:
+    if user_sub_result.scalar_one_or_none() is None:
+        await db.rollback()
         raise HTTPException(
             status.HTTP_500_INTERNAL_SERVER_ERROR,
             "User subscription does not exist",
         )
 
-    user_sub.credits += new_txn.amount
     db.add(txn)
 
     await db.commit()
 
     return txn
+
+
+async def reserve_credits(
+    db: AsyncSession,
+    user_id: UUID,
+    *needs: CREDIT_NEEDS,
+    require: float | None = None,
+) -> CreditReservation:
+    """
+    Hold the credits of `needs` on the subscription with a single conditional
+    UPDATE, so that concurrent requests can never spend the same credits twice.
+    The balance has to be at least `require` (defaults to the held amount).
+
+    A pending `CreditHold` is written in the same transaction. The reservation must
+    be closed with `settle_credits` or `release_credits`, a hold left pending is
+    given back by `release_expired_holds` once it expires.
+    """
+
+    # charges are negative amounts, see `CREDIT_NEEDS`
+    amount = -sum(needs)
+    if require is None:
+        require = amount
+
+    reserve_query = (
+        update(Subscription)
+        .where(
+            Subscription.user_id == user_id,
+            Subscription.credits >= require,
+        )
+        .values(credits=Subscription.credits - amount)
+        .returning(Subscription.credits)
+    )
+    result = await db.execute(reserve_query)
+    remaining = result.scalar_one_or_none()
+    if remaining is None:
+        await db.rollback()
+        raise HTTPException(status.HTTP_402_PAYMENT_REQUIRED, "insufficient credits")
+
+    hold = CreditHold(
+        id=uuid.uuid4(),
+        user_id=user_id,
+        amount=amount,
+        status="pending",
+        expires_at=datetime.now() + timedelta(minutes=CREDIT_HOLD_TTL_MINUTES),
+    )
+    db.add(hold)
+    await db.commit()
+
+    return CreditReservation(id=hold.id, user_id=user_id, amount=amount)
+
+
+def _settle_hold_query(reservation: CreditReservation):
+    # only a pending hold is closed, whoever closes it first (settle, release or
+    # the sweep) moves the credits
+    return (
+        update(CreditHold)
+        .where(
+            CreditHold.id == reservation.id,
+            CreditHold.status == "pending",
+        )
+        .values(status="settled", closed_at=datetime.now())
+        .returning(CreditHold.id)
+    )
+
+
+async def settle_credits(
+    db: AsyncSession,
+    reservation: CreditReservation,
+    charges: list[CreateTransactionRequest],
+):
+    """
+    Record the actual charges of a reservation and give back what was held but not
+    charged. Everything pending on `db` (the generated records) is committed along
+    with it, in one transaction.
+
+    When the hold expired and was released in the meantime, the charges are taken
+    from the balance instead.
+    """
+
+    if reservation.closed:
+        raise Exception("credit reservation is already closed")
+
+    settle_result = await db.execute(_settle_hold_query(reservation))
+    held = settle_result.scalar_one_or_none() is not None
+    if not held:
+        print(f"credit hold {reservation.id} expired before it was settled")
+
+    txns = [
+        Transaction(
+            user_id=charge.user_id,
+            amount=charge.amount,
+            remarks=charge.remarks,
+            transaction_ref=charge.transaction_ref,
+        )
+        for charge in charges
+    ]
+    db.add_all(txns)
+
+    # charges are negative, what was held and not charged goes back
+    adjustment = sum(charge.amount for charge in charges)
+    if held:
+        adjustment += reservation.amount
+    if adjustment:
+        await db.execute(
+            update(Subscription)
+            .where(Subscription.user_id == reservation.user_id)
+            .values(credits=Subscription.credits + adjustment)
+        )
+
+    await db.commit()
+    reservation.closed = True
+
+    return txns
+
+
+async def release_credits(db: AsyncSession, reservation: CreditReservation):
+    """Give back all the credits held by a reservation, when the work failed."""
+
+    if reservation.closed:
+        return
+
+    # whatever failed left nothing worth committing
+    await db.rollback()
+    await release_hold(db, reservation.id)
+    await db.commit()
+    reservation.closed = True
+
+
+async def release_hold(db: AsyncSession, hold_id: UUID) -> bool:
+    """
+    Give back the credits of a hold if it is still pending, also when its
+    `CreditReservation` is gone with the process which made it. Committed by the
+    caller.
+    """
+
+    release_query = (
+        update(CreditHold)
+        .where(
+            CreditHold.id == hold_id,
+            CreditHold.status == "pending",
+        )
+        .values(status="released", closed_at=datetime.now())
+        .returning(CreditHold.user_id, CreditHold.amount)
+    )
+    released = (await db.execute(release_query)).first()
+    if released is None:
+        return False
+
+    user_id, amount = released.tuple()
+    await db.execute(
+        update(Subscription)
+        .where(Subscription.user_id == user_id)
+        .values(credits=Subscription.credits + amount)
+    )
+
+    return True
+
+
+@asynccontextmanager
+async def settle_or_release(db: AsyncSession, reservation: CreditReservation):
+    """
+    Release the reservation if the block fails (or is cancelled) or returns without
+    settling it.
+    """
+
+    try:
+        yield reservation
+    finally:
+        if not reservation.closed:
+            await release_credits(db, reservation)
+
+
+async def release_expired_holds(db: AsyncSession) -> int:
+    """
+    Give back the credits of the holds still pending past their expiry, left by a
+    process which died between reserving and settling. Safe to run from every
+    worker at once, a hold is only ever closed once.
+    """
+
+    now = datetime.now()
+    expired_query = (
+        update(CreditHold)
+        .where(
+            CreditHold.status == "pending",
+            CreditHold.expires_at < now,
+        )
+        .values(status="released", closed_at=now)
+        .returning(CreditHold.user_id, CreditHold.amount)
+    )
+    expired = (await db.execute(expired_query)).all()
+
+    refunds: dict[UUID, float] = defaultdict(float)
+    for user_id, amount in expired:
+        refunds[user_id] += amount
+
+    for user_id, refund in refunds.items():
+        await db.execute(
+            update(Subscription)
+            .where(Subscription.user_id == user_id)
+            .values(credits=Subscription.credits + refund)
+        )
+
+    await db.commit()
+
+    return len(expired)
+
+
+async def _sweep_expired_holds():
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                released = await release_expired_holds(session)
+            if released:
+                print(f"Released {released} expired credit holds")
+        except Exception as e:
+            print(f"Releasing the expired credit holds failed: {e}")
+
+        await asyncio.sleep(CREDIT_HOLD_SWEEP_SECONDS)
+
+
+def start_credit_hold_sweeper():
+    global _hold_sweeper_task
+
+    _hold_sweeper_task = asyncio.create_task(_sweep_expired_holds())
+
+
+async def stop_credit_hold_sweeper():
+    global _hold_sweeper_task
+
+    if _hold_sweeper_task is None:
+        return
+
+    _hold_sweeper_task.cancel()
+    await asyncio.gather(_hold_sweeper_task, return_exceptions=True)
+    _hold_sweeper_task = None
@@ -0,0 +1,31 @@
+import os
+
+from shared.disk_cache import DiskLRUCache, make_cache_key
+from shared.llm.sarvam_tts import SARVAM_TTS_MODEL, VoiceConfig
+
+TTS_CACHE_PATH = os.getenv("TTS_CACHE_PATH", "./cache/tts/")
+TTS_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", "2048"))
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+
+tts_segment_cache = DiskLRUCache(
+    TTS_CACHE_PATH,
+    max_bytes=TTS_CACHE_MAX_MB * 1024 * 1024,
+    suffix=".wav",
+)
+
+
+def segment_cache_key(text: str, language_code: str, voice_config: VoiceConfig):
+    """
+    Content address of a synthesized segment. Any change in the inputs that affects
+    the generated audio (including the TTS model) produces a different key.
+    """
+
+    return make_cache_key(
+        text,
+        language_code,
+        voice_config.speaker.lower(),
+        float(voice_config.pitch),
+        float(voice_config.pace),
+        float(voice_config.loudness),
+        SARVAM_TTS_MODEL,
+    )
@@ -0,0 +1,99 @@
+import os
+
+# Sarvam accepts up to 1500 characters per request for bulbul:v2, stay well below it
+# so that a single request does not become the long pole of the story.
+# Set to 0 to send every dialogue on its own.
+TTS_BATCH_MAX_CHARS = int(os.getenv("TTS_BATCH_MAX_CHARS", "500"))
+
+
+def _effective_voice(item: dict) -> tuple:
+    voice_config = item["voice_config"]
+    return (
+        item["language"],
+        str(voice_config["speaker"]).lower(),
+        float(voice_config.get("pitch", 0.0)),
+        float(voice_config.get("pace", 0.9)),
+        float(voice_config.get("loudness", 1.0)),
+    )
+
+
+class TTSBatchPlanner:
+    """
+    Incrementally pack consecutive script items sharing the same effective voice
+    (language, speaker, pitch, pace and loudness) into a single TTS request of at
+    most `max_chars`.
+
+    Every batch is re-indexed in script order and keeps the indices of the dialogues
+    it covers in "line_indices", and their lengths in "line_chars". A batch is read
+    as one utterance, the synthesized audio gets the regular gap between its lines
+    afterwards (see `insert_pauses`).
+    """
+
+    def __init__(self, max_chars: int = TTS_BATCH_MAX_CHARS):
+        self.max_chars = max_chars
+        self.num_batches = 0
+
+        self._open_batch: dict | None = None
+        self._open_voice = None
+
+    def _close(self) -> list[dict]:
+        if self._open_batch is None:
+            return []
+
+        batch = self._open_batch
+        batch["index"] = self.num_batches
+        self.num_batches += 1
+
+        self._open_batch = None
+        self._open_voice = None
+        return [batch]
+
+    def add(self, item: dict) -> list[dict]:
+        """Add the next script item, returns the batches that can not grow anymore."""
+
+        voice = _effective_voice(item)
+        batch = self._open_batch
+        if (
+            self.max_chars > 0
+            and batch is not None
+            and voice == self._open_voice
+            and len(batch["text"]) + 1 + len(item["text"]) <= self.max_chars
+        ):
+            batch["text"] = f"{batch['text']} {item['text']}"
+            batch["line_indices"].append(item["index"])
+            batch["line_chars"].append(len(item["text"]))
+            return []
+
+        closed = self._close()
+        self._open_batch = {
+            **item,
+            "voice_config": dict(item["voice_config"]),
+            "line_indices": [item["index"]],
+            "line_chars": [len(item["text"])],
+        }
+        self._open_voice = voice
+
+        return closed
+
+    def flush(self) -> list[dict]:
+        """Close the batch still being filled, once there are no more items."""
+
+        return self._close()
+
+
+def plan_tts_batches(
+    items: list[dict],
+    max_chars: int = TTS_BATCH_MAX_CHARS,
+) -> list[dict]:
+    """
+    Pack a whole script at once, see `TTSBatchPlanner`.
+    """
+
+    planner = TTSBatchPlanner(max_chars)
+
+    batches = []
+    for item in items:
+        batches.extend(planner.add(item))
+    batches.extend(planner.flush())
+
+    return batches
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import uuid
+
+from sqlalchemy import select
+
+from shared.database import AsyncSessionLocal
+from shared.ffmpeg import transcode_audio_async
+from shared.models.story import Story
+
+# Comma separated list of "<format>:<bitrate>", e.g. "opus:48k,mp3:96k,aac:64k"
+AUDIO_RENDITIONS = os.getenv("AUDIO_RENDITIONS", "opus:48k,mp3:96k")
+KEEP_WAV_MASTER = os.getenv("KEEP_WAV_MASTER", "true").lower() == "true"
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", "2"))
+
+RENDITION_CODECS = {
+    "opus": (".opus", ["-c:a", "libopus", "-application", "voip"]),
+    "mp3": (".mp3", ["-c:a", "libmp3lame"]),
+    "aac": (".m4a", ["-c:a", "aac", "-movflags", "+faststart"]),
+}
+
+# bounds the number of ffmpeg processes running at once, across all stories
+transcode_semaphore = asyncio.Semaphore(TRANSCODE_WORKERS)
+
+# keep a reference on the background tasks, the loop only holds weak ones
+_background_tasks: set[asyncio.Task] = set()
+
+
+def parse_rendition_spec(spec: str) -> list[tuple[str, str]]:
+    renditions = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        audio_format, _, bitrate = entry.partition(":")
+        audio_format = audio_format.lower()
+        if audio_format not in RENDITION_CODECS:
+            raise ValueError(f"unknown audio rendition format '{audio_format}'")
+
+        renditions.append((audio_format, bitrate or "64k"))
+
+    return renditions
+
+
+async def _transcode_rendition(wav_path: str, audio_format: str, bitrate: str):
+    extension, codec_args = RENDITION_CODECS[audio_format]
+    output_path = f"{os.path.splitext(wav_path)[0]}.{bitrate}{extension}"
+
+    async with transcode_semaphore:
+        await transcode_audio_async(
+            wav_path,
+            output_path,
+            [*codec_args, "-b:a", bitrate],
+        )
+
+    return output_path
+
+
+async def create_audio_renditions(audio_src: str) -> dict[str, dict]:
+    """
+    Encode the compressed renditions configured in AUDIO_RENDITIONS for a story WAV.
+    `audio_src` is the public path stored on the story (e.g. "/public/<id>.wav").
+
+    Returns a mapping of format to {"bitrate", "src"}, renditions that failed to
+    encode are left out.
+    """
+
+    wav_path = f".{audio_src}"
+    renditions = parse_rendition_spec(AUDIO_RENDITIONS)
+
+    results = await asyncio.gather(
+        *[
+            _transcode_rendition(wav_path, audio_format, bitrate)
+            for audio_format, bitrate in renditions
+        ],
+        return_exceptions=True,
+    )
+
+    audio_renditions = {}
+    for (audio_format, bitrate), result in zip(renditions, results):
+        if isinstance(result, BaseException):
+            print(f"failed to create {audio_format} rendition for {audio_src}: {result}")
+            continue
+
+        audio_renditions[audio_format] = {
+            "bitrate": bitrate,
+            "src": result.lstrip("."),
+        }
+
+    return audio_renditions
+
+
+async def _store_audio_renditions(story_id: uuid.UUID, audio_src: str):
+    try:
+        audio_renditions = await create_audio_renditions(audio_src)
+        if not audio_renditions:
+            return
+
+        async with AsyncSessionLocal() as session:
+            story_query = select(Story).where(Story.id == story_id).limit(1)
+            story_doc = (await session.execute(story_query)).scalar_one_or_none()
+            if story_doc is None or story_doc.audio_src != audio_src:
+                # the story was re-voiced in the meantime, these renditions are stale
+                return
+
+            story_doc.audio_renditions = audio_renditions
+
+            if not KEEP_WAV_MASTER:
+                # point the story at the first configured rendition instead of the WAV
+                story_doc.audio_src = next(iter(audio_renditions.values()))["src"]
+
+            await session.commit()
+
+        if not KEEP_WAV_MASTER:
+            os.remove(f".{audio_src}")
+    except Exception as e:
+        print(f"failed to store audio renditions for story {story_id}: {e}")
+
+
+def schedule_audio_renditions(story_id: uuid.UUID, audio_src: str):
+    """
+    Encode the compressed renditions of a story in the background and record them
+    on the story once done. The WAV is removed afterwards unless KEEP_WAV_MASTER is set.
+    """
+
+    if not AUDIO_RENDITIONS:
+        return
+
+    task = asyncio.create_task(_store_audio_renditions(story_id, audio_src))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
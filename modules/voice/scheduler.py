@@ -0,0 +1,154 @@
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+TTS_MIN_CONCURRENCY = int(os.getenv("TTS_MIN_CONCURRENCY", "2"))
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "32"))
+TTS_INITIAL_CONCURRENCY = int(os.getenv("TTS_INITIAL_CONCURRENCY", "8"))
+TTS_TARGET_LATENCY_MS = int(os.getenv("TTS_TARGET_LATENCY_MS", "4000"))
+
+
+class TTSPermit:
+    """
+    Handle given out for every scheduled TTS call. The scheduler reads the outcome
+    from it once the call is done, callers may set `status` (or `failed`) explicitly
+    when they swallow the provider error themselves.
+    """
+
+    def __init__(self):
+        self.status: int | None = None
+        self.overloaded = False
+        # any other exception, e.g. a connection error before any response
+        self.failed = False
+        # the call returned, the limit only grows on those
+        self.completed = False
+
+
+class AdaptiveConcurrencyScheduler:
+    """
+    Process wide concurrency limiter for the TTS provider.
+
+    The limit adapts AIMD style: every fast, successful call grows it by 1/limit
+    (about +1 per round of calls), while a 429, a 5xx, a timeout, a connection
+    error or a very slow call cuts it by `decrease_factor`, at most once per
+    `cooldown` seconds. A cancelled call leaves it as is.
+
+    Capacity is shared fairly between owners (one per story being voiced): an owner
+    can not hold more than its share of the current limit while others are waiting.
+    """
+
+    def __init__(
+        self,
+        min_limit: int,
+        max_limit: int,
+        initial_limit: int,
+        target_latency: float,
+        decrease_factor: float = 0.5,
+        cooldown: float = 2.0,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+
+        self.in_flight = 0
+        self._running: dict[str, int] = {}
+        self._waiting: dict[str, int] = {}
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    def _fair_share(self) -> int:
+        active = set(self._running) | set(self._waiting)
+        return max(1, math.ceil(int(self.limit) / max(len(active), 1)))
+
+    def _can_run(self, owner: str) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+
+        return self._running.get(owner, 0) < self._fair_share()
+
+    def _record(self, latency: float, permit: TTSPermit):
+        cancelled = not (
+            permit.completed
+            or permit.failed
+            or permit.overloaded
+            or permit.status is not None
+        )
+        if cancelled:
+            # says nothing about the provider
+            return
+
+        overloaded = (
+            permit.overloaded
+            or permit.failed
+            or permit.status == 429
+            or (permit.status is not None and permit.status >= 500)
+            or latency > 2 * self.target_latency
+        )
+
+        if overloaded:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self._last_decrease = now
+            return
+
+        if (
+            permit.completed
+            and permit.status is None
+            and latency <= self.target_latency
+        ):
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    @asynccontextmanager
+    async def acquire(self, owner: str):
+        async with self._condition:
+            self._waiting[owner] = self._waiting.get(owner, 0) + 1
+            try:
+                await self._condition.wait_for(lambda: self._can_run(owner))
+            finally:
+                self._waiting[owner] -= 1
+                if not self._waiting[owner]:
+                    del self._waiting[owner]
+
+            self.in_flight += 1
+            self._running[owner] = self._running.get(owner, 0) + 1
+
+        permit = TTSPermit()
+        start = time.monotonic()
+        try:
+            yield permit
+            permit.completed = True
+        except aiohttp.ClientResponseError as e:
+            permit.status = e.status
+            raise
+        except (asyncio.TimeoutError, aiohttp.ServerTimeoutError):
+            permit.overloaded = True
+            raise
+        except Exception:
+            permit.failed = True
+            raise
+        finally:
+            latency = time.monotonic() - start
+            async with self._condition:
+                self.in_flight -= 1
+                self._running[owner] -= 1
+                if not self._running[owner]:
+                    del self._running[owner]
+
+                self._record(latency, permit)
+                self._condition.notify_all()
+
+
+tts_scheduler = AdaptiveConcurrencyScheduler(
+    min_limit=TTS_MIN_CONCURRENCY,
+    max_limit=TTS_MAX_CONCURRENCY,
+    initial_limit=TTS_INITIAL_CONCURRENCY,
+    target_latency=TTS_TARGET_LATENCY_MS / 1000,
+)
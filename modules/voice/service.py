@@ -1,95 +1,312 @@
 import aiohttp
 import base64
+import logging
 import os
 import secrets
 import asyncio
+from typing import AsyncIterator, Awaitable, Callable
 
-from shared.ffmpeg import merge_audio_files_async
+from modules.voice.cache import (
+    TTS_CACHE_ENABLED,
+    segment_cache_key,
+    tts_segment_cache,
+)
+from modules.voice.planner import TTSBatchPlanner, plan_tts_batches
+from modules.voice.scheduler import TTS_MAX_CONCURRENCY, tts_scheduler
+from shared.backoff import backoff_delay, is_retryable_status, parse_retry_after
+from shared.executor import run_cpu, run_io
+from shared.http_client import get_http_session
+from shared.ffmpeg import convert_wav_async, merge_audio_segments_async
 from shared.language_codes import LANGUAGE_CODES
 from shared.llm.sarvam_tts import VoiceConfig, generate_sarvam_voice
-from shared.utils import delete_files_by_pattern
-
-NUM_VOICE_WORKERS = 4
+from shared.wav import (
+    STREAMING_DATA_SIZE,
+    WavFormat,
+    WavFormatError,
+    build_wav_header,
+    insert_pauses,
+    parse_wav,
+    silence_pcm,
+    wav_duration_ms,
+)
 
 COMPILED_AUDIO_PATH = "./public/"
-TEMP_AUDIO_PATH = "./tmp/"
+
+TTS_MAX_ATTEMPTS = int(os.getenv("TTS_MAX_ATTEMPTS", "4"))
+TTS_RETRY_BASE_DELAY = float(os.getenv("TTS_RETRY_BASE_DELAY", "0.5"))
+TTS_RETRY_MAX_DELAY = float(os.getenv("TTS_RETRY_MAX_DELAY", "20"))
+
+# Gap between two consecutive dialogues, same as `shared/silence_300ms.wav`
+SEGMENT_GAP_MS = 300
+
+logger = logging.getLogger("voice.service")
+
+
+def item_segment_key(item: dict) -> str:
+    language_code = LANGUAGE_CODES[item["language"]]
+    voice_config = VoiceConfig(**item["voice_config"])
+    return segment_cache_key(item["text"], language_code, voice_config)
+
+
+async def synthesize_item(item: dict, session: aiohttp.ClientSession):
+    req_id = item["request_id"]
+    language_code = LANGUAGE_CODES[item["language"]]
+    voice_config = VoiceConfig(**item["voice_config"])
+    cache_key = item_segment_key(item)
+
+    item["audio"] = b""
+    item["segment_key"] = cache_key
+    audio_buffer = None
+    if TTS_CACHE_ENABLED:
+        # an empty file is a miss, it would drop the line from the story
+        audio_buffer = await run_io(tts_segment_cache.get, cache_key) or None
+
+    if audio_buffer is None:
+        # generate the voice for this item and save it somewhere for merger
+        async with tts_scheduler.acquire(req_id):
+            audio_response = await generate_sarvam_voice(
+                item["text"],
+                language_code,
+                voice_config,
+                session,
+            )
+
+            # raised in here so that the scheduler counts it as a failed call, the
+            # worker retries it like any other
+            audio_buffer_encoded = (audio_response.get("audios") or [None])[0]
+            if not audio_buffer_encoded:
+                raise Exception("the TTS response holds no audio")
+
+        audio_buffer = await run_cpu(base64.b64decode, audio_buffer_encoded)
+        if not audio_buffer:
+            raise Exception("the TTS response holds no audio")
+
+        if TTS_CACHE_ENABLED:
+            await run_io(tts_segment_cache.put, cache_key, audio_buffer)
+
+    if len(item.get("line_chars", [])) > 1:
+        # the lines of a batch are read as one utterance, give them back the gap
+        # they would have had when voiced one by one
+        audio_buffer = await run_cpu(
+            insert_pauses,
+            audio_buffer,
+            item["line_chars"],
+            SEGMENT_GAP_MS,
+        )
+
+    # segments are kept in memory until they are assembled
+    item["audio"] = audio_buffer
+    item["duration_ms"] = wav_duration_ms(audio_buffer)
+
+
+def _requeue_item(in_queue: asyncio.Queue, item: dict):
+    try:
+        in_queue.put_nowait(item)
+    except asyncio.QueueShutDown:
+        pass
+    finally:
+        in_queue.task_done()
 
 
 async def voice_worker(
     in_queue: asyncio.Queue,
     out_queue: asyncio.Queue,
-    read_lock: asyncio.Lock,
-    write_lock: asyncio.Lock,
     session: aiohttp.ClientSession,
+    on_item_done: Callable[[dict], None] | None = None,
 ):
+    """
+    Synthesize items from `in_queue` until it is shut down.
+
+    A failed item is put back on `in_queue` after a jittered exponential backoff
+    (honoring Retry-After), so only the failed index is retried and the worker is
+    free to pick up other items meanwhile. Once its attempts are exhausted, or on a
+    non-retryable error, the item is forwarded to `out_queue` with an "error" key.
+    """
+
+    loop = asyncio.get_running_loop()
     while True:
         try:
-            async with read_lock:
-                item = in_queue.get_nowait()
+            item = await in_queue.get()
+        except asyncio.QueueShutDown:
+            break
 
-            req_id = item["request_id"]
-            item_file_path = f"{req_id}__{item['index']:03}.wav"
-            item_file_path = os.path.join(TEMP_AUDIO_PATH, item_file_path)
+        try:
+            await synthesize_item(item, session)
+            await out_queue.put(item)
+            if on_item_done:
+                on_item_done(item)
+        except Exception as e:
+            attempt = item.get("attempt", 1)
+            retryable = True
+            retry_after = None
+            if isinstance(e, aiohttp.ClientResponseError):
+                retryable = is_retryable_status(e.status)
+                retry_after = parse_retry_after(e.headers)
 
-            # generate the voice for this item and save it somewhere for merger
-            audio_response = await generate_sarvam_voice(
-                item["text"],
-                LANGUAGE_CODES[item["language"]],
-                VoiceConfig(**item["voice_config"]),
-                session,
-            )
+            if retryable and attempt < TTS_MAX_ATTEMPTS:
+                delay = backoff_delay(
+                    attempt,
+                    TTS_RETRY_BASE_DELAY,
+                    TTS_RETRY_MAX_DELAY,
+                    retry_after,
+                )
+                print(
+                    f"voice segment {item['index']} failed (attempt {attempt}): {e}, retrying in {delay:.2f}s"
+                )
 
-            item["voice_sample_path"] = ""
-            audio_buffer_encoded = audio_response.get("audios", [None])[0]
+                item["attempt"] = attempt + 1
+                # the item is only marked done once it is back on the queue,
+                # so that in_queue.join() keeps waiting for it
+                loop.call_later(delay, _requeue_item, in_queue, item)
+                continue
 
-            if audio_buffer_encoded:
-                audio_buffer = base64.b64decode(audio_buffer_encoded)
-                with open(item_file_path, "wb") as fp:
-                    fp.write(audio_buffer)
+            print(f"voice segment {item['index']} failed permanently: {e}")
+            item["audio"] = b""
+            item["error"] = str(e)
+            await out_queue.put(item)
+            if on_item_done:
+                on_item_done(item)
 
-                item["voice_sample_path"] = item_file_path
+        in_queue.task_done()
 
-            async with write_lock:
-                await out_queue.put(item)
-        except (asyncio.QueueEmpty, asyncio.QueueShutDown):
-            break
-        except aiohttp.ClientResponseError as e:
-            if e.status > 400:
-                break
-        except Exception as e:
-            print(e)
 
+async def _run_voice_workers(
+    in_queue: asyncio.Queue,
+    out_queue: asyncio.Queue,
+    session: aiohttp.ClientSession,
+    num_workers: int,
+    on_item_done: Callable[[dict], None] | None = None,
+    producer: Awaitable | None = None,
+):
+    """
+    Run the voice workers until every item of `in_queue` is done. When items are
+    still being put on the queue, pass the coroutine doing it as `producer`, the
+    queue is only joined once it has returned.
+    """
+
+    worker_tasks = [
+        asyncio.create_task(voice_worker(in_queue, out_queue, session, on_item_done))
+        for _ in range(num_workers)
+    ]
 
-async def generate_voice_for_script(script: list[dict], persona: dict, language: str):
+    try:
+        if producer is not None:
+            await producer
+
+        # every item is done once it succeeded or ran out of attempts
+        await in_queue.join()
+        in_queue.shutdown()
+        await asyncio.wait(worker_tasks)
+    finally:
+        for t in worker_tasks:
+            t.cancel()
+
+
+def prepare_script_item(
+    item: dict,
+    idx: int,
+    persona: dict,
+    language: str,
+    req_id: str,
+) -> dict:
     """
-    Generate a combines voice set for a script and merge the speaker audio into a single audio sample
-    using something like pydub of ffmpeg.
+    Attach the request information and the effective voice config of the speaker
+    persona to a dialogue. `persona` is expected with lowercase keys.
     """
 
-    req_id = secrets.token_hex(8)
-    read_lock = asyncio.Lock()
-    write_lock = asyncio.Lock()
+    item_with_args = {
+        **item,
+        "index": idx,
+        "request_id": req_id,
+        "language": language,
+        # copied, the dialogue itself is stored as part of the script
+        "voice_config": dict(item.get("voice_config") or {}),
+    }
+
+    speaker = item["speaker"].lower()
+    if speaker in persona:
+        persona_config = persona[speaker]["voice_config"]
+        item_with_args["voice_config"].update(persona_config)
+
+    item_voice_pace = float(item_with_args["voice_config"].get("pace", 1))
+    item_with_args["voice_config"]["pace"] = min(item_voice_pace, 1)
+
+    return item_with_args
 
+
+def prepare_script_items(
+    script: list[dict],
+    persona: dict,
+    language: str,
+    req_id: str,
+) -> list[dict]:
     # easier to match in same case (lowercase)
     persona = {k.lower(): v for k, v in persona.items()}
 
-    script_with_ids = []
-    for idx, item in enumerate(script):
-        item_with_args = {
-            **item,
-            "index": idx,
-            "request_id": req_id,
-            "language": language,
-        }
+    return [
+        prepare_script_item(item, idx, persona, language, req_id)
+        for idx, item in enumerate(script)
+    ]
+
+
+def plan_segment_keys(
+    script: list[dict],
+    persona: dict,
+    language: str,
+) -> list[str | None]:
+    """
+    Key of the TTS segment every line of the script would be voiced in, without
+    synthesizing anything. A line whose stored key differs is stale.
+    """
+
+    keys: list[str | None] = [None] * len(script)
+    for batch in plan_tts_batches(prepare_script_items(script, persona, language, "")):
+        batch_key = item_segment_key(batch)
+        for line_index in batch["line_indices"]:
+            keys[line_index] = batch_key
+
+    return keys
+
+
+def num_voice_workers(items: list[dict]) -> int:
+    # workers are cheap, the actual parallelism is bounded by the shared tts_scheduler
+    return max(1, min(len(items), TTS_MAX_CONCURRENCY))
+
+
+def compiled_audio_path(req_id: str) -> str:
+    return os.path.join(COMPILED_AUDIO_PATH, f"{req_id}.wav")
+
+
+async def generate_voice_for_script(
+    script: list[dict],
+    persona: dict,
+    language: str,
+    on_progress: Callable[[int, int], None] | None = None,
+    on_segment: Callable[[dict], None] | None = None,
+):
+    """
+    Generate a combines voice set for a script and merge the speaker audio into a single audio sample
+    using something like pydub of ffmpeg.
+
+    Consecutive dialogues with the same voice are synthesized together (see
+    `plan_tts_batches`), `on_progress` is called with (done, total) every time
+    one of these batches is finished. `on_segment` is called with every batch
+    once all of them succeeded, see `_merge_voice_results`.
+    """
+
+    req_id = secrets.token_hex(8)
+
+    script_with_ids = plan_tts_batches(
+        prepare_script_items(script, persona, language, req_id)
+    )
 
-        speaker = item["speaker"].lower()
-        if speaker in persona:
-            persona_config = persona[speaker]["voice_config"]
-            item_with_args["voice_config"].update(persona_config)
+    done_count = 0
 
-        item_voice_pace = float(item_with_args["voice_config"]["pace"])
-        item_with_args["voice_config"]["pace"] = min(item_voice_pace, 1)
-        script_with_ids.append(item_with_args)
+    def on_item_done(_: dict):
+        nonlocal done_count
+        done_count += 1
+        if on_progress:
+            on_progress(done_count, len(script_with_ids))
 
     script_queue = asyncio.Queue()
     for item in script_with_ids:
@@ -97,24 +314,33 @@ async def generate_voice_for_script(script: list[dict], persona: dict, language:
 
     results_queue = asyncio.Queue()
 
-    # Ensure that the result directory is available
-    os.makedirs(TEMP_AUDIO_PATH, exist_ok=True)
-
-    worker_tasks = []
-    async with aiohttp.ClientSession() as session:
-        for _ in range(NUM_VOICE_WORKERS):
-            t = asyncio.create_task(
-                voice_worker(
-                    script_queue,
-                    results_queue,
-                    read_lock,
-                    write_lock,
-                    session,
-                )
-            )
-            worker_tasks.append(t)
+    session = get_http_session("sarvam")
+    await _run_voice_workers(
+        script_queue,
+        results_queue,
+        session,
+        num_voice_workers(script_with_ids),
+        on_item_done,
+    )
 
-        await asyncio.wait(worker_tasks)
+    return await _merge_voice_results(
+        results_queue,
+        len(script_with_ids),
+        req_id,
+        on_segment,
+    )
+
+
+async def _merge_voice_results(
+    results_queue: asyncio.Queue,
+    num_items: int,
+    req_id: str,
+    on_segment: Callable[[dict], None] | None = None,
+) -> str:
+    """
+    Merge the synthesized batches into a single file. `on_segment` is called with
+    each of them (holding "line_indices", "segment_key" and "duration_ms").
+    """
 
     output_list = []
     while not results_queue.empty():
@@ -124,27 +350,238 @@ async def generate_voice_for_script(script: list[dict], persona: dict, language:
             print(e)
             continue
 
-    if len(script_with_ids) != len(output_list):
+    failed_items = [item for item in output_list if item.get("error")]
+    if failed_items or num_items != len(output_list):
         raise Exception("failed to generate some voice samples. Please try again.")
 
     # sorting the list in order of original speech in script
     output_list.sort(key=lambda x: x["index"])
 
-    # merge all the items in the output list using ffmpeg
-    file_paths = [item["voice_sample_path"] for item in output_list]
+    if on_segment:
+        for item in output_list:
+            on_segment(item)
+
+    segments = [item["audio"] for item in output_list if item["audio"]]
 
-    if not file_paths:
+    if not segments:
         raise Exception("failed to generate audio")
 
-    compiled_file_path = os.path.join(COMPILED_AUDIO_PATH, f"{req_id}.wav")
-    await merge_audio_files_async(
-        file_paths,
-        compiled_file_path,
+    compiled_file_path = compiled_audio_path(req_id)
+    await merge_audio_segments_async(segments, compiled_file_path, SEGMENT_GAP_MS)
+
+    return compiled_file_path.strip(".")
+
+
+async def generate_voice_for_dialogue_stream(
+    dialogues: AsyncIterator[dict],
+    persona: dict,
+    language: str,
+    on_progress: Callable[[int, int], None] | None = None,
+    on_segment: Callable[[dict], None] | None = None,
+) -> tuple[list[dict], str]:
+    """
+    Generate the voice for a script while it is still being written, e.g. by
+    `stream_script`. Every batch of dialogues is handed to the voice workers as soon
+    as the next dialogue can not be packed with it anymore, so most of the TTS work
+    overlaps the LLM generation.
+
+    Returns the complete script along with the path of the merged audio.
+    `on_progress` is called with (done, total) synthesized batches, the total is
+    only final once the script is complete. `on_segment` is called with every batch
+    once all of them succeeded, the line indices are positions in the script.
+    """
+
+    req_id = secrets.token_hex(8)
+
+    # easier to match in same case (lowercase)
+    persona = {k.lower(): v for k, v in persona.items()}
+
+    script_queue = asyncio.Queue()
+    results_queue = asyncio.Queue()
+    planner = TTSBatchPlanner()
+    script = []
+
+    done_count = 0
+
+    def on_item_done(_: dict):
+        nonlocal done_count
+        done_count += 1
+        if on_progress:
+            on_progress(done_count, planner.num_batches)
+
+    async def produce_items():
+        async for dialogue in dialogues:
+            script.append(dialogue)
+            if not isinstance(dialogue, dict) or not dialogue.get("text"):
+                print(f"skipping voice for malformed dialogue {len(script) - 1}")
+                continue
+
+            item = prepare_script_item(
+                dialogue,
+                len(script) - 1,
+                persona,
+                language,
+                req_id,
+            )
+            for batch in planner.add(item):
+                script_queue.put_nowait(batch)
+
+        for batch in planner.flush():
+            script_queue.put_nowait(batch)
+
+    session = get_http_session("sarvam")
+    # the number of batches is unknown upfront, the scheduler bounds the parallelism
+    await _run_voice_workers(
+        script_queue,
+        results_queue,
+        session,
+        TTS_MAX_CONCURRENCY,
+        on_item_done,
+        producer=produce_items(),
     )
-    delete_files_by_pattern(
-        TEMP_AUDIO_PATH,
-        f"{req_id}_*.wav",
-        dry_run=False,
+
+    if not script:
+        raise Exception("failed to generate script")
+
+    voice_path = await _merge_voice_results(
+        results_queue,
+        planner.num_batches,
+        req_id,
+        on_segment,
     )
 
-    return compiled_file_path.strip(".")
+    return script, voice_path
+
+
+async def _signal_when_done(
+    in_queue: asyncio.Queue,
+    out_queue: asyncio.Queue,
+    session: aiohttp.ClientSession,
+    num_workers: int,
+):
+    try:
+        await _run_voice_workers(in_queue, out_queue, session, num_workers)
+    finally:
+        await out_queue.put(None)
+
+
+async def _stream_segment_pcm(
+    audio: bytes,
+    stream_format: WavFormat | None,
+) -> tuple[WavFormat, memoryview]:
+    """
+    The samples of a segment in `stream_format` (its own when None). A segment in
+    another format, or which can not be read, is converted by ffmpeg.
+    """
+
+    try:
+        segment_format, pcm = await run_cpu(parse_wav, audio)
+        if stream_format is None or segment_format == stream_format:
+            return segment_format, pcm
+        reason = f"format {segment_format}"
+    except WavFormatError as e:
+        reason = str(e)
+
+    logger.warning("converting a voice segment for the stream (%s)", reason)
+    converted = await convert_wav_async(audio, stream_format)
+    segment_format, pcm = await run_cpu(parse_wav, converted)
+    if stream_format is not None and segment_format != stream_format:
+        raise Exception(f"failed to convert a voice segment to {stream_format}")
+
+    return segment_format, pcm
+
+
+async def stream_voice_for_script(
+    script: list[dict],
+    persona: dict,
+    language: str,
+    req_id: str,
+    on_segment: Callable[[dict], None] | None = None,
+):
+    """
+    Generate the voice for a script and yield a single WAV stream in script order
+    as soon as the contiguous prefix of segments is synthesized. `on_segment` is
+    called with every batch as it is emitted.
+
+    Segments finish out of order across the workers, so they are held in a reorder
+    buffer keyed on their index until every earlier segment has been emitted.
+    The stream is also written to `compiled_audio_path(req_id)`, with the final
+    header patched in once every segment is done. Segments in another format than
+    the first one are converted to it, a segment that can not be converted fails
+    the stream.
+    """
+
+    script_with_ids = plan_tts_batches(
+        prepare_script_items(script, persona, language, req_id)
+    )
+
+    script_queue = asyncio.Queue()
+    for item in script_with_ids:
+        await script_queue.put(item)
+
+    results_queue = asyncio.Queue()
+
+    os.makedirs(COMPILED_AUDIO_PATH, exist_ok=True)
+
+    compiled_file_path = compiled_audio_path(req_id)
+    reorder_buffer: dict[int, dict] = {}
+    next_index = 0
+    stream_format = None
+    silence = b""
+    data_size = 0
+
+    session = get_http_session("sarvam")
+    workers_task = asyncio.create_task(
+        _signal_when_done(
+            script_queue,
+            results_queue,
+            session,
+            num_voice_workers(script_with_ids),
+        )
+    )
+
+    try:
+        # unbuffered, so that the final header can be patched in place
+        with open(compiled_file_path, "wb", buffering=0) as output_fp:
+            while next_index < len(script_with_ids):
+                item = await results_queue.get()
+                if item is None or item.get("error"):
+                    raise Exception(
+                        "failed to generate some voice samples. Please try again."
+                    )
+
+                reorder_buffer[item["index"]] = item
+
+                while next_index in reorder_buffer:
+                    ready = reorder_buffer.pop(next_index)
+                    next_index += 1
+                    if on_segment:
+                        on_segment(ready)
+
+                    if not ready["audio"]:
+                        continue
+
+                    segment_format, pcm = await _stream_segment_pcm(
+                        ready["audio"], stream_format
+                    )
+
+                    chunk = b""
+                    if stream_format is None:
+                        stream_format = segment_format
+                        silence = silence_pcm(stream_format, SEGMENT_GAP_MS)
+                        chunk = build_wav_header(stream_format, STREAMING_DATA_SIZE)
+
+                    chunk += bytes(pcm) + silence
+                    data_size += len(pcm) + len(silence)
+
+                    await run_io(output_fp.write, chunk)
+                    yield chunk
+
+            if stream_format is None:
+                raise Exception("failed to generate audio")
+
+            # now that the size is known, make the stored file a regular WAV
+            header = build_wav_header(stream_format, data_size)
+            await run_io(os.pwrite, output_fp.fileno(), header, 0)
+    finally:
+        workers_task.cancel()
@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy import select
 from shared import jwt_utils
+from shared.executor import run_cpu
 from shared.auth_middleware import AuthUser, get_current_user
 from shared.database import AsyncSession, get_db
 from shared.models.user import Subscription, User
@@ -26,7 +27,8 @@ async def register_new_user(
         raise HTTPException(status.HTTP_403_FORBIDDEN, "email already exists")
 
     salt = bcrypt.gensalt()
-    password_hash = bcrypt.hashpw(payload.password.encode(), salt).decode()
+    password_hash = await run_cpu(bcrypt.hashpw, payload.password.encode(), salt)
+    password_hash = password_hash.decode()
     first_name = payload.email.split("@")[0]
     new_user_doc = User(
         first_name=first_name,
@@ -85,7 +87,12 @@ async def login_user(payload: LoginUserPayload, db: AsyncSession = Depends(get_d
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "invalid credentials")
 
     user_uid, user_email, password_hash = row.tuple()
-    if not bcrypt.checkpw(payload.password.encode(), password_hash.encode()):
+    password_matches = await run_cpu(
+        bcrypt.checkpw,
+        payload.password.encode(),
+        password_hash.encode(),
+    )
+    if not password_matches:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "invalid credentials")
 
     token = jwt_utils.generate_token(
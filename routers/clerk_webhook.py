@@ -6,6 +6,7 @@ from fastapi import APIRouter, Depends, Request, Response, status
 from sqlalchemy import select
 
 from modules.transaction.dto import CreateTransactionRequest
+from shared.auth_middleware import auth_user_cache, invalidate_auth_user
 from shared.database import AsyncSession, get_db
 from shared.models.user import Subscription, User
 from shared.discord_webhook import send_discord_webhook_message
@@ -31,6 +32,8 @@ async def clerk_auth_webhook(
     event_data = body["data"]
 
     webhook_message = ""
+    # cached principals to drop once the change is committed
+    stale_source_ids = []
 
     match event_type:
         case "user.created":
@@ -84,6 +87,9 @@ async def clerk_auth_webhook(
             result = await db.execute(user_query)
             user_doc = result.scalar_one_or_none()
             if user_doc:
+                stale_source_ids = [user_doc.source_id, event_data["id"]]
+                await invalidate_auth_user(db, *stale_source_ids)
+
                 user_doc.first_name = event_data["first_name"]
                 user_doc.last_name = event_data["last_name"]
                 user_doc.email = primary_email
@@ -97,12 +103,18 @@ async def clerk_auth_webhook(
             result = await db.execute(user_query)
             user_doc = result.scalar_one_or_none()
             if user_doc and deleted:
+                stale_source_ids = [user_doc.source_id]
+                await invalidate_auth_user(db, *stale_source_ids)
+
                 user_doc.deleted_at = datetime.now()
                 webhook_message = f"User Deleted with email `{user_doc.email}` and user_id `{user_doc.source_id}`"
                 print("User Deleted", user_doc, event_data)
 
     await db.commit()
 
+    for source_id in stale_source_ids:
+        auth_user_cache.invalidate(source_id)
+
     await send_discord_webhook_message(webhook_message, "Kahani (Clerk)")
 
     res.status_code = status.HTTP_200_OK
@@ -0,0 +1,17 @@
+from typing import Any
+from pydantic import BaseModel, Field, field_validator
+
+
+class UpdateDialoguePayload(BaseModel):
+    speaker: str | None = Field(default=None)
+    text: str | None = Field(default=None)
+    voice_config: dict[str, Any] | None = Field(default=None)
+
+    @field_validator("speaker", "text")
+    def validate_not_blank(cls, v):
+        # leave the field out to keep it, both columns are required
+        if v is None:
+            raise ValueError("should not be null")
+        if v.strip():
+            return v
+        raise ValueError("should not be empty")
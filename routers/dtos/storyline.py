@@ -4,3 +4,5 @@ from pydantic import BaseModel
 class StorylineRequestPayload(BaseModel):
     user_input: str
     language: str
+    # skip the completion cache and ask the LLM for a new take
+    fresh: bool = False
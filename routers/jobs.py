@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from modules.jobs.service import get_story_job
+from shared.auth_middleware import AuthUser, get_current_user
+from shared.database import get_db
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+@router.get("/{job_id}", description="Get the stage, progress and result of a job.")
+async def get_job_status(
+    job_id: str,
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    job = await get_story_job(db, job_id)
+    if job is None or job.pop("user_id") != current_user.uid:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "job not found")
+
+    return job
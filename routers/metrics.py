@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from shared.auth_middleware import AuthUser, get_current_user
+from shared.query_metrics import query_metrics
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+def check_superadmin(current_user: AuthUser):
+    if current_user.role != "superadmin":
+        raise HTTPException(status.HTTP_403_FORBIDDEN)
+
+
+@router.get(
+    "/queries",
+    description="Latency of the database queries of this worker, per statement fingerprint, most total time first.",
+)
+async def get_query_metrics(
+    limit: int = 50,
+    current_user: AuthUser = Depends(get_current_user),
+):
+    check_superadmin(current_user)
+
+    return query_metrics.snapshot(limit)
+
+
+@router.delete(
+    "/queries",
+    description="Reset the query metrics of this worker.",
+)
+async def reset_query_metrics(current_user: AuthUser = Depends(get_current_user)):
+    check_superadmin(current_user)
+
+    query_metrics.reset()
+    return {"message": "Query metrics reset"}
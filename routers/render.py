@@ -0,0 +1,173 @@
+import logging
+from typing import Callable
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from modules.jobs.service import Job, submit_story_job
+from modules.script.dialogues import add_script, segment_recorder
+from modules.script.service import (
+    SCRIPT_MODE,
+    check_script_mode,
+    load_script_inputs,
+    script_stream_for_mode,
+)
+from modules.transaction.dto import (
+    CREDIT_NEEDS,
+    CreateTransactionRequest,
+    CreditReservation,
+)
+from modules.transaction.service import (
+    reserve_credits,
+    settle_credits,
+    settle_or_release,
+)
+from modules.voice.renditions import schedule_audio_renditions
+from modules.voice.service import generate_voice_for_dialogue_stream
+from shared.auth_middleware import AuthUser, get_current_user
+from shared.database import AsyncSessionLocal, get_db, AsyncSession
+from shared.language_codes import LANGUAGE_CODES
+
+router = APIRouter(prefix="/render", tags=["Render"])
+logger = logging.getLogger("render.api")
+
+
+async def run_render_generation(
+    db: AsyncSession,
+    story_id: str,
+    current_user: AuthUser,
+    reservation: CreditReservation,
+    fresh: bool = False,
+    on_progress: Callable[[int, int], None] | None = None,
+    mode: str = SCRIPT_MODE,
+):
+    """
+    Create the Script and the Voice of the story in one go, the voice workers are
+    fed with the dialogues while the script is still being generated. Nothing is
+    stored or charged unless both succeed.
+    """
+
+    story_record, story_outline, persona, language = await load_script_inputs(
+        db, story_id, current_user.uid
+    )
+    if language not in LANGUAGE_CODES:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "unknown value for 'language'")
+
+    segments, on_segment = segment_recorder()
+    script, voice_path = await generate_voice_for_dialogue_stream(
+        script_stream_for_mode(
+            story_outline,
+            persona,
+            language,
+            mode=mode,
+            use_cache=not fresh,
+        ),
+        persona,
+        language,
+        on_progress=on_progress,
+        on_segment=on_segment,
+    )
+
+    add_script(db, current_user.uid, story_record.id, script, segments)
+
+    story_record.audio_src = voice_path
+    story_record.audio_renditions = None
+    story_record.status = "completed"
+    await settle_credits(
+        db,
+        reservation,
+        [
+            CreateTransactionRequest(
+                user_id=current_user.uid,
+                amount=CREDIT_NEEDS.NARRATIVE,
+                remarks="Story Narrative creation",
+                transaction_ref=story_id,
+            ),
+            CreateTransactionRequest(
+                user_id=current_user.uid,
+                amount=CREDIT_NEEDS.VOICE,
+                remarks="Story Voice creation",
+                transaction_ref=story_id,
+            ),
+        ],
+    )
+
+    schedule_audio_renditions(story_record.id, voice_path)
+
+    return {
+        "script": script,
+        "audio_path": voice_path,
+        "story_id": story_id,
+    }
+
+
+async def reserve_render_credits(db: AsyncSession, current_user: AuthUser):
+    return await reserve_credits(
+        db,
+        current_user.uid,
+        CREDIT_NEEDS.NARRATIVE,
+        CREDIT_NEEDS.VOICE,
+    )
+
+
+@router.get(
+    "/{story_id}",
+    description="Create the Script and the Voice of the story, synthesizing the dialogues while the script is being written.",
+)
+async def request_render_for_story(
+    story_id: str,
+    fresh: bool = False,
+    mode: str = SCRIPT_MODE,
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    check_script_mode(mode)
+
+    reservation = await reserve_render_credits(db, current_user)
+    async with settle_or_release(db, reservation):
+        return await run_render_generation(
+            db,
+            story_id,
+            current_user,
+            reservation,
+            fresh,
+            mode=mode,
+        )
+
+
+@router.post(
+    "/{story_id}/job",
+    status_code=status.HTTP_202_ACCEPTED,
+    description="Submit a background job creating the Script and the Voice of the story. Poll '/jobs/{job_id}' for its progress.",
+)
+async def submit_render_job(
+    story_id: str,
+    fresh: bool = False,
+    mode: str = SCRIPT_MODE,
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    check_script_mode(mode)
+
+    # held from now on, so that queued jobs can not spend the same credits
+    reservation = await reserve_render_credits(db, current_user)
+
+    async def render_job(job: Job):
+        job.stage = "rendering"
+        async with (
+            AsyncSessionLocal() as session,
+            settle_or_release(session, reservation),
+        ):
+            return await run_render_generation(
+                session,
+                story_id,
+                current_user,
+                reservation,
+                fresh,
+                on_progress=job.set_progress,
+                mode=mode,
+            )
+
+    job = await submit_story_job(
+        db, "render", story_id, current_user.uid, render_job, reservation=reservation
+    )
+
+    return {"job_id": job.id, "story_id": story_id, "status": job.status}
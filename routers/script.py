@@ -1,19 +1,30 @@
 import logging
-from operator import and_
-import uuid
+from typing import Callable
 from fastapi import APIRouter, Depends, HTTPException, Request, status
-from sqlalchemy import select
 
-from modules.script.service import generate_script
-from modules.transaction.dto import CREDIT_NEEDS, CreateTransactionRequest
+from modules.jobs.service import Job, submit_story_job
+from modules.script.dialogues import add_script, dialogue_dict, get_script_dialogue
+from modules.script.service import (
+    SCRIPT_MODE,
+    check_script_mode,
+    generate_script,
+    load_script_inputs,
+    script_stream_for_mode,
+)
+from modules.story.service import load_story_context
+from modules.transaction.dto import (
+    CREDIT_NEEDS,
+    CreateTransactionRequest,
+    CreditReservation,
+)
 from modules.transaction.service import (
-    get_available_credits,
-    update_credits_with_transaction,
+    reserve_credits,
+    settle_credits,
+    settle_or_release,
 )
+from routers.dtos.script import UpdateDialoguePayload
 from shared.auth_middleware import AuthUser, get_current_user
-from shared.database import get_db, AsyncSession
-from shared.models.story import Script, Story, Storyline
-from shared.utils import clean_keys_from_dict
+from shared.database import AsyncSessionLocal, get_db, AsyncSession
 
 router = APIRouter(prefix="/script", tags=["Script"])
 logger = logging.getLogger("script.api")
@@ -24,7 +35,13 @@ logger = logging.getLogger("script.api")
     description="Create Script with given 'story_outline', 'persona' and 'language'.",
     deprecated=True,
 )
-async def request_script_generation(req: Request):
+async def request_script_generation(
+    req: Request,
+    fresh: bool = False,
+    mode: str = SCRIPT_MODE,
+):
+    check_script_mode(mode)
+
     body = await req.json()
 
     if not body:
@@ -43,97 +60,168 @@ async def request_script_generation(req: Request):
     if not language:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "'language' is required")
 
-    script = await generate_script(story_outline, persona, language)
+    script = await generate_script(
+        story_outline,
+        persona,
+        language,
+        use_cache=not fresh,
+        mode=mode,
+    )
 
     return {"script": script}
 
 
+async def run_script_generation(
+    db: AsyncSession,
+    story_id: str,
+    current_user: AuthUser,
+    reservation: CreditReservation,
+    fresh: bool = False,
+    on_progress: Callable[[int, int], None] | None = None,
+    mode: str = SCRIPT_MODE,
+):
+    story_record, story_outline, persona, language = await load_script_inputs(
+        db, story_id, current_user.uid
+    )
+
+    script = []
+    async for dialogue in script_stream_for_mode(
+        story_outline,
+        persona,
+        language,
+        mode=mode,
+        use_cache=not fresh,
+    ):
+        script.append(dialogue)
+        if on_progress:
+            # the number of dialogues is only known once the script is complete
+            on_progress(len(script), 0)
+
+    if not script:
+        raise HTTPException(
+            status.HTTP_500_INTERNAL_SERVER_ERROR, "failed to generate script"
+        )
+
+    add_script(db, current_user.uid, story_record.id, script)
+
+    story_record.status = "draft:script"
+
+    await settle_credits(
+        db,
+        reservation,
+        [
+            CreateTransactionRequest(
+                user_id=current_user.uid,
+                amount=CREDIT_NEEDS.NARRATIVE,
+                remarks="Story Narrative creation",
+                transaction_ref=story_id,
+            ),
+        ],
+    )
+
+    return {
+        "script": script,
+        "story_id": story_id,
+    }
+
+
 @router.get(
     "/{story_id}",
     description="Create Script with given 'story_outline', 'persona' and 'language'.",
 )
 async def request_script_generation_for_story(
     story_id: str,
+    fresh: bool = False,
+    mode: str = SCRIPT_MODE,
     current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    available_credits = await get_available_credits(db, current_user.uid)
-    if available_credits < CREDIT_NEEDS.NARRATIVE:
-        raise HTTPException(status.HTTP_402_PAYMENT_REQUIRED, "insufficient credits")
-
-    story_uuid = uuid.UUID(hex=story_id)
-    storyline_query = (
-        select(Storyline)
-        .where(
-            and_(
-                Storyline.story_id == story_uuid,
-                Storyline.creator_id == current_user.uid,
-            )
+    check_script_mode(mode)
+
+    reservation = await reserve_credits(db, current_user.uid, CREDIT_NEEDS.NARRATIVE)
+    async with settle_or_release(db, reservation):
+        return await run_script_generation(
+            db,
+            story_id,
+            current_user,
+            reservation,
+            fresh,
+            mode=mode,
         )
-        .limit(1)
-    )
-    storyline_result = await db.execute(storyline_query)
-
-    storyline_row = storyline_result.first()
-    if not storyline_row:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "no storyline found for story")
-
-    story_query = select(Story).where(Story.id == story_uuid).limit(1)
-    story_record = (await db.execute(story_query)).scalar_one_or_none()
-    if not story_record:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "no story found for id")
-
-    storyline_doc = storyline_row.tuple()[0]
-
-    storyline_dict = {
-        "plot_outline": storyline_doc.plot_outline,
-        "characters": storyline_doc.characters,
-        "theme": storyline_doc.theme,
-        "mood": storyline_doc.mood,
-        "setting": storyline_doc.setting,
-        "moral": storyline_doc.tone,
-        "conflict": storyline_doc.conflict,
-        "resolution": storyline_doc.resolution,
-        "style": storyline_doc.style,
-    }
 
-    story_outline = clean_keys_from_dict(storyline_dict)
-    if len(story_outline) == 0:
-        raise HTTPException(
-            status.HTTP_400_BAD_REQUEST, "invalid or empty story outline"
-        )
 
-    persona = storyline_doc.character_personas
-    if not persona:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "invalid or empty persona")
+@router.post(
+    "/{story_id}/job",
+    status_code=status.HTTP_202_ACCEPTED,
+    description="Submit a background job creating the Script of the story. Poll '/jobs/{job_id}' for its progress.",
+)
+async def submit_script_generation_job(
+    story_id: str,
+    fresh: bool = False,
+    mode: str = SCRIPT_MODE,
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    check_script_mode(mode)
+
+    # held from now on, so that queued jobs can not spend the same credits
+    reservation = await reserve_credits(db, current_user.uid, CREDIT_NEEDS.NARRATIVE)
+
+    async def script_job(job: Job):
+        job.stage = "generating_script"
+        async with (
+            AsyncSessionLocal() as session,
+            settle_or_release(session, reservation),
+        ):
+            return await run_script_generation(
+                session,
+                story_id,
+                current_user,
+                reservation,
+                fresh,
+                on_progress=job.set_progress,
+                mode=mode,
+            )
 
-    language = story_record.language
-    if not language:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "invalid or empty language")
+    job = await submit_story_job(
+        db, "script", story_id, current_user.uid, script_job, reservation=reservation
+    )
 
-    script = await generate_script(story_outline, persona, language)
+    return {"job_id": job.id, "story_id": story_id, "status": job.status}
 
-    script_doc = Script(
-        creator_id=current_user.uid,
-        story_id=story_record.id,
-        dialogues=script,
+
+@router.patch(
+    "/{story_id}/dialogues/{line_index}",
+    description="Update a single line of the Script of the story. The voice has to be created again to include it.",
+)
+async def update_script_dialogue(
+    story_id: str,
+    line_index: int,
+    payload: UpdateDialoguePayload,
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    context = await load_story_context(
+        db,
+        story_id,
+        current_user.uid,
+        with_script=True,
     )
-    db.add(script_doc)
+    if not context.script:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "no script record found")
 
-    story_record.status = "draft:script"
+    dialogue_row = await get_script_dialogue(db, context.script, line_index)
+    if not dialogue_row:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "no dialogue found at index")
+
+    changes = payload.model_dump(exclude_unset=True)
+    for key, value in changes.items():
+        setattr(dialogue_row, key, value)
 
     await db.commit()
-    await update_credits_with_transaction(
-        db,
-        CreateTransactionRequest(
-            user_id=current_user.uid,
-            amount=CREDIT_NEEDS.NARRATIVE,
-            remarks="Story Narrative creation",
-            transaction_ref=story_id,
-        ),
-    )
 
     return {
-        "script": script,
         "story_id": story_id,
+        "line_index": line_index,
+        "dialogue": dialogue_dict(dialogue_row),
     }
@@ -5,36 +5,51 @@ from operator import and_
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy import select, func
 
+from modules.jobs.service import list_story_jobs
 from routers.dtos.story import UpdateStoryPayload
 from shared.auth_middleware import AuthUser, get_current_user
-from shared.database import get_db, AsyncSession
+from shared.database import get_db, get_read_db, AsyncSession
 from shared.models.story import Story
 from shared.models.user import User
-from shared.pagination import Pagination, get_pagination
+from shared.pagination import (
+    Pagination,
+    get_pagination,
+    paginate_query,
+    split_page,
+)
 
 router = APIRouter(prefix="/story", tags=["Story"])
 
 
-@router.get("/library")
-async def list_public_stories(
-    db: AsyncSession = Depends(get_db),
-    pagination: Pagination = Depends(get_pagination),
-):
-    page_count_query = select(func.count(Story.id)).where(
-        and_(
-            Story.visibility == "public",
-            Story.deleted_at.is_(None),
-        )
-    )
+async def count_pages(db: AsyncSession, pagination: Pagination, condition) -> int:
+    page_count_query = select(func.count(Story.id)).where(condition)
     page_count = (await db.execute(page_count_query)).scalar_one_or_none()
-
     if page_count is None:
         raise HTTPException(
             status.HTTP_500_INTERNAL_SERVER_ERROR,
             "failed to get total count for the query",
         )
 
-    query = (
+    return math.ceil(page_count / pagination.limit)
+
+
+@router.get("/library")
+async def list_public_stories(
+    db: AsyncSession = Depends(get_read_db),
+    pagination: Pagination = Depends(get_pagination),
+):
+    total_pages = None
+    if pagination.with_count:
+        total_pages = await count_pages(
+            db,
+            pagination,
+            and_(
+                Story.visibility == "public",
+                Story.deleted_at.is_(None),
+            ),
+        )
+
+    query = paginate_query(
         select(Story, User.first_name, User.last_name)
         .where(
             and_(
@@ -42,14 +57,18 @@ async def list_public_stories(
                 Story.deleted_at.is_(None),
             )
         )
-        .join(User, Story.creator_id == User.id)
-        .order_by(Story.created_at.desc())
-        .offset((pagination.page - 1) * pagination.limit)
-        .limit(pagination.limit)
+        .join(User, Story.creator_id == User.id),
+        pagination,
+        Story.created_at,
+        Story.id,
     )
     result = await db.execute(query)
 
-    story_seq = result.all()
+    story_seq, next_cursor = split_page(
+        result.all(),
+        pagination,
+        key=lambda rec: rec.tuple()[0],
+    )
 
     # story_list = [story.tuple()[0] for story in story_seq]
     story_list = []
@@ -60,49 +79,85 @@ async def list_public_stories(
 
     return {
         "stories": story_list,
-        "total_pages": math.ceil(page_count / pagination.limit),
+        "total_pages": total_pages,
+        "next_cursor": next_cursor,
     }
 
 
 @router.get("/list")
 async def list_stories_for_user(
     current_user: AuthUser = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     pagination: Pagination = Depends(get_pagination),
 ):
-    page_count_query = select(func.count(Story.id)).where(
-        and_(
-            Story.creator_id == current_user.uid,
-            Story.deleted_at.is_(None),
-        )
-    )
-    page_count = (await db.execute(page_count_query)).scalar_one_or_none()
-    if page_count is None:
-        raise HTTPException(
-            status.HTTP_500_INTERNAL_SERVER_ERROR,
-            "failed to get total count for the query",
+    total_pages = None
+    if pagination.with_count:
+        total_pages = await count_pages(
+            db,
+            pagination,
+            and_(
+                Story.creator_id == current_user.uid,
+                Story.deleted_at.is_(None),
+            ),
         )
 
-    query = (
-        select(Story)
-        .where(
+    query = paginate_query(
+        select(Story).where(
             and_(
                 Story.creator_id == current_user.uid,
                 Story.deleted_at.is_(None),
             )
-        )
-        .order_by(Story.created_at)
-        .offset((pagination.page - 1) * pagination.limit)
-        .limit(pagination.limit)
+        ),
+        pagination,
+        Story.created_at,
+        Story.id,
+        descending=False,
     )
     result = await db.execute(query)
     story_seq = result.all()
 
     story_list = [story.tuple()[0] for story in story_seq]
+    story_list, next_cursor = split_page(story_list, pagination)
 
     return {
         "stories": story_list,
-        "total_pages": math.ceil(page_count / pagination.limit),
+        "total_pages": total_pages,
+        "next_cursor": next_cursor,
+    }
+
+
+@router.get("/{story_id}/status")
+async def get_story_status(
+    story_id: str,
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    story_uuid = uuid.UUID(hex=story_id)
+    query = (
+        select(Story.status)
+        .where(
+            and_(
+                Story.id == story_uuid,
+                and_(
+                    Story.creator_id == current_user.uid,
+                    Story.deleted_at.is_(None),
+                ),
+            ),
+        )
+        .limit(1)
+    )
+
+    result = await db.execute(query)
+    story_status = result.scalar_one_or_none()
+    if story_status is None:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "invalid story id")
+
+    jobs = await list_story_jobs(db, story_uuid)
+
+    return {
+        "story_id": story_id,
+        "status": story_status,
+        "jobs": jobs,
     }
 
 
@@ -140,8 +195,10 @@ async def update_story_information(
     if payload.description:
         story_doc.description = payload.description
 
-    if payload.image_src:
+    if payload.image_src and payload.image_src != story_doc.image_src:
         story_doc.image_src = payload.image_src
+        # the variants were made from the previous poster
+        story_doc.image_variants = None
 
     if payload.visibility:
         story_doc.visibility = payload.visibility
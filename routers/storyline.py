@@ -4,11 +4,17 @@ from typing import Annotated
 import uuid
 from fastapi import APIRouter, Body, Depends, HTTPException, status
 
-from modules.transaction.dto import CREDIT_NEEDS, CreateTransactionRequest
+from modules.transaction.dto import (
+    CREDIT_NEEDS,
+    CreateTransactionRequest,
+    CreditReservation,
+)
 from modules.transaction.service import (
-    get_available_credits,
-    update_credits_with_transaction,
+    reserve_credits,
+    settle_credits,
+    settle_or_release,
 )
+from modules.metadata.posters import POSTER_PATH, schedule_poster_variants
 from modules.metadata.service import (
     generate_image_for_story,
     generate_metadata_for_storyline,
@@ -35,11 +41,28 @@ async def request_storyline_generation(
     if not payload.user_input:
         raise HTTPException(status.HTTP_400_BAD_REQUEST)
 
-    available_credits = await get_available_credits(db, current_user.uid)
-    if available_credits < CREDIT_NEEDS.OVERALL:
-        raise HTTPException(status.HTTP_402_PAYMENT_REQUIRED, "insufficient credits")
+    # a storyline is only worth starting with the credits for the whole story
+    reservation = await reserve_credits(
+        db,
+        current_user.uid,
+        CREDIT_NEEDS.STORYLINE,
+        CREDIT_NEEDS.METADATA,
+        require=CREDIT_NEEDS.OVERALL,
+    )
+    async with settle_or_release(db, reservation):
+        return await create_storyline(db, payload, current_user, reservation)
+
 
-    storyline = await generate_story_outline(payload.user_input)
+async def create_storyline(
+    db: AsyncSession,
+    payload: StorylineRequestPayload,
+    current_user: AuthUser,
+    reservation: CreditReservation,
+):
+    storyline = await generate_story_outline(
+        payload.user_input,
+        use_cache=not payload.fresh,
+    )
 
     story = Story(
         id=uuid.uuid4(),
@@ -73,12 +96,11 @@ async def request_storyline_generation(
         generate_metadata_for_storyline(storyline, payload.language)
     )
 
-    image_save_path = "./public/posters"
     story_image_task = asyncio.create_task(
         generate_image_for_story(
             storyline.get("plot_outline", ""),
             storyline.get("setting", ""),
-            f"{image_save_path}/{story.id}.jpg",
+            f"{POSTER_PATH}/{story.id}.jpg",
         )
     )
 
@@ -98,27 +120,27 @@ async def request_storyline_generation(
             story.description = resp.description
 
     db.add_all([story, storyline_doc])
-    await db.commit()
-
-    await update_credits_with_transaction(
-        db,
-        CreateTransactionRequest(
-            user_id=current_user.uid,
-            amount=CREDIT_NEEDS.STORYLINE,
-            remarks="Storyline creation",
-            transaction_ref=str(story.id),
-        ),
-    )
-    await update_credits_with_transaction(
+    await settle_credits(
         db,
-        CreateTransactionRequest(
-            user_id=current_user.uid,
-            amount=CREDIT_NEEDS.METADATA,
-            remarks="Story metadata creation",
-            transaction_ref=str(story.id),
-        ),
+        reservation,
+        [
+            CreateTransactionRequest(
+                user_id=current_user.uid,
+                amount=CREDIT_NEEDS.STORYLINE,
+                remarks="Storyline creation",
+                transaction_ref=str(story.id),
+            ),
+            CreateTransactionRequest(
+                user_id=current_user.uid,
+                amount=CREDIT_NEEDS.METADATA,
+                remarks="Story metadata creation",
+                transaction_ref=str(story.id),
+            ),
+        ],
     )
 
+    schedule_poster_variants(story.id, story.image_src)
+
     return {
         "story_id": story.id,
         "storyline": storyline,
@@ -7,7 +7,7 @@ from modules.transaction.service import list_paginated_transactions
 from shared.models.user import Subscription
 from shared.pagination import Pagination, get_pagination
 from shared.auth_middleware import AuthUser, get_current_user
-from shared.database import AsyncSession, get_db
+from shared.database import AsyncSession, get_db, get_read_db
 
 router = APIRouter(prefix="/transactions", tags=["Transactions"])
 
@@ -16,11 +16,16 @@ router = APIRouter(prefix="/transactions", tags=["Transactions"])
 async def list_transactions(
     pagination: Pagination = Depends(get_pagination),
     current_user: AuthUser = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
-    txns = await list_paginated_transactions(db, pagination, current_user.uid)
+    txns, next_cursor = await list_paginated_transactions(
+        db,
+        pagination,
+        current_user.uid,
+    )
     return {
         "transactions": txns,
+        "next_cursor": next_cursor,
     }
 
 
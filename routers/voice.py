@@ -1,19 +1,41 @@
 import logging
-from operator import and_
-import uuid
+import secrets
+from typing import Callable
 from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select
 
-from modules.transaction.dto import CREDIT_NEEDS, CreateTransactionRequest
+from modules.jobs.service import Job, submit_story_job
+from modules.script.dialogues import (
+    dialogue_dict,
+    load_script_dialogues,
+    record_voiced_segments,
+    segment_recorder,
+    stale_line_indices,
+)
+from modules.story.service import load_story_context
+from modules.transaction.dto import (
+    CREDIT_NEEDS,
+    CreateTransactionRequest,
+    CreditReservation,
+)
 from modules.transaction.service import (
     get_available_credits,
-    update_credits_with_transaction,
+    reserve_credits,
+    settle_credits,
+    settle_or_release,
+)
+from modules.voice.renditions import schedule_audio_renditions
+from modules.voice.service import (
+    compiled_audio_path,
+    generate_voice_for_script,
+    plan_segment_keys,
+    stream_voice_for_script,
 )
-from modules.voice.service import generate_voice_for_script
 from shared.auth_middleware import AuthUser, get_current_user
-from shared.database import get_db, AsyncSession
+from shared.database import AsyncSessionLocal, get_db, AsyncSession
 from shared.language_codes import LANGUAGE_CODES
-from shared.models.story import Script, Story, Storyline
+from shared.models.story import Story
 
 router = APIRouter(prefix="/voice", tags=["Voice"])
 logger = logging.getLogger("voice.api")
@@ -53,78 +75,198 @@ async def request_voice_generation(req: Request):
     return {"audio_path": voice_path}
 
 
-@router.get(
-    "/{story_id}",
-    description="Create Voice with given 'script', 'persona' and 'language'.",
-)
-async def request_voice_generation_by_story(
-    story_id: str,
-    current_user: AuthUser = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
-):
-    available_credits = await get_available_credits(db, current_user.uid)
-    if available_credits < CREDIT_NEEDS.VOICE:
-        raise HTTPException(status.HTTP_402_PAYMENT_REQUIRED, "insufficient credits")
-
-    story_uuid = uuid.UUID(hex=story_id)
-    storyline_query = (
-        select(Storyline)
-        .where(
-            and_(
-                Storyline.story_id == story_uuid,
-                Storyline.creator_id == current_user.uid,
-            )
-        )
-        .limit(1)
+async def load_voice_inputs(db: AsyncSession, story_id: str, current_user: AuthUser):
+    context = await load_story_context(
+        db,
+        story_id,
+        current_user.uid,
+        with_script=True,
     )
-    storyline_result = await db.execute(storyline_query)
-
-    storyline_doc = storyline_result.scalar_one_or_none()
-    if not storyline_doc:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "no storyline found for story")
-
-    story_query = select(Story).where(Story.id == story_uuid).limit(1)
-    result = await db.execute(story_query)
-    story_record = result.scalar_one_or_none()
-    if not story_record:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "no story record found")
-
-    script_query = select(Script).where(Script.story_id == story_uuid).limit(1)
-    result = await db.execute(script_query)
-    script_record = result.scalar_one_or_none()
-    if not script_record:
+
+    if not context.script:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "no script record found")
 
-    script = script_record.dialogues
-    if not script:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "no script dialogues found")
-    if not isinstance(script, list):
+    dialogue_rows = await load_script_dialogues(db, context.script)
+    if not dialogue_rows:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "no script dialogues found")
+    script = [dialogue_dict(row) for row in dialogue_rows]
 
-    persona = storyline_doc.character_personas
+    persona = context.persona
     if not persona:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "no character persona found")
 
-    language = story_record.language
+    language = context.language
     if not language:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "no language found")
     if language not in LANGUAGE_CODES:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "unknown value for 'language'")
 
-    voice_path = await generate_voice_for_script(script, persona, language)
+    # planning the segments is a pass over the whole script, only for the logs
+    if logger.isEnabledFor(logging.DEBUG):
+        stale_lines = stale_line_indices(
+            dialogue_rows,
+            plan_segment_keys(script, persona, language),
+        )
+        logger.debug(
+            "voicing story %s: %d/%d lines changed since they were last voiced",
+            story_id,
+            len(stale_lines),
+            len(dialogue_rows),
+        )
+
+    return context.story, dialogue_rows, script, persona, language
+
+
+async def run_voice_generation(
+    db: AsyncSession,
+    story_id: str,
+    current_user: AuthUser,
+    reservation: CreditReservation,
+    on_progress: Callable[[int, int], None] | None = None,
+):
+    story_record, dialogue_rows, script, persona, language = await load_voice_inputs(
+        db, story_id, current_user
+    )
 
+    segments, on_segment = segment_recorder([row.line_index for row in dialogue_rows])
+    voice_path = await generate_voice_for_script(
+        script,
+        persona,
+        language,
+        on_progress=on_progress,
+        on_segment=on_segment,
+    )
+
+    await record_voiced_segments(db, dialogue_rows, segments)
     story_record.audio_src = voice_path
+    story_record.audio_renditions = None
     story_record.status = "completed"
-    await db.commit()
-
-    await update_credits_with_transaction(
+    await settle_credits(
         db,
-        CreateTransactionRequest(
-            user_id=current_user.uid,
-            amount=CREDIT_NEEDS.VOICE,
-            remarks="Story Voice creation",
-            transaction_ref=story_id,
-        ),
+        reservation,
+        [
+            CreateTransactionRequest(
+                user_id=current_user.uid,
+                amount=CREDIT_NEEDS.VOICE,
+                remarks="Story Voice creation",
+                transaction_ref=story_id,
+            ),
+        ],
     )
 
+    schedule_audio_renditions(story_record.id, voice_path)
+
     return {"audio_path": voice_path}
+
+
+@router.get(
+    "/{story_id}",
+    description="Create Voice with given 'script', 'persona' and 'language'.",
+)
+async def request_voice_generation_by_story(
+    story_id: str,
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    reservation = await reserve_credits(db, current_user.uid, CREDIT_NEEDS.VOICE)
+    async with settle_or_release(db, reservation):
+        return await run_voice_generation(db, story_id, current_user, reservation)
+
+
+@router.post(
+    "/{story_id}/job",
+    status_code=status.HTTP_202_ACCEPTED,
+    description="Submit a background job creating the Voice of the story. Poll '/jobs/{job_id}' for its progress.",
+)
+async def submit_voice_generation_job(
+    story_id: str,
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    # held from now on, so that queued jobs can not spend the same credits
+    reservation = await reserve_credits(db, current_user.uid, CREDIT_NEEDS.VOICE)
+
+    async def voice_job(job: Job):
+        job.stage = "synthesizing_voice"
+        async with (
+            AsyncSessionLocal() as session,
+            settle_or_release(session, reservation),
+        ):
+            return await run_voice_generation(
+                session,
+                story_id,
+                current_user,
+                reservation,
+                on_progress=job.set_progress,
+            )
+
+    job = await submit_story_job(
+        db, "voice", story_id, current_user.uid, voice_job, reservation=reservation
+    )
+
+    return {"job_id": job.id, "story_id": story_id, "status": job.status}
+
+
+@router.get(
+    "/{story_id}/stream",
+    description="Create Voice for the story and stream it as a WAV while it is being generated.",
+)
+async def stream_voice_generation_by_story(
+    story_id: str,
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    story_record, dialogue_rows, script, persona, language = await load_voice_inputs(
+        db, story_id, current_user
+    )
+    story_uuid = story_record.id
+    segments, on_segment = segment_recorder([row.line_index for row in dialogue_rows])
+
+    # a hint only, so that the usual case gets a 402 instead of a broken stream. The
+    # stream reserves the credits itself: its body may never be iterated (e.g. the
+    # client is gone) and nothing would release a reservation made here.
+    if await get_available_credits(db, current_user.uid) < -CREDIT_NEEDS.VOICE:
+        raise HTTPException(status.HTTP_402_PAYMENT_REQUIRED, "insufficient credits")
+
+    req_id = secrets.token_hex(8)
+    voice_path = compiled_audio_path(req_id).strip(".")
+
+    async def audio_stream():
+        # the request session is gone by the time the stream ends, use our own
+        async with AsyncSessionLocal() as session:
+            reservation = await reserve_credits(
+                session, current_user.uid, CREDIT_NEEDS.VOICE
+            )
+            async with settle_or_release(session, reservation):
+                async for chunk in stream_voice_for_script(
+                    script, persona, language, req_id, on_segment
+                ):
+                    yield chunk
+
+                await record_voiced_segments(session, dialogue_rows, segments)
+
+                story_query = select(Story).where(Story.id == story_uuid).limit(1)
+                story_doc = (await session.execute(story_query)).scalar_one()
+                story_doc.audio_src = voice_path
+                story_doc.audio_renditions = None
+                story_doc.status = "completed"
+                await settle_credits(
+                    session,
+                    reservation,
+                    [
+                        CreateTransactionRequest(
+                            user_id=current_user.uid,
+                            amount=CREDIT_NEEDS.VOICE,
+                            remarks="Story Voice creation",
+                            transaction_ref=story_id,
+                        ),
+                    ],
+                )
+
+        schedule_audio_renditions(story_uuid, voice_path)
+
+    return StreamingResponse(
+        audio_stream(),
+        media_type="audio/wav",
+        headers={"X-Audio-Path": voice_path},
+    )
@@ -1,12 +1,30 @@
+import asyncio
 from base64 import b64decode
+from collections import OrderedDict
+import os
+import time
 import uuid
 from fastapi import Depends, HTTPException, Header, status
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import and_, select, text
 
-from shared.database import get_db, AsyncSession
+from shared.database import engine, get_db, AsyncSession
 from shared.models import User
 
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+# invalidate the caches of every worker through Postgres LISTEN/NOTIFY
+AUTH_CACHE_NOTIFY = os.getenv("AUTH_CACHE_NOTIFY", "false").lower() == "true"
+AUTH_CACHE_CHANNEL = "auth_cache_invalidate"
+# the LISTEN connection is checked that often, and re-opened after that delay when
+# it dropped
+AUTH_CACHE_LISTEN_CHECK_SECONDS = float(
+    os.getenv("AUTH_CACHE_LISTEN_CHECK_SECONDS", "30")
+)
+AUTH_CACHE_LISTEN_RETRY_SECONDS = float(
+    os.getenv("AUTH_CACHE_LISTEN_RETRY_SECONDS", "5")
+)
+
 
 class AuthUser(BaseModel):
     uid: uuid.UUID
@@ -18,6 +36,182 @@ class AuthUser(BaseModel):
         return self.uid != ""
 
 
+class AuthUserCache:
+    """
+    In-process LRU of source_id -> AuthUser, entries expire after `ttl` seconds so
+    that changes made outside of the Clerk webhook (e.g. roles) are picked up.
+    Only known users are cached.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, AuthUser]] = OrderedDict()
+
+    def get(self, source_id: str) -> AuthUser | None:
+        entry = self._entries.get(source_id)
+        if entry is None:
+            return None
+
+        expires_at, auth_user = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[source_id]
+            return None
+
+        self._entries.move_to_end(source_id)
+        return auth_user
+
+    def put(self, source_id: str, auth_user: AuthUser):
+        if self.ttl <= 0:
+            return
+
+        self._entries[source_id] = (time.monotonic() + self.ttl, auth_user)
+        self._entries.move_to_end(source_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, source_id: str):
+        self._entries.pop(source_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+auth_user_cache = AuthUserCache(AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAX_ENTRIES)
+
+# connection kept open for LISTEN while the app runs, and the task re-opening it
+_listener_connection = None
+_listener_task: asyncio.Task | None = None
+_listener_lost = asyncio.Event()
+
+
+async def invalidate_auth_user(db: AsyncSession, *source_ids: str | None):
+    """
+    Drop users from the auth cache. With AUTH_CACHE_NOTIFY the other workers are
+    told as well, the notification is sent when `db` commits.
+    Call it before committing the change, and again after it to close the window
+    in which a concurrent request could cache the old row.
+    """
+
+    for source_id in source_ids:
+        if not source_id:
+            continue
+
+        auth_user_cache.invalidate(source_id)
+        if AUTH_CACHE_NOTIFY:
+            await db.execute(
+                text("SELECT pg_notify(:channel, :source_id)"),
+                {"channel": AUTH_CACHE_CHANNEL, "source_id": source_id},
+            )
+
+
+def _on_auth_cache_notification(_connection, _pid, _channel, payload: str):
+    auth_user_cache.invalidate(payload)
+
+
+def _on_listener_terminated(_connection):
+    _listener_lost.set()
+
+
+async def _listen_for_invalidations():
+    global _listener_connection
+
+    connection = await engine.connect()
+    try:
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.add_listener(
+            AUTH_CACHE_CHANNEL,
+            _on_auth_cache_notification,
+        )
+        raw_connection.driver_connection.add_termination_listener(
+            _on_listener_terminated
+        )
+    except BaseException:
+        await connection.invalidate()
+        raise
+
+    _listener_connection = connection
+    _listener_lost.clear()
+    # the invalidations sent while nobody was listening are lost
+    auth_user_cache.clear()
+
+
+async def _listener_alive() -> bool:
+    try:
+        raw_connection = await _listener_connection.get_raw_connection()
+        # on the driver connection, a transaction would hold back the notifications
+        await asyncio.wait_for(
+            raw_connection.driver_connection.fetchval("SELECT 1"),
+            timeout=5,
+        )
+        return True
+    except Exception:
+        return False
+
+
+async def _keep_listening():
+    """
+    Re-open the LISTEN connection when it is closed by the server or stops
+    answering, the cache is cleared in the meantime since invalidations are missed.
+    """
+
+    global _listener_connection
+
+    while True:
+        try:
+            await asyncio.wait_for(
+                _listener_lost.wait(),
+                timeout=AUTH_CACHE_LISTEN_CHECK_SECONDS,
+            )
+        except asyncio.TimeoutError:
+            if await _listener_alive():
+                continue
+
+        print("Auth cache listener connection lost, clearing the auth cache")
+        auth_user_cache.clear()
+
+        connection, _listener_connection = _listener_connection, None
+        if connection is not None:
+            try:
+                await connection.invalidate()
+            except Exception:
+                pass
+
+        while True:
+            try:
+                await _listen_for_invalidations()
+                print("Auth cache listener reconnected")
+                break
+            except Exception as e:
+                print(f"Auth cache listener failed to reconnect: {e}")
+                await asyncio.sleep(AUTH_CACHE_LISTEN_RETRY_SECONDS)
+
+
+async def start_auth_cache_listener():
+    global _listener_task
+
+    if not AUTH_CACHE_NOTIFY:
+        return
+
+    await _listen_for_invalidations()
+    _listener_task = asyncio.create_task(_keep_listening())
+
+
+async def stop_auth_cache_listener():
+    global _listener_connection, _listener_task
+
+    if _listener_task is not None:
+        _listener_task.cancel()
+        await asyncio.gather(_listener_task, return_exceptions=True)
+        _listener_task = None
+
+    if _listener_connection is None:
+        return
+
+    await _listener_connection.close()
+    _listener_connection = None
+
+
 async def get_current_user(
     authorization: str = Header(),
     db: AsyncSession = Depends(get_db),
@@ -58,8 +252,21 @@ async def basic_scheme(db: AsyncSession, token: str) -> AuthUser:
 
 
 async def verify_user_id(db: AsyncSession, user_id: str) -> AuthUser:
+    # the session only checks out a connection on its first query, a cache hit
+    # costs no database round-trip at all
+    auth_user = auth_user_cache.get(user_id)
+    if auth_user is not None:
+        return auth_user
+
     user_query = (
-        select(User.id, User.email, User.role).where(User.source_id == user_id).limit(1)
+        select(User.id, User.email, User.role)
+        .where(
+            and_(
+                User.source_id == user_id,
+                User.deleted_at.is_(None),
+            )
+        )
+        .limit(1)
     )
     result = await db.execute(user_query)
 
@@ -74,4 +281,7 @@ async def verify_user_id(db: AsyncSession, user_id: str) -> AuthUser:
 
     user_uuid, user_email, user_role = user_row.tuple()
 
-    return AuthUser(uid=user_uuid, email=user_email, role=user_role)
+    auth_user = AuthUser(uid=user_uuid, email=user_email, role=user_role)
+    auth_user_cache.put(user_id, auth_user)
+
+    return auth_user
@@ -0,0 +1,55 @@
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Mapping
+
+
+def parse_retry_after(headers: Mapping[str, str] | None) -> float | None:
+    """
+    Read the `Retry-After` header, which is either a number of seconds or an HTTP date.
+    Returns the delay in seconds, or None when the header is missing or malformed.
+    """
+
+    if not headers:
+        return None
+
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def is_retryable_status(status: int) -> bool:
+    return status in (408, 425, 429) or status >= 500
+
+
+def backoff_delay(
+    attempt: int,
+    base_delay: float,
+    max_delay: float,
+    retry_after: float | None = None,
+) -> float:
+    """
+    Exponential backoff with full jitter for the given (1-based) attempt.
+    A server provided `retry_after` is honored as the lower bound.
+    """
+
+    delay = random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+
+    return delay
@@ -1,10 +1,10 @@
-import sys
-import logging
-import time
+import asyncio
 import os
+import time
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, DateTime, event
+from sqlalchemy import Column, DateTime, text
+from sqlalchemy.exc import InterfaceError, OperationalError
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
@@ -13,24 +13,27 @@ from sqlalchemy.ext.asyncio import (
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.dialects.postgresql import UUID
 
+from shared.query_metrics import install_query_metrics
+
 POSTGRES_URI = os.getenv("POSTGRES_URI")
 
 if not POSTGRES_URI:
     raise ValueError("No POSTGRES_URI found in environment variables")
 
-query_duration_logger = logging.getLogger("sqlalchemy.engine").getChild("Timing")
-query_duration_logger.addHandler(logging.StreamHandler(sys.stdout))
+# Logs every statement with its parameters, only meant for local debugging. Query
+# timings are recorded by `shared/query_metrics.py` either way.
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
 
 # The engine is the entry point to the database.
-# echo=True is useful for debugging to see the generated SQL.
 engine = create_async_engine(
     POSTGRES_URI,
-    echo=True,
+    echo=DB_ECHO,
     pool_size=10,  # Default is 10
     max_overflow=20,  # Default is 10
     pool_recycle=600,  # Recycle connections after 10 minutes (adjust based on DB timeout)
     pool_pre_ping=True,  # Ensures connections are alive before use (some overhead)
 )
+install_query_metrics(engine.sync_engine)
 
 # The sessionmaker provides a factory for creating Session objects.
 # We will use this to get a session in our dependency.
@@ -41,10 +44,97 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False,
 )
 
+# Optional streaming replica for the read-only endpoints, see `get_read_db`
+POSTGRES_REPLICA_URI = os.getenv("POSTGRES_REPLICA_URI")
+# reads go to the primary while the replica is further behind than this
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+# how long a lag measurement (or a failure) is trusted
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "5"))
+
+replica_engine = None
+ReplicaSessionLocal = None
+if POSTGRES_REPLICA_URI:
+    replica_engine = create_async_engine(
+        POSTGRES_REPLICA_URI,
+        echo=DB_ECHO,
+        pool_size=10,
+        max_overflow=20,
+        pool_recycle=600,
+        pool_pre_ping=True,
+    )
+    install_query_metrics(replica_engine.sync_engine)
+
+    ReplicaSessionLocal = async_sessionmaker(
+        bind=replica_engine,
+        class_=AsyncSession,
+        expire_on_commit=False,
+        autoflush=False,
+    )
+
+
+class ReplicaLagMonitor:
+    """
+    Decides whether reads can go to the replica, from its replay lag measured at
+    most once every `check_interval` seconds (by a single request at a time).
+    """
+
+    # 0 when the replica replayed everything it received (an idle primary does
+    # not make it lag), NULL on a server which is not a replica
+    LAG_QUERY = text(
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+        "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) "
+        "END"
+    )
+
+    def __init__(self, max_lag: float, check_interval: float):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+
+        self.lag: float | None = None
+        self.usable = False
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def mark_unusable(self):
+        self.usable = False
+        self._checked_at = time.monotonic()
+
+    async def _measure_lag(self) -> float:
+        async with replica_engine.connect() as conn:
+            lag = await conn.scalar(self.LAG_QUERY)
+        return float(lag or 0)
+
+    async def is_usable(self) -> bool:
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return self.usable
+
+        if self._lock.locked():
+            # another request is measuring, go with the last known state
+            return self.usable
+
+        async with self._lock:
+            try:
+                self.lag = await asyncio.wait_for(self._measure_lag(), timeout=2)
+                self.usable = self.lag <= self.max_lag
+                if not self.usable:
+                    print(f"Replica is {self.lag:.1f}s behind, reading from primary")
+            except Exception as e:
+                print(f"Replica lag check failed, reading from primary: {e}")
+                self.lag = None
+                self.usable = False
+            finally:
+                self._checked_at = time.monotonic()
+
+        return self.usable
+
+
+replica_monitor = ReplicaLagMonitor(REPLICA_MAX_LAG_SECONDS, REPLICA_LAG_CHECK_SECONDS)
+
 
 # A base class for our declarative models
 class Base(DeclarativeBase):
-    id = Column(UUID(as_uuid=True), default=uuid.uuid4, primary_key=True, index=True)
+    # the primary key is indexed already, see `shared/migrations/`
+    id = Column(UUID(as_uuid=True), default=uuid.uuid4, primary_key=True)
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
     deleted_at: Mapped[datetime | None] = mapped_column(
@@ -67,67 +157,26 @@ async def get_db():
             await session.close()
 
 
-# @event.listens_for(engine.sync_engine, "before_cursor_execute", retval=True)
-# def before_execute(conn, clauseelement, multiparams, params):
-#     conn.info.setdefault("query_start_time", []).append(time.monotonic())
-#     return clauseelement, multiparams, params
+# Dependency for the endpoints which only read. Served by the replica when one is
+# configured and caught up, by the primary otherwise. Never write through it.
+async def get_read_db():
+    use_replica = ReplicaSessionLocal is not None and await replica_monitor.is_usable()
+    session_factory = ReplicaSessionLocal if use_replica else AsyncSessionLocal
 
+    async with session_factory() as session:
+        try:
+            yield session
+        except Exception as e:
+            await session.rollback()
+            if use_replica and isinstance(e, (OperationalError, InterfaceError)):
+                # the replica went away, fall back until the next lag check
+                replica_monitor.mark_unusable()
+            raise e
+        finally:
+            await session.close()
 
-@event.listens_for(engine.sync_engine, "before_cursor_execute", retval=True)
-def before_cursor_execute(
-    conn,
-    cursor,
-    statement,
-    parameters,
-    context,
-    executemany,
-):
-    """
-    Listener to be called before a cursor is executed.
-    Starts a timer and stores it in the connection's info dictionary.
-    """
-    _ = cursor
-    _ = context
-    _ = executemany
-
-    # Use the connection's info dict to store the start time.
-    # We use a stack to handle nested cursor executions (less common, but good practice).
-    conn.info.setdefault("query_start_time", []).append(time.monotonic())
-    # You can also log the query statement here if needed
-    # query_duration_logger.debug("Starting query: %s", statement)
-    return statement, parameters
-
-
-@event.listens_for(engine.sync_engine, "after_cursor_execute")
-def after_cursor_execute(
-    conn,
-    cursor,
-    statement,
-    parameters,
-    context,
-    executemany,
-):
-    """
-    Listener to be called after a cursor has been executed.
-    Calculates the duration and logs it.
-    """
-    _ = cursor
-    _ = context
-    _ = executemany
-
-    # Pop the start time from the stack
-    total_time = time.monotonic() - conn.info["query_start_time"].pop()
-
-    # Log the query, parameters, and its duration.
-    # We use a more descriptive log message for clarity.
-    query_duration_logger.info(
-        "Query completed in %.4f ms. Statement: %s. Parameters: %s",
-        total_time * 1000,
-        statement,
-        parameters,
-    )
 
-    print(
-        f"{datetime.now().isoformat()} [QUERY_DURATION] Query completed in {total_time:.4f} ms. Statement: {statement}. Parameters: {parameters}"
-    )
-    return statement, parameters
+async def dispose_engines():
+    await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
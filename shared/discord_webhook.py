@@ -1,5 +1,6 @@
 import os
-from aiohttp import ClientSession
+
+from shared.http_client import get_http_session
 
 DISCORD_WEBHOOK = os.getenv("DISCORD_WEBHOOK", "")
 
@@ -19,6 +20,6 @@ async def send_discord_webhook_message(message: str, username: str | None = None
     if username:
         payload["username"] = username
 
-    async with ClientSession() as session:
-        resp = await session.post(DISCORD_WEBHOOK, json=payload)
+    session = get_http_session("discord")
+    async with session.post(DISCORD_WEBHOOK, json=payload) as resp:
         resp.raise_for_status()
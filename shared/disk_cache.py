@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any
+
+
+def make_cache_key(*parts: Any) -> str:
+    """
+    Build a stable content-addressed key (sha256 hex digest) from the given parts.
+    Parts are serialized as JSON with sorted keys, so dicts with the same content
+    always map to the same key.
+    """
+
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskLRUCache:
+    """
+    A persistent, size-bounded key/value cache for binary blobs.
+
+    Every entry is stored as a single file named after its key inside `directory`.
+    Recency is tracked through the file modification time, which is refreshed on
+    every hit, so the LRU order survives process restarts. When the total size
+    goes above `max_bytes`, the least recently used entries are evicted.
+
+    The methods do blocking file I/O and are meant to be called from a thread
+    (or for small entries, directly) by async callers.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str = ".bin"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+
+    def _path_for(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def _load_index(self):
+        if self._loaded:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        found = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or not entry.name.endswith(self.suffix):
+                continue
+            stat = entry.stat()
+            found.append((stat.st_mtime, entry.name[: -len(self.suffix)], stat.st_size))
+
+        # oldest first, so that the end of the ordered dict is the most recently used
+        found.sort()
+        for _, key, size in found:
+            self._entries[key] = size
+            self._total_bytes += size
+
+        self._loaded = True
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            self._load_index()
+            if key not in self._entries:
+                return None
+
+            path = self._path_for(key)
+            try:
+                with open(path, "rb") as fp:
+                    data = fp.read()
+                os.utime(path)
+            except FileNotFoundError:
+                # removed behind our back, forget about it
+                self._total_bytes -= self._entries.pop(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            self._load_index()
+
+            path = self._path_for(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as fp:
+                fp.write(data)
+            # atomic on POSIX, readers never observe a partially written entry
+            os.replace(tmp_path, path)
+
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+
+            self._evict()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._load_index()
+            if key not in self._entries:
+                return
+
+            self._total_bytes -= self._entries.pop(key)
+            try:
+                os.remove(self._path_for(key))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path_for(key))
+            except FileNotFoundError:
+                pass
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
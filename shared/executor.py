@@ -0,0 +1,48 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+# Blocking file I/O (cache reads, audio and poster writes)
+BLOCKING_IO_WORKERS = int(os.getenv("BLOCKING_IO_WORKERS", "16"))
+# CPU heavy work (decoding, JSON parsing, password hashing, audio assembly).
+# Kept separate from the I/O pool so that a burst of logins or large decodes can
+# not starve file writes, and sized to the cores since it mostly holds the GIL
+# or a core (bcrypt).
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(8, (os.cpu_count() or 1) + 1))))
+
+io_executor = ThreadPoolExecutor(
+    max_workers=BLOCKING_IO_WORKERS,
+    thread_name_prefix="kahani-io",
+)
+cpu_executor = ThreadPoolExecutor(
+    max_workers=CPU_WORKERS,
+    thread_name_prefix="kahani-cpu",
+)
+
+
+async def run_io(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking I/O call off the event loop."""
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, partial(func, *args, **kwargs))
+
+
+async def run_cpu(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a CPU bound call off the event loop."""
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor, partial(func, *args, **kwargs))
+
+
+def write_file(path: str, data: bytes):
+    with open(path, "wb") as fp:
+        fp.write(data)
+
+
+def shutdown_executors():
+    io_executor.shutdown(wait=True, cancel_futures=True)
+    cpu_executor.shutdown(wait=True, cancel_futures=True)
@@ -1,19 +1,76 @@
 import asyncio
+import shutil
 import subprocess
 import os
 import tempfile
 import aiofiles
 
+from shared.executor import run_cpu
 from shared.utils import find_ffmpeg
+from shared.wav import WavFormat, WavFormatError, assemble_wav, parse_wav
+
+
+SILENCE_GAP_MS = 300
+
+# ffmpeg encoders of integer PCM, by bits per sample
+PCM_CODECS = {8: "pcm_u8", 16: "pcm_s16le", 24: "pcm_s24le", 32: "pcm_s32le"}
+
+
+async def merge_audio_segments_async(
+    segments: list[bytes],
+    output_path,
+    gap_ms=SILENCE_GAP_MS,
+):
+    """
+    Merges in-memory WAV segments into a single file, with `gap_ms` of silence after
+    every segment.
+
+    Segments sharing the same PCM format are assembled in-process. ffmpeg is only used
+    as a fallback when their formats differ, in which case the segments are spilled
+    to temporary files first and re-encoded to the format of the first one.
+
+    Returns:
+        str: The path to the successfully created merged file (the output_path).
+    """
+    if not segments:
+        raise ValueError("Input 'segments' must be a non-empty list.")
+
+    try:
+        merged = await run_cpu(assemble_wav, segments, gap_ms)
+    except WavFormatError as e:
+        print(f"In-process WAV assembly not possible ({e}), falling back to ffmpeg.")
+
+        temp_dir = tempfile.mkdtemp(prefix="ffmpeg-segments-")
+        try:
+            file_paths = []
+            for idx, segment in enumerate(segments):
+                path = os.path.join(temp_dir, f"{idx:03}.wav")
+                async with aiofiles.open(path, "wb") as f:
+                    await f.write(segment)
+                file_paths.append(path)
+
+            return await concat_audio_files_ffmpeg_async(
+                file_paths,
+                output_path,
+                gap_ms,
+                pick_wav_format(segments),
+            )
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    async with aiofiles.open(output_path, "wb") as f:
+        await f.write(merged)
+
+    return output_path
 
 
 async def merge_audio_files_async(file_paths, output_path):
     """
-    Asynchronously merges multiple audio files into a single file using ffmpeg.
+    Asynchronously merges multiple audio files into a single file.
 
-    This non-blocking function uses ffmpeg's 'concat' demuxer, which is fast and
-    avoids re-encoding. It is suitable for use in async applications (e.g., web servers)
-    where you don't want to block the event loop.
+    WAV inputs sharing the same format are concatenated in-process, generating the
+    silence gaps in memory. Anything else is re-encoded by ffmpeg's 'concat' filter
+    (see `concat_audio_files_ffmpeg_async`).
 
     Args:
         file_paths (list): A list of strings, where each string is the path
@@ -32,7 +89,6 @@ async def merge_audio_files_async(file_paths, output_path):
         raise ValueError("Input 'file_paths' must be a non-empty list.")
 
     # Pre-flight checks (these are quick, so no need to be async)
-    ffmpeg_executable = find_ffmpeg()
     for path in file_paths:
         if not os.path.exists(path):
             raise FileNotFoundError(f"Input file not found: {path}")
@@ -45,36 +101,105 @@ async def merge_audio_files_async(file_paths, output_path):
                 await dst.write(await src.read())
         return output_path
 
-    # We need a temporary file to list the inputs for ffmpeg's concat demuxer.
-    # The temp file path is created synchronously, but written to asynchronously.
-    temp_dir = tempfile.gettempdir()
-    list_file_path = os.path.join(temp_dir, f"ffmpeg-list-{os.urandom(8).hex()}.txt")
+    segments = []
+    for path in file_paths:
+        async with aiofiles.open(path, "rb") as src:
+            segments.append(await src.read())
 
     try:
-        # Asynchronously write the list of files to the temporary file
-        silence_path = "./shared/silence_300ms.wav"
-        async with aiofiles.open(list_file_path, mode="w", encoding="utf-8") as f:
-            for path in file_paths:
-                await f.write(f"file '{os.path.abspath(path)}'\n")
-                await f.write(f"file '{os.path.abspath(silence_path)}'\n")
-
-        # Construct the ffmpeg command
-        command = [
-            ffmpeg_executable,
-            "-y",  # Overwrite output file if it exists
-            "-f",
-            "concat",
-            "-safe",
-            "0",
-            "-i",
-            list_file_path,
-            "-c",
-            "copy",
+        merged = await run_cpu(assemble_wav, segments, SILENCE_GAP_MS)
+    except WavFormatError as e:
+        print(f"In-process WAV assembly not possible ({e}), falling back to ffmpeg.")
+        return await concat_audio_files_ffmpeg_async(
+            file_paths,
             output_path,
-        ]
+            SILENCE_GAP_MS,
+            pick_wav_format(segments),
+        )
+
+    async with aiofiles.open(output_path, "wb") as dst:
+        await dst.write(merged)
+
+    return output_path
+
+
+def pick_wav_format(segments: list[bytes]) -> WavFormat | None:
+    """Format of the first segment which is a readable WAV, the merge target."""
+
+    for segment in segments:
+        try:
+            fmt, _ = parse_wav(segment)
+            return fmt
+        except WavFormatError:
+            continue
+
+    return None
+
+
+def _concat_filter(
+    num_inputs: int,
+    gap_ms: int,
+    sample_rate: int,
+    channels: int,
+) -> str:
+    # every input is converted to the target format and padded with the gap, so
+    # that inputs of any format (and the silence) can be concatenated
+    convert = (
+        f"aresample={sample_rate},"
+        f"aformat=sample_fmts=s16:sample_rates={sample_rate}"
+    )
+    if channels in (1, 2):
+        convert += f":channel_layouts={'mono' if channels == 1 else 'stereo'}"
+    if gap_ms:
+        convert += f",apad=pad_dur={gap_ms / 1000:.3f}"
+
+    streams = [f"[{idx}:a]{convert}[a{idx}]" for idx in range(num_inputs)]
+    inputs = "".join(f"[a{idx}]" for idx in range(num_inputs))
+    streams.append(f"{inputs}concat=n={num_inputs}:v=0:a=1[out]")
+
+    return ";".join(streams)
+
+
+async def concat_audio_files_ffmpeg_async(
+    file_paths,
+    output_path,
+    gap_ms=SILENCE_GAP_MS,
+    target_format: WavFormat | None = None,
+):
+    """
+    Merges audio files of possibly different formats into a single 16-bit PCM WAV
+    using ffmpeg's 'concat' filter, with `gap_ms` of silence after every file.
+    Every input is resampled to `target_format` (22.05 kHz mono when None).
+
+    Raises:
+        FileNotFoundError: If ffmpeg is not installed.
+        subprocess.CalledProcessError: If ffmpeg returns a non-zero exit code.
+    """
+    ffmpeg_executable = find_ffmpeg()
+
+    sample_rate = target_format.sample_rate if target_format else 22050
+    channels = target_format.channels if target_format else 1
+
+    command = [ffmpeg_executable, "-y"]  # Overwrite output file if it exists
+    for path in file_paths:
+        command += ["-i", path]
+    command += [
+        "-filter_complex",
+        _concat_filter(len(file_paths), gap_ms, sample_rate, channels),
+        "-map",
+        "[out]",
+        "-c:a",
+        "pcm_s16le",
+        "-ar",
+        str(sample_rate),
+        "-ac",
+        str(channels),
+        output_path,
+    ]
 
-        print(f"Running async ffmpeg command: {' '.join(command)}")
+    print(f"Running async ffmpeg command: {' '.join(command)}")
 
+    try:
         # Execute the command asynchronously
         process = await asyncio.create_subprocess_exec(
             *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
@@ -85,8 +210,6 @@ async def merge_audio_files_async(file_paths, output_path):
 
         # Check if ffmpeg exited with an error
         if process.returncode:
-            # Decode stderr for a more useful error message
-            # error_message = stderr.decode().strip()
             raise subprocess.CalledProcessError(
                 returncode=process.returncode,
                 cmd=command,
@@ -94,17 +217,116 @@ async def merge_audio_files_async(file_paths, output_path):
                 stderr=stderr,
             )
 
-        print("FFmpeg output:\n", stdout.decode())
-        print("FFmpeg errors (if any):\n", stderr.decode())
         print(f"Successfully merged files into: {output_path}")
 
     except Exception as e:
         print(f"An error occurred during async merge: {e}")
         # Re-raise the exception to signal failure
         raise e
-    finally:
-        # Ensure the temporary list file is always deleted
-        if os.path.exists(list_file_path):
-            os.remove(list_file_path)
+
+    return output_path
+
+
+async def convert_wav_async(
+    data: bytes,
+    target_format: WavFormat | None = None,
+) -> bytes:
+    """
+    Re-encodes an in-memory audio segment of any format to a WAV in `target_format`
+    (16-bit 22.05 kHz mono when None) with ffmpeg, through pipes.
+
+    Raises:
+        WavFormatError: If `target_format` is not integer PCM.
+        FileNotFoundError: If ffmpeg is not installed.
+        subprocess.CalledProcessError: If ffmpeg returns a non-zero exit code.
+    """
+    sample_rate = target_format.sample_rate if target_format else 22050
+    channels = target_format.channels if target_format else 1
+    bits_per_sample = target_format.bits_per_sample if target_format else 16
+
+    codec = PCM_CODECS.get(bits_per_sample)
+    if codec is None or (target_format and target_format.audio_format != 1):
+        raise WavFormatError(f"can not convert to {target_format}")
+
+    command = [
+        find_ffmpeg(),
+        "-v",
+        "error",
+        "-i",
+        "pipe:0",
+        "-vn",
+        "-c:a",
+        codec,
+        "-ar",
+        str(sample_rate),
+        "-ac",
+        str(channels),
+        "-f",
+        "wav",
+        "pipe:1",
+    ]
+
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate(data)
+
+    if process.returncode:
+        raise subprocess.CalledProcessError(
+            returncode=process.returncode,
+            cmd=command,
+            output=stdout,
+            stderr=stderr,
+        )
+
+    return stdout
+
+
+async def transcode_audio_async(input_path, output_path, codec_args):
+    """
+    Re-encodes an audio file with ffmpeg.
+
+    Args:
+        input_path (str): The source audio file.
+        output_path (str): The path for the encoded file, its extension picks the container.
+        codec_args (list): ffmpeg output arguments, e.g. ["-c:a", "libopus", "-b:a", "48k"].
+
+    Returns:
+        str: The path to the encoded file (the output_path).
+
+    Raises:
+        FileNotFoundError: If ffmpeg is not installed or the input file does not exist.
+        subprocess.CalledProcessError: If ffmpeg returns a non-zero exit code.
+    """
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"Input file not found: {input_path}")
+
+    command = [
+        find_ffmpeg(),
+        "-y",
+        "-i",
+        input_path,
+        "-vn",
+        *codec_args,
+        output_path,
+    ]
+
+    print(f"Running async ffmpeg command: {' '.join(command)}")
+
+    process = await asyncio.create_subprocess_exec(
+        *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+
+    if process.returncode:
+        raise subprocess.CalledProcessError(
+            returncode=process.returncode,
+            cmd=command,
+            output=stdout,
+            stderr=stderr,
+        )
 
     return output_path
@@ -0,0 +1,61 @@
+import os
+
+import aiohttp
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+# LLM completions for long scripts can take minutes
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "300"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "64"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+
+# One pooled session per upstream, so that a burst of TTS calls can not take all
+# the connections needed by the LLM calls and the other way around.
+HTTP_CLIENTS = ("gemini", "sarvam", "discord")
+
+_sessions: dict[str, aiohttp.ClientSession] = {}
+
+
+def _create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=0,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        use_dns_cache=True,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=None,
+        sock_connect=HTTP_CONNECT_TIMEOUT,
+        sock_read=HTTP_READ_TIMEOUT,
+    )
+
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def get_http_session(name: str) -> aiohttp.ClientSession:
+    """
+    Get the application-lifetime session for an upstream. Sessions are created in
+    `api.lifespan`, they are also created lazily for scripts running outside of it.
+    Never close the returned session, responses must be released (`async with`).
+    """
+
+    session = _sessions.get(name)
+    if session is None or session.closed:
+        session = _create_session()
+        _sessions[name] = session
+
+    return session
+
+
+def init_http_sessions():
+    for name in HTTP_CLIENTS:
+        get_http_session(name)
+
+
+async def close_http_sessions():
+    for session in _sessions.values():
+        if not session.closed:
+            await session.close()
+
+    _sessions.clear()
@@ -0,0 +1,98 @@
+import io
+
+try:
+    from PIL import Image
+except ImportError:
+    # Pillow is a dependency, this only keeps a broken install serving the original
+    # images (without derivatives) instead of failing on import
+    print("WARNING: Pillow is not installed, image variants are disabled")
+    Image = None
+
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+
+IMAGE_SAVE_FORMATS = {
+    "webp": "WEBP",
+    "avif": "AVIF",
+    "jpg": "JPEG",
+}
+
+
+def sniff_image_extension(data: bytes) -> str | None:
+    """Detect the actual format of encoded image bytes from their magic numbers."""
+
+    for signature, extension in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return extension
+
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[4:8] == b"ftyp" and data[8:12] in (b"avif", b"avis"):
+        return "avif"
+
+    return None
+
+
+def supported_image_formats(formats: list[str]) -> list[str]:
+    """Keep the formats the installed Pillow can encode, in the given order."""
+
+    if Image is None:
+        return []
+
+    Image.init()
+    return [
+        image_format
+        for image_format in formats
+        if IMAGE_SAVE_FORMATS.get(image_format) in Image.SAVE
+    ]
+
+
+def encode_image_variants(
+    data: bytes,
+    sizes: dict[str, int],
+    formats: list[str],
+    quality: int,
+) -> dict[str, dict]:
+    """
+    Decode an image once and encode it for every size (longest edge, never
+    upscaled) in every format.
+
+    Returns {size_name: {"width", "height", "images": {format: bytes}}}. CPU heavy,
+    run it through `run_cpu`.
+    """
+
+    formats = supported_image_formats(formats)
+    if not formats:
+        return {}
+
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        if source.mode not in ("RGB", "RGBA"):
+            source = source.convert("RGBA" if "transparency" in source.info else "RGB")
+
+        variants = {}
+        for size_name, max_edge in sizes.items():
+            resized = source.copy()
+            resized.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+            images = {}
+            for image_format in formats:
+                image = resized
+                if image_format == "jpg" and image.mode != "RGB":
+                    image = image.convert("RGB")
+
+                buffer = io.BytesIO()
+                image.save(buffer, IMAGE_SAVE_FORMATS[image_format], quality=quality)
+                images[image_format] = buffer.getvalue()
+
+            variants[size_name] = {
+                "width": resized.width,
+                "height": resized.height,
+                "images": images,
+            }
+
+    return variants
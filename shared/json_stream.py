@@ -0,0 +1,83 @@
+import json
+from typing import Any
+
+
+class JSONArrayStreamParser:
+    """
+    Incremental parser for a JSON array arriving in chunks, e.g. from a streamed LLM
+    completion. Every top-level element is returned as soon as its closing character
+    has been fed, long before the array itself is complete.
+
+    Anything before the opening '[' (markdown fences, leading prose) and after the
+    closing ']' is ignored. Elements that are not valid JSON are skipped and counted
+    in `errors`.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self.errors = 0
+
+        self._current: list[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def _flush(self, out: list[Any]):
+        text = "".join(self._current).strip()
+        self._current = []
+        if not text:
+            return
+
+        try:
+            out.append(json.loads(text))
+        except json.JSONDecodeError as e:
+            print(f"skipping malformed array element: {e}")
+            self.errors += 1
+
+    def feed(self, chunk: str) -> list[Any]:
+        elements: list[Any] = []
+
+        for ch in chunk:
+            if self.finished:
+                break
+
+            if not self.started:
+                if ch == "[":
+                    self.started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                self._current.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._current.append(ch)
+            elif ch in "[{":
+                self._depth += 1
+                self._current.append(ch)
+            elif ch in "]}":
+                if self._depth == 1:
+                    # end of the outer array, flush a trailing scalar if any
+                    self._flush(elements)
+                    self.finished = True
+                    continue
+
+                self._depth -= 1
+                self._current.append(ch)
+                if self._depth == 1:
+                    self._flush(elements)
+            elif ch == "," and self._depth == 1:
+                self._flush(elements)
+            else:
+                self._current.append(ch)
+
+        return elements
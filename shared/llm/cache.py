@@ -0,0 +1,86 @@
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+from shared.disk_cache import DiskLRUCache, make_cache_key
+from shared.executor import run_io
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./cache/llm/")
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "256"))
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+
+llm_completion_cache = DiskLRUCache(
+    LLM_CACHE_PATH,
+    max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024,
+    suffix=".json",
+)
+
+
+def normalize_prompt(prompt: str) -> str:
+    # whitespace differences never change the answer we want back
+    return " ".join(prompt.split())
+
+
+def _llm_cache_key(model: str, prompt: str) -> str:
+    return make_cache_key("llm", model, normalize_prompt(prompt))
+
+
+async def get_cached_llm_result(model: str, prompt: str) -> Any:
+    """Return the cached result for the prompt, or None on a miss or expired entry."""
+
+    if not LLM_CACHE_ENABLED:
+        return None
+
+    key = _llm_cache_key(model, prompt)
+    raw_entry = await run_io(llm_completion_cache.get, key)
+    if raw_entry is None:
+        return None
+
+    entry = json.loads(raw_entry)
+    if time.time() - entry["created_at"] >= LLM_CACHE_TTL_HOURS * 3600:
+        await run_io(llm_completion_cache.delete, key)
+        return None
+
+    return entry["result"]
+
+
+async def store_llm_result(model: str, prompt: str, result: Any):
+    # only structured results are stored, so that a response that failed to parse
+    # is never replayed
+    if not LLM_CACHE_ENABLED or not isinstance(result, (dict, list)) or not result:
+        return
+
+    entry = {"model": model, "created_at": time.time(), "result": result}
+    await run_io(
+        llm_completion_cache.put,
+        _llm_cache_key(model, prompt),
+        json.dumps(entry, ensure_ascii=False).encode("utf-8"),
+    )
+
+
+async def cached_llm_result(
+    model: str,
+    prompt: str,
+    producer: Callable[[], Awaitable[Any]],
+    *,
+    use_cache: bool = True,
+) -> Any:
+    """
+    Return the parsed result of an LLM call, served from the completion cache when the
+    same (normalized) prompt was already answered by `model` within the TTL.
+
+    Pass `use_cache=False` to always get a fresh take, the fresh result still
+    replaces the cached one.
+    """
+
+    if use_cache:
+        result = await get_cached_llm_result(model, prompt)
+        if result is not None:
+            return result
+
+    result = await producer()
+    await store_llm_result(model, prompt, result)
+
+    return result
@@ -1,85 +1,136 @@
-import aiohttp
 import os
 import base64
+import json
+
+from shared.http_client import get_http_session
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# point at `tests/mock_providers.py` for load tests
+GEMINI_BASE_URL = os.getenv(
+    "GEMINI_BASE_URL",
+    "https://generativelanguage.googleapis.com",
+).rstrip("/")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
-GEMINI_ENDPOINT = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
+# alternate model for hedged and failed over requests, see `shared/llm/router.py`
+GEMINI_FALLBACK_MODEL = os.getenv("GEMINI_FALLBACK_MODEL", "gemini-2.0-flash-lite")
 
 GEMINI_IMAGE_MODEL = os.getenv(
     "GEMINI_IMAGE_MODEL",
     "gemini-2.0-flash-preview-image-generation",
 )
-GEMINI_IMAGE_ENDPOINT = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_IMAGE_MODEL}:streamGenerateContent?key={GEMINI_API_KEY}"
-
-
-async def gemini_chat_completion(prompt: str):
-    async with aiohttp.ClientSession() as session:
-        resp = await session.post(
-            GEMINI_ENDPOINT,
-            json={
-                "contents": [
-                    {
-                        "parts": [
-                            {
-                                "text": prompt,
-                            }
-                        ]
-                    }
-                ]
-            },
-        )
+GEMINI_IMAGE_ENDPOINT = f"{GEMINI_BASE_URL}/v1beta/models/{GEMINI_IMAGE_MODEL}:streamGenerateContent?key={GEMINI_API_KEY}"
+
+
+def gemini_endpoint(model: str, stream: bool = False) -> str:
+    if stream:
+        return f"{GEMINI_BASE_URL}/v1beta/models/{model}:streamGenerateContent?alt=sse&key={GEMINI_API_KEY}"
 
+    return f"{GEMINI_BASE_URL}/v1beta/models/{model}:generateContent?key={GEMINI_API_KEY}"
+
+
+async def gemini_chat_completion(prompt: str, model: str = GEMINI_MODEL):
+    session = get_http_session("gemini")
+    async with session.post(
+        gemini_endpoint(model),
+        json={
+            "contents": [
+                {
+                    "parts": [
+                        {
+                            "text": prompt,
+                        }
+                    ]
+                }
+            ]
+        },
+    ) as resp:
         resp.raise_for_status()
 
         resp_json = await resp.json()
 
-        resp_text = (
-            resp_json.get("candidates", [{}])[0]
-            .get("content", {})
-            .get("parts", [{}])[0]
-            .get("text", "")
-        )
+    resp_text = (
+        resp_json.get("candidates", [{}])[0]
+        .get("content", {})
+        .get("parts", [{}])[0]
+        .get("text", "")
+    )
+
+    return resp_text
+
 
-        return resp_text
+async def gemini_stream_completion(prompt: str, model: str = GEMINI_MODEL):
+    """
+    Stream a completion through server-sent events, yielding the text as it is generated.
+    """
+
+    session = get_http_session("gemini")
+    async with session.post(
+        gemini_endpoint(model, stream=True),
+        json={
+            "contents": [
+                {
+                    "parts": [
+                        {
+                            "text": prompt,
+                        }
+                    ]
+                }
+            ]
+        },
+    ) as resp:
+        resp.raise_for_status()
+
+        async for line in resp.content:
+            line = line.strip()
+            if not line.startswith(b"data:"):
+                continue
+
+            chunk = json.loads(line[len(b"data:") :])
+            parts = (
+                chunk.get("candidates", [{}])[0].get("content", {}).get("parts", [])
+            )
+            for part in parts:
+                text = part.get("text", "")
+                if text:
+                    yield text
 
 
 async def gemini_image_generation(prompt: str):
-    async with aiohttp.ClientSession() as session:
-        resp = await session.post(
-            GEMINI_IMAGE_ENDPOINT,
-            json={
-                "generationConfig": {
-                    "responseModalities": ["IMAGE", "TEXT"],
-                    "responseMimeType": "text/plain",
-                },
-                "contents": [
-                    {
-                        "parts": [
-                            {
-                                "text": prompt,
-                            }
-                        ]
-                    }
-                ],
+    session = get_http_session("gemini")
+    async with session.post(
+        GEMINI_IMAGE_ENDPOINT,
+        json={
+            "generationConfig": {
+                "responseModalities": ["IMAGE", "TEXT"],
+                "responseMimeType": "text/plain",
             },
-        )
-
+            "contents": [
+                {
+                    "parts": [
+                        {
+                            "text": prompt,
+                        }
+                    ]
+                }
+            ],
+        },
+    ) as resp:
         if resp.status > 200:
             print(await resp.text())
             resp.raise_for_status()
 
         chunk = await resp.json()
-        image_base64 = (
-            chunk[0]
-            .get("candidates", [{}])[0]
-            .get("content", {})
-            .get("parts", [{}])[0]
-            .get("inlineData", {})
-            .get("data", None)
-        )
-
-        if image_base64 is None:
-            return None
-
-        return base64.b64decode(image_base64)
+
+    image_base64 = (
+        chunk[0]
+        .get("candidates", [{}])[0]
+        .get("content", {})
+        .get("parts", [{}])[0]
+        .get("inlineData", {})
+        .get("data", None)
+    )
+
+    if image_base64 is None:
+        return None
+
+    return base64.b64decode(image_base64)
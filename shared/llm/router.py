@@ -0,0 +1,269 @@
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable
+
+from shared.llm.gemini import (
+    GEMINI_FALLBACK_MODEL,
+    GEMINI_MODEL,
+    gemini_chat_completion,
+    gemini_stream_completion,
+)
+from shared.llm.sarvam import SARVAM_MODEL, sarvam_chat_completion
+
+# Providers tried in order, by their name in `LLM_PROVIDERS`
+LLM_TEXT_PROVIDERS = os.getenv("LLM_TEXT_PROVIDERS", "gemini,gemini-fallback,sarvam")
+LLM_METADATA_PROVIDERS = os.getenv("LLM_METADATA_PROVIDERS", "sarvam,gemini")
+
+# A hedged request is sent to the next provider once the current one is slower
+# than this percentile of its own recent successful latencies
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# used until enough latencies are known
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "30"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "2"))
+# 1 disables hedging, failover on errors still applies
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "2"))
+
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+LATENCY_WINDOW = 200
+
+
+class CircuitBreaker:
+    """
+    Opens after `max_failures` consecutive failures and rejects calls for
+    `cooldown` seconds. Then a single trial call is let through (half-open), its
+    outcome closes the breaker or opens it for another cooldown.
+    """
+
+    def __init__(self, max_failures: int, cooldown: float):
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open" or self.trial_in_flight:
+            return False
+
+        self.trial_in_flight = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.max_failures:
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+    def release(self):
+        # the call was cancelled (it lost a hedge), it says nothing about the provider
+        self.trial_in_flight = False
+
+
+@dataclass
+class LLMProvider:
+    name: str
+    model: str
+    complete: Callable[[str], Awaitable[str]]
+    stream: Callable[[str], AsyncIterator[str]] | None = None
+
+    breaker: CircuitBreaker = field(
+        default_factory=lambda: CircuitBreaker(
+            LLM_BREAKER_FAILURES,
+            LLM_BREAKER_COOLDOWN,
+        )
+    )
+    latencies: deque = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DEFAULT_DELAY
+
+        ordered = sorted(self.latencies)
+        idx = min(len(ordered) - 1, int(LLM_HEDGE_PERCENTILE * len(ordered)))
+        return max(LLM_HEDGE_MIN_DELAY, ordered[idx])
+
+    async def timed_complete(self, prompt: str) -> str:
+        start = time.monotonic()
+        text = await self.complete(prompt)
+        if not text:
+            raise Exception(f"empty completion from {self.name}")
+
+        self.latencies.append(time.monotonic() - start)
+        return text
+
+
+LLM_PROVIDERS = {
+    provider.name: provider
+    for provider in (
+        LLMProvider(
+            "gemini",
+            GEMINI_MODEL,
+            lambda prompt: gemini_chat_completion(prompt, GEMINI_MODEL),
+            lambda prompt: gemini_stream_completion(prompt, GEMINI_MODEL),
+        ),
+        LLMProvider(
+            "gemini-fallback",
+            GEMINI_FALLBACK_MODEL,
+            lambda prompt: gemini_chat_completion(prompt, GEMINI_FALLBACK_MODEL),
+            lambda prompt: gemini_stream_completion(prompt, GEMINI_FALLBACK_MODEL),
+        ),
+        LLMProvider(
+            "sarvam",
+            SARVAM_MODEL,
+            lambda prompt: sarvam_chat_completion(prompt),
+        ),
+    )
+}
+
+
+class LLMRouter:
+    """
+    Send a completion to the first provider, hedge it with the next one when it
+    takes longer than usual and fail over to the next one on errors. The first
+    successful completion wins, the requests still in flight are cancelled.
+    Providers whose circuit breaker is open are skipped.
+    """
+
+    def __init__(self, provider_names: str):
+        self.providers = [
+            LLM_PROVIDERS[name.strip()]
+            for name in provider_names.split(",")
+            if name.strip()
+        ]
+        if not self.providers:
+            raise Exception(f"no LLM provider configured in '{provider_names}'")
+
+    @property
+    def cache_namespace(self) -> str:
+        # completions are cached per routing, not per provider that happened to win
+        return "+".join(provider.model for provider in self.providers)
+
+    async def complete(self, prompt: str) -> str:
+        # the breakers are only asked right before a provider is used, so that a
+        # half-open trial is not reserved for a provider that is never called
+        candidates = list(self.providers)
+        in_flight: dict[asyncio.Task, LLMProvider] = {}
+        last_error: Exception | None = None
+
+        def launch_next() -> LLMProvider | None:
+            while candidates:
+                provider = candidates.pop(0)
+                if not provider.breaker.allow():
+                    print(f"skipping LLM provider {provider.name}, circuit open")
+                    continue
+
+                task = asyncio.create_task(provider.timed_complete(prompt))
+                in_flight[task] = provider
+                return provider
+
+            return None
+
+        latest = launch_next()
+        if latest is None:
+            raise Exception("no LLM provider available")
+
+        try:
+            while in_flight:
+                timeout = None
+                if candidates and len(in_flight) < LLM_MAX_IN_FLIGHT:
+                    timeout = latest.hedge_delay()
+
+                done, _ = await asyncio.wait(
+                    in_flight,
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+
+                if not done:
+                    print(
+                        f"LLM provider {latest.name} slower than {timeout:.1f}s, hedging"
+                    )
+                    latest = launch_next() or latest
+                    continue
+
+                for task in done:
+                    provider = in_flight.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        provider.breaker.record_success()
+                        return task.result()
+
+                    print(f"LLM provider {provider.name} failed: {error}")
+                    provider.breaker.record_failure()
+                    last_error = error
+
+                if not in_flight:
+                    latest = launch_next() or latest
+        finally:
+            for task, provider in in_flight.items():
+                task.cancel()
+                provider.breaker.release()
+
+        raise last_error or Exception("no LLM provider available")
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Stream a completion from the first available provider. Streams are not
+        hedged, a provider is failed over only until it produced its first text.
+        Providers without streaming return their whole completion as one chunk.
+        """
+
+        last_error: Exception | None = None
+        for provider in self.providers:
+            if not provider.breaker.allow():
+                print(f"skipping LLM provider {provider.name}, circuit open")
+                continue
+
+            started = False
+            try:
+                if provider.stream is None:
+                    text = await provider.timed_complete(prompt)
+                    started = True
+                    yield text
+                else:
+                    async for text in provider.stream(prompt):
+                        started = True
+                        yield text
+            except Exception as e:
+                provider.breaker.record_failure()
+                if started:
+                    raise
+
+                print(f"LLM provider {provider.name} failed: {e}")
+                last_error = e
+                continue
+            except BaseException:
+                provider.breaker.release()
+                raise
+
+            provider.breaker.record_success()
+            return
+
+        raise last_error or Exception("no LLM provider available")
+
+
+text_llm = LLMRouter(LLM_TEXT_PROVIDERS)
+metadata_llm = LLMRouter(LLM_METADATA_PROVIDERS)
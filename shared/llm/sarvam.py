@@ -1,46 +1,48 @@
-import aiohttp
 import os
 
+from shared.http_client import get_http_session
+
 SARVAM_API_KEY = os.getenv("SARVAM_API_KEY")
 if not SARVAM_API_KEY:
     raise Exception("'SARVAM_API_KEY' not set in the environment")
 
-SARVAM_MODEL = os.getenv("SARVAM_MODEL", "")
-SARVAM_ENDPOINT = "https://api.sarvam.ai/v1/chat/completions"
+# point at `tests/mock_providers.py` for load tests
+SARVAM_BASE_URL = os.getenv("SARVAM_BASE_URL", "https://api.sarvam.ai").rstrip("/")
+
+SARVAM_MODEL = os.getenv("SARVAM_MODEL", "sarvam-m")
+SARVAM_ENDPOINT = f"{SARVAM_BASE_URL}/v1/chat/completions"
 
 
 async def sarvam_chat_completion(
     prompt: str,
     *,
+    model: str = SARVAM_MODEL,
     temperature: float = 1.0,
     max_tokens: int = 8192,
 ):
-    async with aiohttp.ClientSession() as session:
-        resp = await session.post(
-            SARVAM_ENDPOINT,
-            headers={
-                "api-subscription-key": SARVAM_API_KEY or "",
-                "content-type": "application/json",
-            },
-            json={
-                "model": "sarvam-m",
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-                "messages": [
-                    {
-                        "content": prompt,
-                        "role": "user",
-                    },
-                ],
-            },
-        )
-
+    session = get_http_session("sarvam")
+    async with session.post(
+        SARVAM_ENDPOINT,
+        headers={
+            "api-subscription-key": SARVAM_API_KEY or "",
+            "content-type": "application/json",
+        },
+        json={
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "messages": [
+                {
+                    "content": prompt,
+                    "role": "user",
+                },
+            ],
+        },
+    ) as resp:
         resp.raise_for_status()
 
         resp_json = await resp.json()
 
-        resp_text = (
-            resp_json.get("choices", [{}])[0].get("message", {}).get("content", "")
-        )
+    resp_text = resp_json.get("choices", [{}])[0].get("message", {}).get("content", "")
 
-        return resp_text
+    return resp_text
@@ -6,6 +6,11 @@ SARVAM_API_KEY = os.getenv("SARVAM_API_KEY")
 if not SARVAM_API_KEY:
     raise Exception("'SARVAM_API_KEY' not set in the environment")
 
+SARVAM_TTS_MODEL = os.getenv("SARVAM_TTS_MODEL", "bulbul:v2")
+# point at `tests/mock_providers.py` for load tests
+SARVAM_BASE_URL = os.getenv("SARVAM_BASE_URL", "https://api.sarvam.ai").rstrip("/")
+SARVAM_TTS_ENDPOINT = f"{SARVAM_BASE_URL}/text-to-speech"
+
 
 @dataclass
 class VoiceConfig:
@@ -25,14 +30,14 @@ async def generate_sarvam_voice(
     voice_config: VoiceConfig,
     session: aiohttp.ClientSession,
 ):
-    resp = await session.post(
-        url="https://api.sarvam.ai/text-to-speech",
+    async with session.post(
+        url=SARVAM_TTS_ENDPOINT,
         headers={
             "api-subscription-key": SARVAM_API_KEY or "",
             "content-type": "application/json",
         },
         json={
-            "model": "bulbul:v2",
+            "model": SARVAM_TTS_MODEL,
             "text": text,
             "target_language_code": language,
             "speaker": voice_config.speaker.lower(),
@@ -40,14 +45,13 @@ async def generate_sarvam_voice(
             "pace": voice_config.pace,
             "loudness": voice_config.loudness,
         },
-    )
-
-    if resp.status > 299:
-        print(await resp.text())
+    ) as resp:
+        if resp.status > 299:
+            print(await resp.text())
 
-    resp.raise_for_status()
+        resp.raise_for_status()
 
-    return await resp.json()
+        return await resp.json()
 
 
 def rotate_sarvam_api_keys():
@@ -0,0 +1,137 @@
+"""
+Versioned schema migrations, plain SQL files in `shared/migrations/` applied in
+order of their numeric prefix and recorded in `schema_migrations`.
+
+Run them once per deployment, before starting the workers:
+
+    python -m shared.migrate
+"""
+
+import asyncio
+import os
+import re
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from shared.database import engine
+
+MIGRATIONS_PATH = os.path.join(os.path.dirname(__file__), "migrations")
+
+# any constant shared by every process running the migrations
+MIGRATIONS_LOCK_ID = 4_207_311
+
+MIGRATION_FILE_PATTERN = re.compile(r"^(\d+)_[\w-]+\.sql$")
+
+
+def list_migrations() -> list[tuple[str, str]]:
+    """Return (version, path) of every migration file, in order."""
+
+    migrations = []
+    for name in os.listdir(MIGRATIONS_PATH):
+        match = MIGRATION_FILE_PATTERN.match(name)
+        if match:
+            migrations.append(
+                (
+                    int(match.group(1)),
+                    name.removesuffix(".sql"),
+                    os.path.join(MIGRATIONS_PATH, name),
+                )
+            )
+
+    return [(version, path) for _, version, path in sorted(migrations)]
+
+
+def split_statements(sql: str) -> list[str]:
+    # the driver prepares one statement at a time, migrations end every statement
+    # with a semicolon at the end of a line and never use one inside a statement
+    statements = []
+    for statement in re.split(r";\s*$", sql, flags=re.MULTILINE):
+        lines = [
+            line
+            for line in statement.splitlines()
+            if line.strip() and not line.strip().startswith("--")
+        ]
+        if lines:
+            statements.append("\n".join(lines))
+
+    return statements
+
+
+async def _applied_versions(conn: AsyncConnection) -> set[str]:
+    result = await conn.execute(text("SELECT version FROM schema_migrations"))
+    return {row[0] for row in result.all()}
+
+
+async def pending_migrations() -> list[str]:
+    """Versions not applied yet, read-only so that it is cheap to call on startup."""
+
+    async with engine.connect() as conn:
+        exists = await conn.scalar(text("SELECT to_regclass('schema_migrations')"))
+        applied = await _applied_versions(conn) if exists else set()
+
+    return [version for version, _ in list_migrations() if version not in applied]
+
+
+async def run_migrations() -> list[str]:
+    """Apply the pending migrations, each one in its own transaction."""
+
+    applied_now = []
+    async with engine.connect() as conn:
+        # several workers or deployments may start at once, only one migrates
+        await conn.execute(text(f"SELECT pg_advisory_lock({MIGRATIONS_LOCK_ID})"))
+        await conn.commit()
+
+        try:
+            await conn.execute(
+                text(
+                    "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                    "version VARCHAR PRIMARY KEY, "
+                    "applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now())"
+                )
+            )
+            await conn.commit()
+
+            applied = await _applied_versions(conn)
+            await conn.commit()
+
+            for version, path in list_migrations():
+                if version in applied:
+                    continue
+
+                with open(path, "r", encoding="utf-8") as fp:
+                    statements = split_statements(fp.read())
+
+                print(f"Applying migration {version}")
+                async with conn.begin():
+                    for statement in statements:
+                        await conn.exec_driver_sql(statement)
+
+                    await conn.execute(
+                        text(
+                            "INSERT INTO schema_migrations (version) VALUES (:version)"
+                        ),
+                        {"version": version},
+                    )
+
+                applied_now.append(version)
+        finally:
+            await conn.execute(text(f"SELECT pg_advisory_unlock({MIGRATIONS_LOCK_ID})"))
+            await conn.commit()
+
+    return applied_now
+
+
+async def main():
+    try:
+        applied = await run_migrations()
+        if applied:
+            print(f"Applied {len(applied)} migration(s)")
+        else:
+            print("Schema is up to date")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
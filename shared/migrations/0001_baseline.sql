@@ -0,0 +1,82 @@
+-- Schema as previously created by `Base.metadata.create_all`, existing databases
+-- are adopted as they are.
+
+CREATE TABLE IF NOT EXISTS users (
+    id UUID PRIMARY KEY,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    deleted_at TIMESTAMP WITHOUT TIME ZONE,
+    first_name VARCHAR,
+    last_name VARCHAR,
+    email VARCHAR,
+    password_hash VARCHAR,
+    source VARCHAR,
+    source_id VARCHAR,
+    role VARCHAR NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email);
+
+CREATE INDEX IF NOT EXISTS ix_users_source_id ON users (source_id);
+
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id UUID PRIMARY KEY,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    deleted_at TIMESTAMP WITHOUT TIME ZONE,
+    user_id UUID REFERENCES users (id),
+    display_name VARCHAR,
+    expires_at TIMESTAMP WITHOUT TIME ZONE,
+    credits FLOAT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS stories (
+    id UUID PRIMARY KEY,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    deleted_at TIMESTAMP WITHOUT TIME ZONE,
+    creator_id UUID REFERENCES users (id),
+    user_input VARCHAR,
+    language VARCHAR NOT NULL,
+    title VARCHAR NOT NULL,
+    description VARCHAR NOT NULL,
+    audio_src VARCHAR NOT NULL,
+    image_src VARCHAR NOT NULL,
+    status VARCHAR NOT NULL,
+    visibility VARCHAR NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS storylines (
+    id UUID PRIMARY KEY,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    deleted_at TIMESTAMP WITHOUT TIME ZONE,
+    creator_id UUID REFERENCES users (id),
+    story_id UUID REFERENCES stories (id),
+    plot_outline VARCHAR NOT NULL,
+    characters JSON NOT NULL,
+    theme VARCHAR,
+    mood VARCHAR,
+    tone VARCHAR,
+    setting VARCHAR,
+    conflict VARCHAR,
+    resolution VARCHAR,
+    moral VARCHAR,
+    style VARCHAR,
+    character_personas JSON
+);
+
+CREATE TABLE IF NOT EXISTS scripts (
+    id UUID PRIMARY KEY,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    deleted_at TIMESTAMP WITHOUT TIME ZONE,
+    creator_id UUID REFERENCES users (id),
+    story_id UUID REFERENCES stories (id),
+    dialogues JSON
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id UUID PRIMARY KEY,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    deleted_at TIMESTAMP WITHOUT TIME ZONE,
+    user_id UUID REFERENCES users (id),
+    amount FLOAT NOT NULL,
+    remarks VARCHAR NOT NULL,
+    transaction_ref VARCHAR
+);
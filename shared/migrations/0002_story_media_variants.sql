@@ -0,0 +1,5 @@
+-- Compressed audio renditions and resized poster variants of a story
+
+ALTER TABLE stories ADD COLUMN IF NOT EXISTS audio_renditions JSON;
+
+ALTER TABLE stories ADD COLUMN IF NOT EXISTS image_variants JSON;
@@ -0,0 +1,35 @@
+-- Indexes matched to the queries of the routers, replacing the per-table `id`
+-- indexes which only duplicated the primary keys.
+
+DROP INDEX IF EXISTS ix_users_id;
+DROP INDEX IF EXISTS ix_subscriptions_id;
+DROP INDEX IF EXISTS ix_stories_id;
+DROP INDEX IF EXISTS ix_storylines_id;
+DROP INDEX IF EXISTS ix_scripts_id;
+DROP INDEX IF EXISTS ix_transactions_id;
+
+-- storyline of a story, always checked against its creator
+CREATE INDEX IF NOT EXISTS ix_storylines_story_id_creator_id
+    ON storylines (story_id, creator_id);
+
+-- latest script of a story
+CREATE INDEX IF NOT EXISTS ix_scripts_story_id_created_at
+    ON scripts (story_id, created_at DESC);
+
+-- credits of a user
+CREATE INDEX IF NOT EXISTS ix_subscriptions_user_id
+    ON subscriptions (user_id);
+
+-- transactions of a user, newest first (offset and keyset pages)
+CREATE INDEX IF NOT EXISTS ix_transactions_user_id_created_at_id
+    ON transactions (user_id, created_at DESC, id DESC);
+
+-- public library, newest first
+CREATE INDEX IF NOT EXISTS ix_stories_public_created_at_id
+    ON stories (created_at DESC, id DESC)
+    WHERE visibility = 'public' AND deleted_at IS NULL;
+
+-- stories of a creator, oldest first
+CREATE INDEX IF NOT EXISTS ix_stories_creator_id_created_at_id
+    ON stories (creator_id, created_at, id)
+    WHERE deleted_at IS NULL;
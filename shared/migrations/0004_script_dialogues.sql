@@ -0,0 +1,42 @@
+-- One row per line of a script, so that a line can be edited (and its voice
+-- checked for staleness) without rewriting the whole `scripts.dialogues` document
+
+CREATE TABLE IF NOT EXISTS script_dialogues (
+    id UUID PRIMARY KEY,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    deleted_at TIMESTAMP WITHOUT TIME ZONE,
+    script_id UUID NOT NULL REFERENCES scripts (id),
+    line_index INTEGER NOT NULL,
+    speaker VARCHAR NOT NULL,
+    text VARCHAR NOT NULL,
+    voice_config JSON,
+    segment_key VARCHAR,
+    segment_duration_ms INTEGER,
+    CONSTRAINT script_dialogues_script_id_line_index_key UNIQUE (script_id, line_index)
+);
+
+-- existing scripts, lines which are not objects are left out (the voice stage
+-- could never read them either)
+INSERT INTO script_dialogues (
+    id, created_at, script_id, line_index, speaker, text, voice_config
+)
+SELECT
+    gen_random_uuid(),
+    scripts.created_at,
+    scripts.id,
+    line.position - 1,
+    COALESCE(line.value ->> 'speaker', ''),
+    COALESCE(line.value ->> 'text', ''),
+    CASE
+        WHEN json_typeof(line.value -> 'voice_config') = 'object'
+        THEN line.value -> 'voice_config'
+    END
+FROM scripts
+CROSS JOIN LATERAL json_array_elements(
+    CASE
+        WHEN json_typeof(scripts.dialogues) = 'array' THEN scripts.dialogues
+        ELSE '[]'::json
+    END
+) WITH ORDINALITY AS line (value, position)
+WHERE json_typeof(line.value) = 'object'
+ON CONFLICT (script_id, line_index) DO NOTHING;
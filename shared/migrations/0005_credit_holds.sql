@@ -0,0 +1,18 @@
+-- Credits held by a reservation until it is settled or released, so that a hold
+-- whose process died can be found and given back
+
+CREATE TABLE IF NOT EXISTS credit_holds (
+    id UUID PRIMARY KEY,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    deleted_at TIMESTAMP WITHOUT TIME ZONE,
+    user_id UUID NOT NULL REFERENCES users (id),
+    amount FLOAT NOT NULL,
+    status VARCHAR NOT NULL,
+    expires_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    closed_at TIMESTAMP WITHOUT TIME ZONE
+);
+
+-- expired holds, for the sweep
+CREATE INDEX IF NOT EXISTS ix_credit_holds_pending_expires_at
+    ON credit_holds (expires_at)
+    WHERE status = 'pending';
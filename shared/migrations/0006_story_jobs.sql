@@ -0,0 +1,30 @@
+-- State of the background generation jobs, so that any worker can report it and
+-- the jobs of a worker which died can be failed
+
+CREATE TABLE IF NOT EXISTS story_jobs (
+    id UUID PRIMARY KEY,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    deleted_at TIMESTAMP WITHOUT TIME ZONE,
+    story_id UUID NOT NULL REFERENCES stories (id),
+    user_id UUID NOT NULL REFERENCES users (id),
+    kind VARCHAR NOT NULL,
+    status VARCHAR NOT NULL,
+    stage VARCHAR NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    result JSON,
+    error VARCHAR,
+    previous_story_status VARCHAR,
+    hold_id UUID REFERENCES credit_holds (id),
+    heartbeat_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    finished_at TIMESTAMP WITHOUT TIME ZONE
+);
+
+-- jobs of a story, newest first
+CREATE INDEX IF NOT EXISTS ix_story_jobs_story_id_created_at
+    ON story_jobs (story_id, created_at DESC);
+
+-- active jobs whose worker stopped, for the sweep
+CREATE INDEX IF NOT EXISTS ix_story_jobs_active_heartbeat_at
+    ON story_jobs (heartbeat_at)
+    WHERE status IN ('queued', 'running');
@@ -1,6 +1,6 @@
 from shared.models.user import Base, User, Subscription
-from shared.models.story import Script, Story, Storyline
-from shared.models.transaction import Transaction
+from shared.models.story import Script, ScriptDialogue, Story, StoryJob, Storyline
+from shared.models.transaction import CreditHold, Transaction
 
 # export the model from here
 __all__ = [
@@ -9,6 +9,9 @@ __all__ = [
     "Subscription",
     "Story",
     "Script",
+    "ScriptDialogue",
     "Storyline",
+    "StoryJob",
     "Transaction",
+    "CreditHold",
 ]
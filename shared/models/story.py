@@ -1,5 +1,15 @@
+from datetime import datetime
 from typing import Any, Dict, List
-from sqlalchemy import UUID, Column, ForeignKey, String, JSON
+from sqlalchemy import (
+    UUID,
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    String,
+    JSON,
+    UniqueConstraint,
+)
 from sqlalchemy.orm import Mapped, mapped_column
 from shared.database import Base
 
@@ -14,7 +24,11 @@ class Story(Base):
     title: Mapped[str] = mapped_column(String)
     description: Mapped[str] = mapped_column(String)
     audio_src: Mapped[str] = mapped_column(String)
+    # compressed encodings of the audio, {"<format>": {"bitrate": ..., "src": ...}}
+    audio_renditions: Mapped[Dict[str, Any]] = mapped_column(JSON, nullable=True)
     image_src: Mapped[str] = mapped_column(String)
+    # resized encodings of the poster, {"<size>": {"width", "height", "<format>": src}}
+    image_variants: Mapped[Dict[str, Any]] = mapped_column(JSON, nullable=True)
 
     # NOTE: This will be an enum on application layer for now
     status: Mapped[str] = mapped_column(String)
@@ -47,3 +61,56 @@ class Script(Base):
     story_id = Column(UUID(as_uuid=True), ForeignKey("stories.id"))
 
     dialogues: Mapped[List[Dict[str, Any]]] = mapped_column(JSON, nullable=True)
+
+
+class ScriptDialogue(Base):
+    """
+    One line of a script. The rows are what is read and edited once the script is
+    stored, `Script.dialogues` only keeps the script as it was generated.
+    """
+
+    __tablename__ = "script_dialogues"
+    __table_args__ = (UniqueConstraint("script_id", "line_index"),)
+
+    script_id = Column(UUID(as_uuid=True), ForeignKey("scripts.id"), nullable=False)
+    # position of the line in the script
+    line_index: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    speaker: Mapped[str] = mapped_column(String, nullable=False)
+    text: Mapped[str] = mapped_column(String, nullable=False)
+    voice_config: Mapped[Dict[str, Any]] = mapped_column(JSON, nullable=True)
+
+    # TTS segment the line was last voiced in (its key in the TTS segment cache)
+    # and the duration of that segment, consecutive lines with the same voice share
+    # a segment
+    segment_key: Mapped[str] = mapped_column(String, nullable=True)
+    segment_duration_ms: Mapped[int] = mapped_column(Integer, nullable=True)
+
+
+class StoryJob(Base):
+    """
+    State of a background generation job, shared by every worker. The worker
+    running it keeps `heartbeat_at` fresh, see `modules/jobs/service.py`.
+    """
+
+    __tablename__ = "story_jobs"
+
+    story_id = Column(UUID(as_uuid=True), ForeignKey("stories.id"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    kind: Mapped[str] = mapped_column(String, nullable=False)
+
+    # queued -> running -> completed | failed
+    status: Mapped[str] = mapped_column(String, nullable=False)
+    stage: Mapped[str] = mapped_column(String, nullable=False)
+    done: Mapped[int] = mapped_column(Integer, default=0)
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    result: Mapped[Dict[str, Any]] = mapped_column(JSON, nullable=True)
+    error: Mapped[str] = mapped_column(String, nullable=True)
+
+    # restored when the job fails
+    previous_story_status: Mapped[str] = mapped_column(String, nullable=True)
+    # credits held for the job, released when it fails
+    hold_id = Column(UUID(as_uuid=True), ForeignKey("credit_holds.id"), nullable=True)
+
+    heartbeat_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, UUID, Float, ForeignKey, String
+from datetime import datetime
+from sqlalchemy import Column, UUID, DateTime, Float, ForeignKey, String
 from sqlalchemy.orm import Mapped, mapped_column
 from shared.database import Base
 
@@ -10,3 +11,22 @@ class Transaction(Base):
     amount = Column(Float, nullable=False)
     remarks = Column(String, nullable=False)
     transaction_ref: Mapped[String] = mapped_column(String, nullable=True)
+
+
+class CreditHold(Base):
+    """
+    Credits taken off a subscription while the work paying for them runs, the id is
+    the one of the `CreditReservation`. The balance is the sum of the transactions
+    minus the pending holds.
+    """
+
+    __tablename__ = "credit_holds"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    # positive number of credits held
+    amount = Column(Float, nullable=False)
+    # pending -> settled | released
+    status: Mapped[str] = mapped_column(String, default="pending")
+    # a hold still pending by then is released by `release_expired_holds`
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    closed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
@@ -1,5 +1,14 @@
-from fastapi import Request
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, TypeVar
+from uuid import UUID
+
+from fastapi import HTTPException, Request, status
 from pydantic import BaseModel
+from sqlalchemy import Select, tuple_
+
+T = TypeVar("T")
 
 
 class Pagination(BaseModel):
@@ -7,10 +16,20 @@ class Pagination(BaseModel):
     limit: int = 10
     user_query: str | None = None
 
+    # keyset mode, set (even empty for the first page) to page with `next_cursor`
+    # instead of `page`
+    cursor: str | None = None
+    # the total count is a query of its own, it is skipped unless asked for
+    with_count: bool = True
+
     @property
     def offset(self):
         return max((self.page - 1) * self.limit, 0)
 
+    @property
+    def keyset(self) -> bool:
+        return self.cursor is not None
+
 
 async def get_pagination(request: Request):
     page_str = request.query_params.get("page", "1")
@@ -21,4 +40,80 @@ async def get_pagination(request: Request):
 
     user_query = request.query_params.get("q", None)
 
-    return Pagination(page=page, limit=limit, user_query=user_query)
+    cursor = request.query_params.get("cursor", None)
+    # offset pages keep returning the total pages by default, cursors do not need it
+    default_count = "false" if cursor is not None else "true"
+    with_count = request.query_params.get("count", default_count).lower() == "true"
+
+    return Pagination(
+        page=page,
+        limit=limit,
+        user_query=user_query,
+        cursor=cursor,
+        with_count=with_count,
+    )
+
+
+def encode_cursor(created_at: datetime, row_id: UUID) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id.hex])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), UUID(hex=row_id)
+    except Exception:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "invalid pagination cursor")
+
+
+def paginate_query(
+    query: Select,
+    pagination: Pagination,
+    created_at_column: Any,
+    id_column: Any,
+    descending: bool = True,
+) -> Select:
+    """
+    Order the query on (created_at, id) and select the requested page.
+
+    In keyset mode the page starts right after the cursor, so that every page costs
+    the same as the first one on a (created_at, id) index, and one extra row is
+    fetched to know whether there is a next page (see `split_page`).
+    """
+
+    if descending:
+        query = query.order_by(created_at_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(created_at_column, id_column)
+
+    if not pagination.keyset:
+        return query.offset(pagination.offset).limit(pagination.limit)
+
+    if pagination.cursor:
+        after = tuple_(created_at_column, id_column)
+        position = decode_cursor(pagination.cursor)
+        query = query.where(after < position if descending else after > position)
+
+    return query.limit(pagination.limit + 1)
+
+
+def split_page(
+    rows: list[T],
+    pagination: Pagination,
+    key: Callable[[T], Any] = lambda row: row,
+) -> tuple[list[T], str | None]:
+    """
+    Trim the extra row fetched by `paginate_query` in keyset mode and return the
+    page along with the cursor of the next one (None on the last page).
+    `key` returns the model holding created_at and id for a row.
+    """
+
+    if not pagination.keyset or len(rows) <= pagination.limit:
+        return rows, None
+
+    rows = rows[: pagination.limit]
+    last = key(rows[-1])
+
+    return rows, encode_cursor(last.created_at, last.id)
@@ -0,0 +1,217 @@
+"""
+In-memory query metrics: a latency histogram per statement fingerprint, with only
+the slow queries and a sample of the others logged (parameters truncated).
+"""
+
+import bisect
+import logging
+import os
+import random
+import re
+import sys
+import time
+from functools import lru_cache
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# every statement slower than this is logged
+QUERY_SLOW_MS = float(os.getenv("QUERY_SLOW_MS", "500"))
+# share of the other statements logged, 0 to disable
+QUERY_LOG_SAMPLE_RATE = float(os.getenv("QUERY_LOG_SAMPLE_RATE", "0.01"))
+# longest repr of a single parameter in the logs, script payloads are huge
+QUERY_LOG_PARAM_CHARS = int(os.getenv("QUERY_LOG_PARAM_CHARS", "64"))
+# distinct fingerprints tracked, the rest are counted under OTHER_FINGERPRINT
+QUERY_METRICS_MAX_FINGERPRINTS = int(
+    os.getenv("QUERY_METRICS_MAX_FINGERPRINTS", "500")
+)
+
+# upper bounds of the histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+OTHER_FINGERPRINT = "<other>"
+
+query_logger = logging.getLogger("sqlalchemy.engine").getChild("Timing")
+query_logger.addHandler(logging.StreamHandler(sys.stdout))
+query_logger.setLevel(logging.INFO)
+query_logger.propagate = False
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    """
+    Normalize a statement so that the same query with other values (or another
+    number of values in an IN list) has the same fingerprint.
+    """
+
+    normalized = re.sub(r"'(?:[^']|'')*'", "?", statement)
+    normalized = re.sub(r"\b\d+(?:\.\d+)?\b", "?", normalized)
+    # asyncpg placeholders ($1) and expanded IN lists
+    normalized = re.sub(r"\$\?", "?", normalized)
+    normalized = re.sub(r"\?(::\w+)?(?:\s*,\s*\?(?:::\w+)?)+", r"?\1", normalized)
+    return " ".join(normalized.split())
+
+
+def truncate_parameters(parameters, max_chars: int = QUERY_LOG_PARAM_CHARS) -> str:
+    def short(value) -> str:
+        text = repr(value)
+        if len(text) <= max_chars:
+            return text
+        return f"{text[:max_chars]}...<{len(text)} chars>"
+
+    if isinstance(parameters, dict):
+        items = (f"{key!r}: {short(value)}" for key, value in parameters.items())
+        return "{" + ", ".join(items) + "}"
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            # executemany, the first row is enough to debug
+            rows = len(parameters)
+            return f"{truncate_parameters(parameters[0], max_chars)} (+{rows - 1} rows)"
+        return "(" + ", ".join(short(v) for v in parameters) + ")"
+
+    return short(parameters)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, duration_ms: float, failed: bool = False):
+        self.count += 1
+        self.errors += int(failed)
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+
+    def percentile(self, pct: float) -> float:
+        """Upper bound of the bucket holding the percentile (max for the last one)."""
+
+        if not self.count:
+            return 0.0
+
+        rank = pct / 100 * self.count
+        seen = 0
+        for idx, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                if idx < len(LATENCY_BUCKETS_MS):
+                    return round(min(float(LATENCY_BUCKETS_MS[idx]), self.max_ms), 2)
+                break
+
+        return round(self.max_ms, 2)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": round(self.total_ms, 2),
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_ms, 2),
+            "buckets": {
+                f"le_{bound}": count
+                for bound, count in zip(LATENCY_BUCKETS_MS + ("inf",), self.buckets)
+            },
+        }
+
+
+class QueryMetrics:
+    """
+    Aggregates of every executed statement, per fingerprint. Recording is a dict
+    lookup and a few additions, cheap enough to stay on for every query.
+    """
+
+    def __init__(self, max_fingerprints: int = QUERY_METRICS_MAX_FINGERPRINTS):
+        self.max_fingerprints = max_fingerprints
+        self.since = time.time()
+        self._stats: dict[str, QueryStats] = {}
+
+    def record(self, statement: str, duration_ms: float, failed: bool = False):
+        key = fingerprint(statement)
+        stats = self._stats.get(key)
+        if stats is None:
+            if len(self._stats) >= self.max_fingerprints:
+                key = OTHER_FINGERPRINT
+            stats = self._stats.setdefault(key, QueryStats())
+
+        stats.record(duration_ms, failed)
+
+    def snapshot(self, limit: int = 50) -> dict:
+        """The `limit` fingerprints with the most total time, slowest first."""
+
+        ordered = sorted(
+            self._stats.items(),
+            key=lambda item: item[1].total_ms,
+            reverse=True,
+        )
+        return {
+            "since": self.since,
+            "fingerprints": len(self._stats),
+            "queries": [
+                {"statement": statement, **stats.to_dict()}
+                for statement, stats in ordered[:limit]
+            ],
+        }
+
+    def reset(self):
+        self.since = time.time()
+        self._stats.clear()
+
+
+query_metrics = QueryMetrics()
+
+
+def _log_query(statement: str, parameters, duration_ms: float, failed: bool):
+    slow = duration_ms >= QUERY_SLOW_MS
+    if not (slow or failed or random.random() < QUERY_LOG_SAMPLE_RATE):
+        return
+
+    query_logger.log(
+        logging.WARNING if slow or failed else logging.INFO,
+        "%s query in %.2f ms. Statement: %s. Parameters: %s",
+        "Failed" if failed else ("Slow" if slow else "Sampled"),
+        duration_ms,
+        " ".join(statement.split()),
+        truncate_parameters(parameters),
+    )
+
+
+def install_query_metrics(engine: Engine):
+    """Time every statement run on the (sync) engine and record it."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        # a stack, in case of nested cursor executions
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        started = conn.info["query_start_time"].pop()
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        query_metrics.record(statement, duration_ms)
+        _log_query(statement, parameters, duration_ms, failed=False)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is None or not conn.info.get("query_start_time"):
+            return
+
+        # after_cursor_execute is skipped for failed statements
+        started = conn.info["query_start_time"].pop()
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        statement = exception_context.statement or ""
+        query_metrics.record(statement, duration_ms, failed=True)
+        _log_query(statement, exception_context.parameters, duration_ms, failed=True)
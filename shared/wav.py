@@ -0,0 +1,257 @@
+import struct
+from dataclasses import dataclass
+
+# Data size advertised in the header of a WAV stream whose final length is unknown.
+# Most players treat it as "read until EOF".
+STREAMING_DATA_SIZE = 0xFFFFFFFF - 36
+
+WAV_HEADER_SIZE = 44
+
+
+class WavFormatError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class WavFormat:
+    audio_format: int
+    channels: int
+    sample_rate: int
+    bits_per_sample: int
+
+    @property
+    def block_align(self) -> int:
+        return self.channels * self.bits_per_sample // 8
+
+    @property
+    def byte_rate(self) -> int:
+        return self.sample_rate * self.block_align
+
+
+def parse_wav(data: bytes) -> tuple[WavFormat, memoryview]:
+    """
+    Parse a RIFF/WAVE buffer and return its format along with a view on the raw
+    sample data. Unknown chunks (LIST, fact, ...) are skipped.
+
+    Raises:
+        WavFormatError: For anything malformed or truncated, never a struct.error.
+    """
+
+    if len(data) < 12 or data[0:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise WavFormatError("not a RIFF/WAVE buffer")
+
+    buffer = memoryview(data)
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = bytes(buffer[offset : offset + 4])
+        (chunk_size,) = struct.unpack_from("<I", buffer, offset + 4)
+        body_start = offset + 8
+
+        if chunk_id == b"fmt ":
+            if chunk_size < 16 or body_start + 16 > len(data):
+                raise WavFormatError("truncated 'fmt ' chunk")
+
+            audio_format, channels, sample_rate, _, _, bits_per_sample = (
+                struct.unpack_from("<HHIIHH", buffer, body_start)
+            )
+            fmt = WavFormat(audio_format, channels, sample_rate, bits_per_sample)
+            if not fmt.block_align or not sample_rate:
+                raise WavFormatError(f"unsupported format {fmt}")
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise WavFormatError("'data' chunk found before 'fmt ' chunk")
+
+            # streamed files may carry a placeholder size, clamp it to what we have,
+            # and to whole frames so that a truncated segment can not shift the
+            # samples of the next ones
+            body_end = min(body_start + chunk_size, len(data))
+            body_end -= (body_end - body_start) % fmt.block_align
+            return fmt, buffer[body_start:body_end]
+
+        # chunks are word aligned
+        offset = body_start + chunk_size + (chunk_size & 1)
+
+    raise WavFormatError("no 'data' chunk found")
+
+
+def build_wav_header(fmt: WavFormat, data_size: int) -> bytes:
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        min(36 + data_size, 0xFFFFFFFF),
+        b"WAVE",
+        b"fmt ",
+        16,
+        fmt.audio_format,
+        fmt.channels,
+        fmt.sample_rate,
+        fmt.byte_rate,
+        fmt.block_align,
+        fmt.bits_per_sample,
+        b"data",
+        min(data_size, 0xFFFFFFFF),
+    )
+
+
+def wav_duration_ms(data: bytes) -> int | None:
+    """Duration of a WAV buffer, None when it can not be parsed."""
+
+    try:
+        fmt, pcm = parse_wav(data)
+    except WavFormatError:
+        return None
+
+    return round(len(pcm) * 1000 / fmt.byte_rate)
+
+
+def silence_pcm(fmt: WavFormat, duration_ms: int) -> bytes:
+    frames = fmt.sample_rate * duration_ms // 1000
+    # unsigned 8-bit PCM is centered around 128, everything else around 0
+    fill = b"\x80" if fmt.bits_per_sample == 8 else b"\x00"
+    return fill * (frames * fmt.block_align)
+
+
+def assemble_wav(segments: list[bytes], gap_ms: int = 0) -> bytearray:
+    """
+    Concatenate WAV buffers sharing the same format into a single WAV, with
+    `gap_ms` of silence after every segment.
+
+    The output is allocated once with its final size and carries a single header.
+
+    Raises:
+        WavFormatError: If a buffer can not be parsed or the formats differ.
+    """
+
+    if not segments:
+        raise ValueError("no segments to assemble")
+
+    parsed = [parse_wav(segment) for segment in segments]
+
+    fmt = parsed[0][0]
+    for idx, (segment_format, _) in enumerate(parsed):
+        if segment_format != fmt:
+            raise WavFormatError(
+                f"segment {idx} has format {segment_format}, expected {fmt}"
+            )
+
+    silence = silence_pcm(fmt, gap_ms)
+    data_size = sum(len(pcm) for _, pcm in parsed) + len(silence) * len(parsed)
+
+    output = bytearray(WAV_HEADER_SIZE + data_size)
+    output[:WAV_HEADER_SIZE] = build_wav_header(fmt, data_size)
+
+    offset = WAV_HEADER_SIZE
+    for _, pcm in parsed:
+        output[offset : offset + len(pcm)] = pcm
+        offset += len(pcm)
+        output[offset : offset + len(silence)] = silence
+        offset += len(silence)
+
+    return output
+
+
+# a pause is a run of windows quieter than this share of the loudest window
+PAUSE_THRESHOLD_RATIO = 0.03
+PAUSE_WINDOW_MS = 10
+# shorter runs are the gaps between words
+PAUSE_MIN_MS = 60
+
+
+def find_pauses(fmt: WavFormat, pcm: memoryview) -> list[tuple[int, int]]:
+    """
+    Pauses inside 16-bit PCM data, as (start, end) byte offsets aligned on frames.
+    The silence before the first and after the last sound is left out.
+    """
+
+    samples = pcm.cast("h")
+    window = max(1, fmt.sample_rate * PAUSE_WINDOW_MS // 1000) * fmt.channels
+    peaks = []
+    for start in range(0, len(samples), window):
+        chunk = samples[start : start + window]
+        peaks.append(max(-min(chunk), max(chunk)))
+    if not peaks:
+        return []
+
+    threshold = max(peaks) * PAUSE_THRESHOLD_RATIO
+    min_windows = PAUSE_MIN_MS // PAUSE_WINDOW_MS
+
+    pauses = []
+    run_start = None
+    sound_seen = False
+    for idx, peak in enumerate(peaks):
+        if peak <= threshold:
+            if run_start is None:
+                run_start = idx
+            continue
+
+        if run_start is not None and sound_seen and idx - run_start >= min_windows:
+            pauses.append((run_start * window * 2, idx * window * 2))
+        run_start = None
+        sound_seen = True
+
+    return pauses
+
+
+def insert_pauses(data: bytes, weights: list[int], gap_ms: int) -> bytes:
+    """
+    Widen the pauses between the parts of an utterance to at least `gap_ms`. The
+    utterance is made of consecutive parts (e.g. lines of text) of the given
+    `weights`, every boundary is looked for around its expected position: the
+    longest pause within a tenth of the duration around it, the boundary is left
+    as is when there is none.
+
+    Only 16-bit PCM is handled, anything else is returned unchanged.
+    """
+
+    if len(weights) < 2 or gap_ms <= 0:
+        return data
+
+    try:
+        fmt, pcm = parse_wav(data)
+    except WavFormatError:
+        return data
+    if fmt.audio_format != 1 or fmt.bits_per_sample != 16:
+        return data
+
+    pauses = find_pauses(fmt, pcm)
+    total_weight = sum(weights)
+    if not pauses or not total_weight:
+        return data
+
+    tolerance = len(pcm) // 10
+    cuts = []
+    weight_seen = 0
+    last_end = 0
+    for weight in weights[:-1]:
+        weight_seen += weight
+        expected = len(pcm) * weight_seen // total_weight
+        candidates = [
+            (start, end)
+            for start, end in pauses
+            if start >= last_end and abs((start + end) // 2 - expected) <= tolerance
+        ]
+        if not candidates:
+            continue
+
+        start, end = max(candidates, key=lambda pause: pause[1] - pause[0])
+        missing_ms = gap_ms - (end - start) * 1000 // fmt.byte_rate
+        if missing_ms > 0:
+            # in the middle of the pause, on a frame
+            middle = (start + end) // 2
+            cuts.append((middle - middle % fmt.block_align, missing_ms))
+        last_end = end
+
+    if not cuts:
+        return data
+
+    parts = []
+    offset = 0
+    for position, missing_ms in cuts:
+        parts.append(pcm[offset:position])
+        parts.append(silence_pcm(fmt, missing_ms))
+        offset = position
+    parts.append(pcm[offset:])
+
+    data_size = sum(len(part) for part in parts)
+    return build_wav_header(fmt, data_size) + b"".join(parts)
@@ -0,0 +1,279 @@
+"""
+Local stand-ins for the Gemini and Sarvam APIs, answering with the same request
+and response shapes used by `shared/llm/gemini.py`, `sarvam.py` and `sarvam_tts.py`.
+
+    python -m tests.mock_providers --port 8900 --llm-latency-ms 4000 --error-rate 0.02 --rate-limit-rate 0.05
+
+and point the app (or `tests/load_test.py`) at it:
+
+    GEMINI_BASE_URL=http://127.0.0.1:8900 SARVAM_BASE_URL=http://127.0.0.1:8900
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import re
+from dataclasses import dataclass
+
+from aiohttp import web
+
+from shared.wav import WavFormat, build_wav_header
+
+TTS_FORMAT = WavFormat(
+    audio_format=1,
+    channels=1,
+    sample_rate=22050,
+    bits_per_sample=16,
+)
+# roughly how long a character takes to speak
+TTS_MS_PER_CHAR = 60
+# tiny PNG, enough for the poster to be written
+POSTER_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+)
+
+
+@dataclass
+class Behaviour:
+    # lognormal latency, `latency_ms` is the median
+    latency_ms: float
+    latency_sigma: float
+    error_rate: float
+    rate_limit_rate: float
+    retry_after: float
+
+    def latency(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+
+        return random.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000
+
+    def fault(self) -> web.Response | None:
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            return web.json_response(
+                {"error": {"code": 429, "message": "rate limited by mock"}},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        if roll < self.rate_limit_rate + self.error_rate:
+            return web.json_response(
+                {"error": {"code": 503, "message": "unavailable in mock"}},
+                status=503,
+            )
+
+        return None
+
+
+def _characters(prompt: str) -> list[str]:
+    names = re.findall(r'"name":\s*"([^"]+)"', prompt)
+    return list(dict.fromkeys(names)) or ["Asha", "Ravi"]
+
+
+def _dialogues(prompt: str, count: int) -> list[dict]:
+    speakers = list(dict.fromkeys(["narrator"] + _characters(prompt)))
+    return [
+        {
+            "speaker": speakers[i % len(speakers)],
+            "text": f"Mock dialogue number {i + 1}, spoken with feeling. " * 2,
+            "voice_config": {"pace": "0.9", "loudness": "1"},
+        }
+        for i in range(count)
+    ]
+
+
+def completion_for(prompt: str, script_dialogues: int) -> str:
+    """Answer with whatever the agent behind the prompt expects to parse."""
+
+    if "Script planner" in prompt:
+        num_acts = int(re.search(r"story into (\d+)", prompt).group(1))
+        result = [
+            {
+                "title": f"Act {i + 1}",
+                "summary": f"What happens in act {i + 1}.",
+                "characters": ["narrator"],
+                "ending": "A cliffhanger.",
+                "dialogue_count": max(1, script_dialogues // num_acts),
+            }
+            for i in range(num_acts)
+        ]
+    elif "Script generator" in prompt:
+        count = script_dialogues
+        act_count = re.search(r"around (\d+) dialogues", prompt)
+        if "writing act" in prompt and act_count:
+            count = int(act_count.group(1))
+        result = _dialogues(prompt, count)
+    elif "persona generator" in prompt:
+        result = {
+            name.lower(): {
+                "name": name,
+                "age": "30",
+                "gender": "female" if i % 2 else "male",
+                "background": "Mock background.",
+                "personality_traits": "brave, curious",
+                "voice_config": {
+                    "speaker": "vidya" if i % 2 else "karun",
+                    "pitch": "0",
+                },
+            }
+            for i, name in enumerate(dict.fromkeys(["narrator"] + _characters(prompt)))
+        }
+    elif "story outline agent" in prompt:
+        result = {
+            "plot_outline": "A mock plot about a village and a lost lantern.",
+            "characters": [
+                {"name": "Asha", "description": "A curious girl."},
+                {"name": "Ravi", "description": "Her older brother."},
+            ],
+            "mood": "warm",
+            "tone": "hopeful",
+            "setting": "a village by the river",
+            "conflict": "the lantern is lost",
+            "resolution": "the lantern is found",
+            "style": "folk tale",
+        }
+    else:
+        result = {"title": "Mock title", "description": "Mock description."}
+
+    return "```json\n" + json.dumps(result, ensure_ascii=False, indent=2) + "\n```"
+
+
+def tts_wav(text: str) -> bytes:
+    num_frames = TTS_FORMAT.sample_rate * len(text) * TTS_MS_PER_CHAR // 1000
+    pcm = bytes(num_frames * TTS_FORMAT.block_align)
+    return build_wav_header(TTS_FORMAT, len(pcm)) + pcm
+
+
+def _prompt_of_gemini(body: dict) -> str:
+    return body["contents"][0]["parts"][0].get("text", "")
+
+
+def _gemini_chunk(text: str) -> dict:
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+def create_app(
+    llm: Behaviour,
+    tts: Behaviour,
+    script_dialogues: int,
+    stream_chunks: int,
+) -> web.Application:
+    stats = {"gemini": 0, "sarvam_chat": 0, "tts": 0, "faults": 0}
+
+    async def gemini(request: web.Request):
+        stats["gemini"] += 1
+        model, _, method = request.match_info["model_method"].partition(":")
+        body = await request.json()
+
+        await asyncio.sleep(llm.latency())
+        fault = llm.fault()
+        if fault is not None:
+            stats["faults"] += 1
+            return fault
+
+        if "image" in model:
+            image = base64.b64encode(POSTER_PNG).decode()
+            return web.json_response(
+                [
+                    {
+                        "candidates": [
+                            {"content": {"parts": [{"inlineData": {"data": image}}]}}
+                        ]
+                    }
+                ]
+            )
+
+        text = completion_for(_prompt_of_gemini(body), script_dialogues)
+        if method == "generateContent":
+            return web.json_response(_gemini_chunk(text))
+
+        # server-sent events, the text is spread over the chunks and the time
+        # a real completion would keep on generating
+        resp = web.StreamResponse(headers={"content-type": "text/event-stream"})
+        await resp.prepare(request)
+
+        chunk_size = max(1, len(text) // stream_chunks)
+        for start in range(0, len(text), chunk_size):
+            chunk = _gemini_chunk(text[start : start + chunk_size])
+            await resp.write(f"data: {json.dumps(chunk)}\r\n\r\n".encode())
+            await asyncio.sleep(llm.latency() / stream_chunks)
+
+        await resp.write_eof()
+        return resp
+
+    async def sarvam_chat(request: web.Request):
+        stats["sarvam_chat"] += 1
+        body = await request.json()
+
+        await asyncio.sleep(llm.latency())
+        fault = llm.fault()
+        if fault is not None:
+            stats["faults"] += 1
+            return fault
+
+        text = completion_for(body["messages"][-1]["content"], script_dialogues)
+        return web.json_response(
+            {"choices": [{"message": {"role": "assistant", "content": text}}]}
+        )
+
+    async def text_to_speech(request: web.Request):
+        stats["tts"] += 1
+        body = await request.json()
+
+        await asyncio.sleep(tts.latency())
+        fault = tts.fault()
+        if fault is not None:
+            stats["faults"] += 1
+            return fault
+
+        audio = base64.b64encode(tts_wav(body["text"])).decode()
+        return web.json_response({"request_id": "mock", "audios": [audio]})
+
+    async def get_stats(_: web.Request):
+        return web.json_response(stats)
+
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app.router.add_post("/v1beta/models/{model_method}", gemini)
+    app.router.add_post("/v1/chat/completions", sarvam_chat)
+    app.router.add_post("/text-to-speech", text_to_speech)
+    app.router.add_get("/stats", get_stats)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Gemini and Sarvam APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--llm-latency-ms", type=float, default=3000)
+    parser.add_argument("--tts-latency-ms", type=float, default=800)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--script-dialogues", type=int, default=40)
+    parser.add_argument("--stream-chunks", type=int, default=20)
+    args = parser.parse_args()
+
+    def behaviour(latency_ms: float) -> Behaviour:
+        return Behaviour(
+            latency_ms=latency_ms,
+            latency_sigma=args.latency_sigma,
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            retry_after=args.retry_after,
+        )
+
+    app = create_app(
+        behaviour(args.llm_latency_ms),
+        behaviour(args.tts_latency_ms),
+        args.script_dialogues,
+        args.stream_chunks,
+    )
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()